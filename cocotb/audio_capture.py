@@ -0,0 +1,121 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Streaming capture of the 1-bit AUDIO output to PCM and WAV.
+#
+# The AUDIO pin is the APU's sigma-delta modulated 4-bit PWM, at 1/16th of
+# the system clock. The testbench records it as (cycle, level) edges and hands
+# them over in chunks. Each chunk is expanded to one sample per clock,
+# decimated by a CIC filter, then lowpass filtered and decimated again by a
+# windowed-sinc FIR, and appended to a WAV file. Only the filter state and a
+# bounded tail of output (for the SNR measurement) are kept, so long captures
+# run in constant memory.
+
+import wave
+
+import numpy as np
+
+# Must match CLK_PERIOD in tb/tb.v
+CLK_HZ = 24_000_000
+
+# 24 MHz / 125 / 4 = 48 kSa/s, the nominal aout sample rate
+CIC_DECIMATE = 125
+CIC_ORDER    = 4
+FIR_DECIMATE = 4
+FIR_TAPS     = 127
+RATE         = CLK_HZ // (CIC_DECIMATE * FIR_DECIMATE)
+
+def fir_taps(n_taps, cutoff):
+    """Blackman-windowed sinc lowpass, with cutoff as a fraction of the input
+    sample rate, normalised to unity DC gain."""
+    n = np.arange(n_taps) - (n_taps - 1) / 2
+    h = np.sinc(2 * cutoff * n) * np.blackman(n_taps)
+    return h / h.sum()
+
+def tone_snr(samples, rate, freq, band=(20, 20000)):
+    """Return the SNR in dB of a tone at freq, against everything else within
+    band, from a Blackman-windowed FFT of samples."""
+    x = np.asarray(samples, dtype=np.float64)
+    x = x - x.mean()
+    power = np.abs(np.fft.rfft(x * np.blackman(len(x)))) ** 2
+    f = np.fft.rfftfreq(len(x), 1 / rate)
+    in_band = (f >= band[0]) & (f <= band[1])
+    # Blackman main lobe is +-3 bins
+    tone = in_band & (np.abs(f - freq) <= 3 * rate / len(x))
+    return 10 * np.log10(power[tone].sum() / power[in_band & ~tone].sum())
+
+class AudioCapture:
+    """Decimate a stream of edges on a 1-bit output to PCM in [-1, 1), and
+    write it to a 16-bit mono WAV file (if path is given). The most recent
+    tail_samples output samples are kept in self.tail."""
+
+    def __init__(self, path=None, tail_samples=48000, clk_hz=CLK_HZ):
+        self.rate = clk_hz // (CIC_DECIMATE * FIR_DECIMATE)
+        self.tail_samples = tail_samples
+        self.tail = np.zeros(0)
+        self.n_samples = 0
+        # Pin level and cycle count at the end of the last chunk
+        self.level = 0
+        self.t = 0
+        # Integer CIC state. Integrators are allowed to wrap: the combs undo
+        # it as long as the output fits in 64 bits, which it easily does.
+        self.integrators = np.zeros(CIC_ORDER, dtype=np.int64)
+        self.combs = np.zeros(CIC_ORDER, dtype=np.int64)
+        self.cic_phase = 0
+        # Pass up to 0.45 of the output rate, i.e. 21.6 kHz at 48 kSa/s
+        self.taps = fir_taps(FIR_TAPS, 0.45 / FIR_DECIMATE)
+        self.fir_history = np.zeros(FIR_TAPS - 1)
+        self.fir_phase = 0
+        self.wav = None
+        if path is not None:
+            self.wav = wave.open(str(path), "wb")
+            self.wav.setnchannels(1)
+            self.wav.setsampwidth(2)
+            self.wav.setframerate(self.rate)
+
+    def process_edges(self, times, levels):
+        """Consume edges: times are clock cycle numbers (increasing, and after
+        the previous chunk), levels are the pin level following each edge.
+        Return the new PCM samples."""
+        if not len(times):
+            return np.zeros(0)
+        times = np.asarray(times, dtype=np.int64)
+        levels = np.asarray(levels, dtype=np.int64)
+        durations = np.diff(times, prepend=self.t)
+        bits = np.repeat(np.concatenate(([self.level], levels[:-1])), durations)
+        self.t = times[-1]
+        self.level = levels[-1]
+        return self.process_bits(bits)
+
+    def process_bits(self, bits):
+        """Consume one sample per clock cycle, return the new PCM samples."""
+        x = np.asarray(bits, dtype=np.int64)
+        n_in = len(x)
+        with np.errstate(over="ignore"):
+            for i in range(CIC_ORDER):
+                x = np.cumsum(x) + self.integrators[i]
+                if len(x):
+                    self.integrators[i] = x[-1]
+            x = x[self.cic_phase::CIC_DECIMATE]
+            self.cic_phase = (self.cic_phase - n_in) % CIC_DECIMATE
+            for i in range(CIC_ORDER):
+                prev = self.combs[i]
+                if len(x):
+                    self.combs[i] = x[-1]
+                x = np.diff(x, prepend=prev)
+        y = 2 * x / CIC_DECIMATE ** CIC_ORDER - 1
+
+        buf = np.concatenate((self.fir_history, y))
+        self.fir_history = buf[len(buf) - (FIR_TAPS - 1):]
+        y = np.convolve(buf, self.taps, mode="valid")[self.fir_phase::FIR_DECIMATE]
+        self.fir_phase = (self.fir_phase - (len(buf) - (FIR_TAPS - 1))) % FIR_DECIMATE
+
+        self.n_samples += len(y)
+        self.tail = np.concatenate((self.tail, y))[-self.tail_samples:]
+        if self.wav is not None:
+            self.wav.writeframes((np.clip(y, -1, 1 - 2 ** -15) * 32768).astype("<i2").tobytes())
+        return y
+
+    def close(self):
+        if self.wav is not None:
+            self.wav.close()
+            self.wav = None
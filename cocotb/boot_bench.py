@@ -0,0 +1,120 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Bootrom flash-load benchmark.
+#
+# Boots a flash image through the taped-out boot ROM, and through variant
+# ROMs built from software/bootrom with the image size (BINARY_SIZE_BYTES)
+# and SPI clock divisor (SPI_CLKDIV) overridden. Each configuration gets its
+# own simulator build and process, and they all run in parallel.
+#
+# Reports time to first instruction (bootrom handoff to IRAM) and effective
+# flash bandwidth, and appends the results to a history file, flagging any
+# configuration which got slower in the same way as timing_history.py.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import timing_history
+from timing_history import CLK_PERIOD_NS
+
+DEFAULT_HISTORY = Path(__file__).resolve().parent / "boot_history.jsonl"
+
+bootrom_dir = Path(__file__).resolve().parent.parent / "software/bootrom"
+
+# The image must fit in IRAM along with nothing else, as the bootrom has no
+# stack; 4k is also the flash sector size it searches.
+SIZES   = [1024, 2048, 4096]
+CLKDIVS = [2, 4, 8]
+
+def run_config(sim, out_dir, name, size, clkdiv):
+    """Build a bootrom variant (or use the real ROM if clkdiv is None), build
+    a simulator with it, and boot from flash. Return {metric: value}, or None
+    if anything failed. Must be a top-level function for
+    ProcessPoolExecutor."""
+    from chip_top_tb import build_sim
+    job_dir = Path(out_dir) / name
+    job_dir.mkdir(parents=True, exist_ok=True)
+    rom = None
+    if clkdiv is not None:
+        rom = job_dir / "rom" / "ahb_rom_boot.v"
+        rc = subprocess.run(["make", "-C", bootrom_dir, "variant", f"BUILD={job_dir / 'rom'}",
+            f"DEFINES=-DBINARY_SIZE_BYTES={size} -DSPI_CLKDIV={clkdiv}"])
+        if rc.returncode != 0:
+            return None
+    runner = build_sim(job_dir / "sim_build", waves=False, rom=rom)
+    results_xml = runner.test(
+        hdl_toplevel="tb",
+        test_module="chip_top_tb",
+        build_dir=job_dir / "sim_build",
+        test_dir=job_dir,
+        results_xml=job_dir / "results.xml",
+        extra_env={"BENCH": "1", "BOOT_IMAGE_SIZE": str(size)},
+        test_filter="test_benchmark_boot",
+        waves=False,
+    )
+    tests = timing_history.parse_results(results_xml)
+    if not tests or any(t["status"] != "pass" for t in tests.values()):
+        return None
+    return timing_history.parse_metrics(results_xml)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Bootrom flash-load latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="image sizes in bytes")
+    parser.add_argument("--clkdivs", type=int, nargs="+", default=CLKDIVS, help="SPI clock divisors")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="parallel simulators")
+    parser.add_argument("--out", default="boot_build", help="output directory")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="history file")
+    parser.add_argument("--no-history", action="store_true", help="don't record this run")
+    parser.add_argument("--threshold", type=float, default=0.05,
+        help="fractional slowdown to flag (boot time is deterministic, so this can be tight)")
+    args = parser.parse_args()
+
+    from chip_top_tb import sim, gl, swtest_root
+    assert not gl, "Variant ROMs are only supported for RTL simulation"
+
+    out_dir = Path(args.out).resolve()
+    shutil.rmtree(out_dir, ignore_errors=True)
+    # Build the firmware up front so the parallel tests don't race on make
+    rc = subprocess.run(["make", "-C", swtest_root / "flash", "APP=hellow"])
+    assert rc.returncode == 0
+
+    configs = {"rom": (1024, None)}
+    for size in args.sizes:
+        for clkdiv in args.clkdivs:
+            configs[f"size{size}_div{clkdiv}"] = (size, clkdiv)
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {name: pool.submit(run_config, sim, str(out_dir), name, size, clkdiv)
+            for name, (size, clkdiv) in configs.items()}
+        results = {name: f.result() for name, f in futures.items()}
+
+    failed = [name for name, r in results.items() if r is None]
+    print(f"{'Config':<20} {'Size':>6} {'Div':>4} {'Boot cycles':>12} {'Boot (us)':>10} {'Load cycles':>12} {'MB/s':>6}")
+    metrics = {}
+    for name, r in results.items():
+        size, clkdiv = configs[name]
+        if r is None:
+            print(f"{name:<20} FAILED")
+            continue
+        mbyte_per_s = size / (r["flash_load_cycles"] * CLK_PERIOD_NS * 1e-3)
+        print(f"{name:<20} {size:>6} {clkdiv or 8:>4} {r['boot_cycles']:>12} "
+            f"{r['boot_cycles'] * CLK_PERIOD_NS * 1e-3:>10.1f} {r['flash_load_cycles']:>12} {mbyte_per_s:>6.2f}")
+        metrics[f"{name}.boot_cycles"] = r["boot_cycles"]
+        metrics[f"{name}.flash_load_cycles"] = r["flash_load_cycles"]
+
+    regressions = []
+    if not args.no_history:
+        timing_history.record_entry({}, metrics, args.history, sim=sim)
+        history = [e for e in timing_history.load(args.history) if e.get("sim") == sim]
+        regressions = timing_history.find_regressions(history, args.threshold, keys=())
+        for name, key, baseline, value, ratio in regressions:
+            print(f"REGRESSION: {name} {baseline:g} -> {value:g} ({ratio:.2f}x)")
+
+    sys.exit(1 if failed or regressions else 0)
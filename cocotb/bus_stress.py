@@ -0,0 +1,255 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Seeded bus-contention stress generator and parallel runner.
+#
+# Each seed produces a random mix of CPU loads/stores (all widths, across
+# ERAM, IRAM and APU RAM), optionally an APU program storing into APU RAM at
+# the same time, and optionally the PPU command processor spinning on ERAM
+# fetches. The traffic is executed by software/tests/eram/bus_stress.c, which
+# runs an op table loaded into ERAM by test_bus_stress in chip_top_tb.py.
+# The expected checksum of all CPU reads, and the expected final contents of
+# every touched word, come from a simple sequential model here.
+#
+# The simulator is built once, then seeds run in parallel, one simulator
+# process each. Failing seeds are minimised by delta debugging over the op
+# list.
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Must match bus_stress.c
+STRESS_TABLE_ADDR = 0x30000
+STRESS_FLAG_PPU   = 1 << 0
+STRESS_FLAG_APU   = 1 << 1
+STRESS_OP_READ    = 1 << 26
+
+ERAM_REGION = (0x20000, 0x400)
+IRAM_REGION = (0x40000, 0x400)
+APU_REGION  = (0x60400, 0x400)
+REGIONS = [ERAM_REGION, IRAM_REGION, APU_REGION]
+
+# APU program lives in the lower half of APU RAM, so this is the most it can
+# hold at 5 instructions per store plus the epilogue.
+MAX_APU_OPS = 48
+
+APU_IPC_SOFTIRQ_SET = 0x68004
+
+###############################################################################
+# Generator and model
+
+def generate(seed, n_cpu_ops=200, n_apu_ops=32):
+    """Return a stress description: {"seed", "ppu", "apu", "cpu_ops",
+    "apu_ops"}. Ops are [addr, size, is_read, data]. Words of the APU RAM
+    region are randomly owned by either the CPU or the APU, so both masters
+    hit the same banks without racing on the same bytes."""
+    rng = random.Random(seed)
+    apu_words = set(rng.sample(range(APU_REGION[0], sum(APU_REGION), 4), APU_REGION[1] // 8))
+    apu_ops = []
+    for i in range(min(n_apu_ops, MAX_APU_OPS)):
+        size = rng.choice([1, 2, 4])
+        addr = rng.choice(sorted(apu_words)) + rng.randrange(0, 4, size)
+        apu_ops.append([addr, size, False, rng.getrandbits(8 * size)])
+    cpu_ops = []
+    for i in range(n_cpu_ops):
+        base, length = rng.choice(REGIONS)
+        size = rng.choice([1, 2, 4])
+        while True:
+            addr = base + rng.randrange(0, length, size)
+            if (addr & ~0x3) not in apu_words:
+                break
+        is_read = rng.random() < 0.4
+        cpu_ops.append([addr, size, is_read, 0 if is_read else rng.getrandbits(8 * size)])
+    return {
+        "seed": seed,
+        "ppu": rng.random() < 0.75,
+        "apu": bool(apu_ops) and rng.random() < 0.75,
+        "cpu_ops": cpu_ops,
+        "apu_ops": apu_ops,
+    }
+
+def model(stress):
+    """Return (checksum, {word address: expected word}) for every word which
+    is written by some op."""
+    mem = {}
+    def read(addr, size):
+        return sum(mem.get(addr + i, 0) << (8 * i) for i in range(size))
+    def write(addr, size, data):
+        for i in range(size):
+            mem[addr + i] = (data >> (8 * i)) & 0xff
+    checksum = 0
+    written = set()
+    for addr, size, is_read, data in stress["cpu_ops"]:
+        if is_read:
+            checksum = (((checksum << 1) | (checksum >> 31)) & 0xffffffff) ^ read(addr, size)
+        else:
+            write(addr, size, data)
+            written.add(addr & ~0x3)
+    if stress["apu"]:
+        for addr, size, is_read, data in stress["apu_ops"]:
+            write(addr, size, data)
+            written.add(addr & ~0x3)
+    return checksum, {a: read(a, 4) for a in sorted(written)}
+
+def rv_hi(x):
+    return (x - rv_lo(x)) & 0xfffff000
+
+def rv_lo(x):
+    return ((x & 0xfff) ^ 0x800) - 0x800
+
+def rv_lui(rd, imm):
+    return (imm & 0xfffff000) | (rd << 7) | 0x37
+
+def rv_addi(rd, rs1, imm):
+    return ((imm & 0xfff) << 20) | (rs1 << 15) | (rd << 7) | 0x13
+
+def rv_store(size, rs2, rs1):
+    funct3 = {1: 0, 2: 1, 4: 2}[size]
+    return (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | 0x23
+
+def assemble_apu(apu_ops):
+    """Straight-line APU program: one store per op, then post a soft IRQ to
+    the CPU and sleep. APU addresses alias modulo 64k, so the CPU-side
+    addresses are used as-is."""
+    t0, t1 = 5, 6
+    prog = []
+    def li(rd, x):
+        prog.extend([rv_lui(rd, rv_hi(x)), rv_addi(rd, rd, rv_lo(x))])
+    for addr, size, _, data in apu_ops:
+        li(t0, addr)
+        li(t1, data)
+        prog.append(rv_store(size, t1, t0))
+    li(t0, APU_IPC_SOFTIRQ_SET)
+    prog.append(rv_addi(t1, 0, 1))
+    prog.append(rv_store(4, t1, t0))
+    prog.append(0x10500073) # wfi
+    prog.append(0xffdff06f) # j . - 4
+    return prog
+
+def table_words(stress):
+    apu_prog = assemble_apu(stress["apu_ops"]) if stress["apu"] else []
+    flags = (STRESS_FLAG_PPU if stress["ppu"] else 0) | (STRESS_FLAG_APU if stress["apu"] else 0)
+    table = [len(stress["cpu_ops"]), flags, len(apu_prog)] + apu_prog
+    for addr, size, is_read, data in stress["cpu_ops"]:
+        table.append(addr | ((size.bit_length() - 1) << 24) | (STRESS_OP_READ if is_read else 0))
+        table.append(data)
+    return table
+
+def write_job(stress, path):
+    """Write the JSON file consumed by test_bus_stress."""
+    checksum, expect = model(stress)
+    job = dict(stress)
+    job["table"] = table_words(stress)
+    job["checksum"] = checksum
+    job["expect"] = {f"{a:05x}": w for a, w in expect.items()}
+    with open(path, "w") as f:
+        json.dump(job, f)
+
+###############################################################################
+# Parallel runner
+
+def run_job(sim, build_dir, job_dir, stress):
+    """Run one stress description in its own simulator process. Return True
+    on pass. Must be a top-level function for ProcessPoolExecutor."""
+    from cocotb_tools.runner import get_runner
+    job_dir = Path(job_dir)
+    job_dir.mkdir(parents=True, exist_ok=True)
+    write_job(stress, job_dir / "stress.json")
+    results_xml = get_runner(sim).test(
+        hdl_toplevel="tb",
+        test_module="chip_top_tb",
+        build_dir=build_dir,
+        test_dir=job_dir,
+        results_xml=job_dir / "results.xml",
+        extra_env={"STRESS_JOB": str(job_dir / "stress.json")},
+        test_filter="test_bus_stress",
+        waves=False,
+    )
+    root = ET.parse(results_xml).getroot()
+    cases = list(root.iter("testcase"))
+    return bool(cases) and all(tc.find("failure") is None and tc.find("error") is None for tc in cases)
+
+def run_many(sim, build_dir, out_dir, jobs, workers):
+    """Run {name: stress} in parallel, return {name: passed}."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {name: pool.submit(run_job, sim, build_dir, str(Path(out_dir) / name), stress)
+            for name, stress in jobs.items()}
+        return {name: f.result() for name, f in futures.items()}
+
+def minimise(sim, build_dir, out_dir, stress, workers):
+    """Delta-debug the op lists of a failing stress description down to a
+    1-minimal failing subset. All complements at each granularity are tried
+    in parallel."""
+    ops = [("cpu", op) for op in stress["cpu_ops"]] + [("apu", op) for op in stress["apu_ops"]]
+    def build(subset):
+        s = dict(stress)
+        s["cpu_ops"] = [op for kind, op in subset if kind == "cpu"]
+        s["apu_ops"] = [op for kind, op in subset if kind == "apu"]
+        s["apu"] = stress["apu"] and bool(s["apu_ops"])
+        return s
+    n = 2
+    step = 0
+    while len(ops) >= 2:
+        chunk = (len(ops) + n - 1) // n
+        complements = [ops[:i] + ops[i + chunk:] for i in range(0, len(ops), chunk)]
+        names = {f"min{step}_{i}": build(c) for i, c in enumerate(complements)}
+        step += 1
+        results = run_many(sim, build_dir, out_dir, names, workers)
+        failing = [i for i, name in enumerate(names) if not results[name]]
+        if failing:
+            ops = complements[failing[0]]
+            n = max(n - 1, 2)
+            print(f"Minimising: {len(ops)} ops")
+        elif n >= len(ops):
+            break
+        else:
+            n = min(2 * n, len(ops))
+    return build(ops)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Parallel seeded bus contention stress")
+    parser.add_argument("--seeds", type=int, default=100, help="number of seeds to run")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--cpu-ops", type=int, default=200, help="CPU ops per seed")
+    parser.add_argument("--apu-ops", type=int, default=32, help=f"APU ops per seed (max {MAX_APU_OPS})")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="parallel simulators")
+    parser.add_argument("--out", default="stress_build", help="output directory")
+    parser.add_argument("--no-minimise", action="store_true", help="don't minimise failing seeds")
+    args = parser.parse_args()
+
+    from chip_top_tb import sim, build_sim, swtest_root
+
+    out_dir = Path(args.out).resolve()
+    shutil.rmtree(out_dir, ignore_errors=True)
+    build_dir = out_dir / "sim_build"
+    build_sim(build_dir, waves=False)
+    # Build the firmware up front so the parallel tests don't race on make
+    rc = subprocess.run(["make", "-C", swtest_root / "eram", "APP=bus_stress"])
+    assert rc.returncode == 0
+
+    jobs = {f"seed{seed}": generate(seed, args.cpu_ops, args.apu_ops)
+        for seed in range(args.first_seed, args.first_seed + args.seeds)}
+    results = run_many(sim, build_dir, out_dir, jobs, args.jobs)
+    failed = [name for name, passed in results.items() if not passed]
+    print(f"{len(results) - len(failed)}/{len(results)} seeds passed")
+
+    for name in failed:
+        print(f"FAIL: {name}")
+        if args.no_minimise:
+            continue
+        minimal = minimise(sim, build_dir, out_dir / f"{name}_min", jobs[name], args.jobs)
+        min_path = out_dir / f"{name}_minimal.json"
+        write_job(minimal, min_path)
+        print(f"  minimised to {len(minimal['cpu_ops'])} CPU + {len(minimal['apu_ops'])} APU ops: {min_path}")
+        print(f"  rerun with: STRESS_JOB={min_path} python3 chip_top_tb.py --filter test_bus_stress")
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,283 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Compact binary bus access logs, and their offline analysis.
+#
+# Passive monitors in the testbench (eram_monitor and fabric_monitor in
+# chip_top_tb.py) write one fixed-size record per access: the clock cycle it
+# was issued, address, size, read/write, the port it was seen on, and its
+# latency in cycles (0 where the monitor can't see it). A port is a master
+# (ERAM: CPU fetch, CPU load/store, PPU) or a slave (bus fabric: IRAM, ROM,
+# each APB peripheral...), as named in the log's JSON header. The log ends
+# with a marker record holding the cycle count at the end of the log. A ring
+# log (BusRing) holds only the last accesses before that.
+#
+# The analysis reads a whole log with numpy: bandwidth over time, utilisation
+# and latency histograms per port, the hottest address ranges of each port,
+# and the address ranges which spend the most cycles in wait states.
+
+import argparse
+import csv
+import json
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b"BUSMON\x00\x01"
+
+RECORD = np.dtype([
+    ("cycle",   "<u4"),
+    ("addr",    "<u4"),
+    ("latency", "<u2"),
+    ("port",    "u1"),
+    ("flags",   "u1"),
+])
+RECORD_STRUCT = struct.Struct("<IIHBB")
+assert RECORD_STRUCT.size == RECORD.itemsize
+
+FLAG_WRITE     = 1 << 0
+# log2 of the access size in bytes
+FLAG_SIZE_LSB  = 1
+FLAG_SIZE_BITS = 0x3 << FLAG_SIZE_LSB
+
+# Port field of the end-of-log marker
+PORT_END = 0xff
+
+class BusLog:
+    """Write access records to a binary log at path. header must have "bus",
+    "ports" (list of names, indexed by the port field of each record),
+    "port_kind" ("master" or "slave"), "clk_period_ns", and
+    "peak_bytes_per_cycle" (the bus's theoretical throughput, for
+    utilisation). Optionally "nested_ports", whose accesses are also seen on
+    another port (e.g. APB peripherals behind the APB bridge), so are left
+    out of totals. Records are buffered and written in blocks."""
+
+    def __init__(self, path, header, buffer_records=1 << 14):
+        assert len(header["ports"]) < PORT_END
+        self.f = open(path, "wb")
+        hdr = json.dumps(header).encode()
+        self.f.write(MAGIC + struct.pack("<I", len(hdr)) + hdr)
+        self.buf = bytearray(buffer_records * RECORD_STRUCT.size)
+        self.n = 0
+        self.n_total = 0
+
+    def record(self, cycle, addr, size, write, port, latency=0):
+        flags = (FLAG_WRITE if write else 0) | ((size.bit_length() - 1) << FLAG_SIZE_LSB)
+        RECORD_STRUCT.pack_into(self.buf, self.n * RECORD_STRUCT.size,
+            cycle, addr, min(latency, 0xffff), port, flags)
+        self.n += 1
+        self.n_total += 1
+        if self.n * RECORD_STRUCT.size == len(self.buf):
+            self.flush()
+
+    def flush(self):
+        self.f.write(self.buf[:self.n * RECORD_STRUCT.size])
+        self.n = 0
+
+    def close(self, end_cycle):
+        """Mark the end of the log at end_cycle, and close it."""
+        if self.f is None:
+            return
+        self.flush()
+        self.f.write(RECORD_STRUCT.pack(end_cycle, 0, 0, PORT_END, 0))
+        self.f.close()
+        self.f = None
+
+class BusRing(BusLog):
+    """A BusLog which keeps only the most recent n_records in memory, and
+    writes them out when closed, for long runs where only the accesses
+    leading up to the end (e.g. a hang or failure) are of interest."""
+
+    def __init__(self, path, header, n_records=1 << 16):
+        super().__init__(path, {**header, "ring": True}, buffer_records=n_records)
+        self.wrapped = False
+
+    def flush(self):
+        # Called when the buffer is full: overwrite the oldest records
+        self.n = 0
+        self.wrapped = True
+
+    def close(self, end_cycle):
+        if self.f is None:
+            return
+        n_bytes = self.n * RECORD_STRUCT.size
+        if self.wrapped:
+            self.f.write(self.buf[n_bytes:])
+        self.f.write(self.buf[:n_bytes])
+        super().close(end_cycle)
+
+def load(path):
+    """Return (header, records, start_cycle, end_cycle) of a log. records is
+    a numpy structured array of RECORD. A log that was cut short (no end
+    marker) ends at its last access. A ring log starts at its earliest
+    access, which needn't be its first record, as records are logged on
+    completion with their start cycle. Otherwise logs start at cycle 0."""
+    with open(path, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC, f"{path} is not a bus monitor log"
+        (n,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(n))
+        data = f.read()
+    records = np.frombuffer(data[:len(data) - len(data) % RECORD.itemsize], dtype=RECORD)
+    end = records["port"] == PORT_END
+    if end.any():
+        end_cycle = int(records["cycle"][end][-1])
+    else:
+        end_cycle = int(records["cycle"].max()) + 1 if len(records) else 0
+    records = records[~end]
+    start_cycle = int(records["cycle"].min()) if header.get("ring") and len(records) else 0
+    return header, records, start_cycle, end_cycle
+
+def sizes(records):
+    return 1 << ((records["flags"] & FLAG_SIZE_BITS) >> FLAG_SIZE_LSB).astype(np.int64)
+
+def bandwidth(records, n_ports, start_cycle, end_cycle, bin_cycles):
+    """Bytes transferred on each port in each bin of bin_cycles from
+    start_cycle, as an array of shape (n_ports, n_bins)."""
+    n_bins = max(1, -(-(end_cycle - start_cycle) // bin_cycles))
+    idx = records["port"].astype(np.int64) * n_bins + (records["cycle"].astype(np.int64) - start_cycle) // bin_cycles
+    return np.bincount(idx, weights=sizes(records), minlength=n_ports * n_bins).reshape(n_ports, n_bins)
+
+def utilisation(header, records, cycles):
+    """Per-port summary: accesses, reads, writes, bytes, MB/s, and share of
+    the bus's peak throughput over cycles."""
+    cycles = max(cycles, 1)
+    clk_hz = 1e9 / header["clk_period_ns"]
+    peak = header["peak_bytes_per_cycle"] * cycles
+    write = (records["flags"] & FLAG_WRITE) != 0
+    nbytes = sizes(records)
+    summary = {}
+    for i, name in enumerate(header["ports"]):
+        m = records["port"] == i
+        b = int(nbytes[m].sum())
+        summary[name] = {
+            "accesses": int(m.sum()),
+            "reads": int((m & ~write).sum()),
+            "writes": int((m & write).sum()),
+            "bytes": b,
+            "mb_per_s": b * clk_hz / cycles / 1e6,
+            "utilisation": b / peak,
+        }
+    return summary
+
+def latency_stats(header, records):
+    """Per-port latency histogram (index is latency in cycles) and
+    min/mean/p50/p99/max, for ports whose latency was measured."""
+    stats = {}
+    for i, name in enumerate(header["ports"]):
+        lat = records["latency"][(records["port"] == i) & (records["latency"] > 0)]
+        if not len(lat):
+            continue
+        stats[name] = {
+            "histogram": np.bincount(lat).tolist(),
+            "min": int(lat.min()),
+            "mean": float(lat.mean()),
+            "p50": float(np.percentile(lat, 50)),
+            "p99": float(np.percentile(lat, 99)),
+            "max": int(lat.max()),
+        }
+    return stats
+
+def hot_regions(header, records, region_bytes=4096, n=8):
+    """The n most-accessed regions of region_bytes for each port, as
+    [(base address, accesses)]."""
+    regions = {}
+    for i, name in enumerate(header["ports"]):
+        addrs = records["addr"][records["port"] == i] // region_bytes
+        if not len(addrs):
+            continue
+        base, count = np.unique(addrs, return_counts=True)
+        top = np.argsort(-count, kind="stable")[:n]
+        regions[name] = [(int(base[j]) * region_bytes, int(count[j])) for j in top]
+    return regions
+
+def wait_hotspots(header, records, region_bytes=4096, n=8):
+    """The n regions of region_bytes (across all ports) with the most cycles
+    spent in wait states, i.e. latency beyond zero_wait_latency (default 1).
+    Returns [(port, base address, accesses, wait cycles)]."""
+    zero_wait = header.get("zero_wait_latency", 1)
+    m = records["latency"] > 0
+    waits = records["latency"][m].astype(np.int64) - zero_wait
+    keys = records["port"][m].astype(np.int64) << 32 | records["addr"][m] // region_bytes
+    key, inverse = np.unique(keys, return_inverse=True)
+    total = np.bincount(inverse, weights=np.maximum(waits, 0))
+    count = np.bincount(inverse)
+    top = [j for j in np.argsort(-total, kind="stable")[:n] if total[j] > 0]
+    return [(header["ports"][int(key[j] >> 32)], int(key[j] & 0xffffffff) * region_bytes,
+        int(count[j]), int(total[j])) for j in top]
+
+def main(args):
+    header, records, start_cycle, end_cycle = load(args.log)
+    ports = header["ports"]
+    nested = set(header.get("nested_ports", []))
+    clk_ns = header["clk_period_ns"]
+    cycles = end_cycle - start_cycle
+    print(f"{args.log}: {header['bus']}, {len(records)} accesses over {cycles} cycles "
+        f"({cycles * clk_ns / 1e3:.1f} us)" + (f", last {len(records)} only" if header.get("ring") else ""))
+
+    util = utilisation(header, records, cycles)
+    kind = header.get("port_kind", "port").capitalize()
+    width = max(len(kind), *(len(p) for p in ports))
+    print(f"\n{kind:<{width}} {'Accesses':>9} {'Reads':>9} {'Writes':>9} {'Bytes':>10} {'MB/s':>8} {'Util':>6}")
+    for name, u in util.items():
+        print(f"{name:<{width}} {u['accesses']:>9} {u['reads']:>9} {u['writes']:>9} {u['bytes']:>10} "
+            f"{u['mb_per_s']:>8.2f} {u['utilisation']:>6.1%}")
+    top = [u for name, u in util.items() if name not in nested]
+    print(f"{'Total':<{width}} {sum(u['accesses'] for u in top):>9} {'':>9} {'':>9} "
+        f"{sum(u['bytes'] for u in top):>10} {sum(u['mb_per_s'] for u in top):>8.2f} "
+        f"{sum(u['utilisation'] for u in top):>6.1%}")
+    if nested:
+        print(f"(Total excludes {', '.join(sorted(nested))}, also counted on another port)")
+
+    lat = latency_stats(header, records)
+    for name, s in lat.items():
+        print(f"\n{name} latency (cycles): min {s['min']} mean {s['mean']:.2f} p50 {s['p50']:.0f} "
+            f"p99 {s['p99']:.0f} max {s['max']}")
+        hist = s["histogram"]
+        scale = 50 / max(hist)
+        for n_cycles, count in enumerate(hist):
+            if count:
+                print(f"  {n_cycles:>5} {count:>9} {'#' * max(1, round(count * scale))}")
+
+    for name, regions in hot_regions(header, records, args.region, args.top).items():
+        print(f"\n{name} hottest {args.region} byte regions:")
+        for base, count in regions:
+            print(f"  {base:05x} {count:>9} {count / util[name]['accesses']:>6.1%}")
+
+    hotspots = wait_hotspots(header, records, args.region, args.top)
+    if hotspots:
+        print(f"\nWait state hotspots ({args.region} byte regions):")
+        print(f"  {kind:<{width}} {'Base':>5} {'Accesses':>9} {'Waits':>9} {'Per access':>10}")
+        for name, base, count, waits in hotspots:
+            print(f"  {name:<{width}} {base:05x} {count:>9} {waits:>9} {waits / count:>10.2f}")
+
+    bin_cycles = max(1, round(args.bin_us * 1e3 / clk_ns))
+    bw = bandwidth(records, len(ports), start_cycle, end_cycle, bin_cycles)
+    if args.csv:
+        bytes_to_mb_per_s = 1e3 / (bin_cycles * clk_ns)
+        outer = [i for i, p in enumerate(ports) if p not in nested]
+        with open(args.csv, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["time_us", *(f"{p}_mb_per_s" for p in ports), "utilisation"])
+            for i in range(bw.shape[1]):
+                w.writerow([f"{(start_cycle + i * bin_cycles) * clk_ns / 1e3:.3f}",
+                    *(f"{bw[p, i] * bytes_to_mb_per_s:.3f}" for p in range(len(ports))),
+                    f"{bw[outer, i].sum() / (bin_cycles * header['peak_bytes_per_cycle']):.4f}"])
+        print(f"\nBandwidth over time ({args.bin_us} us bins) written to {args.csv}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"header": header, "start_cycle": start_cycle, "end_cycle": end_cycle,
+                "utilisation": util, "latency": lat,
+                "wait_hotspots": [dict(zip(("port", "base", "accesses", "waits"), h)) for h in hotspots],
+                "bandwidth_bin_cycles": bin_cycles, "bandwidth_bytes": bw.tolist()}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse a bus monitor log")
+    parser.add_argument("log", help="binary log written by a testbench bus monitor")
+    parser.add_argument("--bin-us", type=float, default=10, help="bandwidth-over-time bin size")
+    parser.add_argument("--region", type=lambda x: int(x, 0), default=4096,
+        help="region size in bytes for hot regions and wait hotspots (4 for single registers)")
+    parser.add_argument("--top", type=int, default=8, help="hot regions listed per port, and wait hotspots")
+    parser.add_argument("--csv", help="write bandwidth over time to this CSV")
+    parser.add_argument("--json", help="write the full analysis to this JSON")
+    args = parser.parse_args()
+    sys.exit(main(args))
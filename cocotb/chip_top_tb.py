@@ -2,28 +2,69 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
+import csv
 import inspect
+import json
 import logging
 import os
 import random
 import re
+import select
+import socket
 import struct
 import subprocess
 import sys
 import yaml
+import zlib
 from pathlib import Path
 
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import Timer, Edge, RisingEdge, FallingEdge, ClockCycles
+from cocotb.triggers import Timer, Edge, RisingEdge, FallingEdge, ClockCycles, First, with_timeout
 from cocotb_tools.runner import get_runner
-from cocotb.handle import Release
+from cocotb.handle import Force, Release
+from cocotb.utils import get_sim_time
+
+from timing_history import CLK_PERIOD_NS
+from twd import TWD, PinTransport, EmulatorTransport, TWDEmulator
+from rvdebug import (
+    RVDebug,
+    DM_DMSTATUS, DM_DMSTATUS_ALLHALTED,
+    CSR_MSTATUS, CSR_MISA, CSR_MIE, CSR_MTVEC, CSR_MEPC, CSR_MCAUSE, CSR_MIP,
+    CSR_MARCHID, CSR_MHARTID, CSR_DCSR, CSR_DPC, DCSR_EBREAKM, DCSR_STEP,
+    gpr_write_step,
+)
 
 sim = os.getenv("SIM", "icarus")
 pdk_root = "../gf180mcu"
 pdk = os.getenv("PDK", "gf180mcuD")
 scl = os.getenv("SCL", "gf180mcu_fd_sc_mcu9t5v0")
 gl = os.getenv("GL", False)
+# "pnl" (powered) or "nl" (unpowered, functional only) netlist for GL sims
+gl_netlist = os.getenv("GL_NETLIST", "pnl")
+# Modules to simulate from gate-level netlists (scripts/synth_block.py) in an
+# otherwise RTL sim, comma-separated
+gl_blocks = sorted(filter(None, os.getenv("GL_BLOCKS", "").split(",")))
+gl_block_dir = Path(os.getenv("GL_BLOCK_DIR", Path(__file__).resolve().parent / "gl_blocks"))
+gdb_port = os.getenv("GDB_PORT", None)
+# Seconds to wait for gdb to connect, and then for each of its requests
+gdb_timeout_s = float(os.getenv("GDB_TIMEOUT", 600))
+stress_job = os.getenv("STRESS_JOB", None)
+bench = os.getenv("BENCH", False)
+# Switching activity capture for power analysis (scripts/power_report.py): the
+# dump covers ACTIVITY_SCOPE only, during each power workload's window
+activity = os.getenv("ACTIVITY", False)
+activity_scope = os.getenv("ACTIVITY_SCOPE", "tb.chip_u")
+activity_dir = Path(__file__).resolve().parent / "activity"
+# Verilator dumps FST whatever the file is called
+activity_dump = activity_dir / ("activity.fst" if sim == "verilator" else "activity.vcd")
+# Log every ERAM access (BUSMON) and/or every transaction on the system bus
+# fabric (BUSTRACE) of each test to busmon/<test>.<bus>.bin, see busmon.py.
+# BUSTRACE_RING=n keeps only the last n fabric transactions.
+busmon = os.getenv("BUSMON", False)
+bustrace = os.getenv("BUSTRACE", False)
+bustrace_ring = int(os.getenv("BUSTRACE_RING", 0))
+busmon_dir = Path(__file__).resolve().parent / "busmon"
 
 ###############################################################################
 # System address map
@@ -33,6 +74,7 @@ IRAM_BASE    = 0x40000
 APU_BASE     = 0x60000
 PERI_BASE    = 0x70000
 
+ERAM_END     = ERAM_BASE + 0x40000
 IRAM_END     = IRAM_BASE + 0x2000
 APU_RAM_BASE = APU_BASE
 APU_RAM_END  = APU_RAM_BASE + 0x800
@@ -42,36 +84,18 @@ APU_IPC_BASE = APU_PERI_BASE
 APU_IPC_SOFTIRQ_SET = APU_IPC_BASE + 4
 APU_IPC_SOFTIRQ_CLR = APU_IPC_BASE + 8
 
+# Must match the flash model connections in tb/tb.v
+GPIO_FLASH_SCK = 1
+GPIO_FLASH_CSN = 2
+
 ###############################################################################
 # TWD debug helpers
 
-TWD_PERIOD = 50
+# The protocol and the RISC-V debug module accesses are in twd.py and
+# rvdebug.py, which also run against the TWD emulator in twd.py. These
+# wrappers hold one debug link per DUT, driven over its DIO/DCK pins.
 
-TWD_CMD_DISCONNECT = 0x0
-TWD_CMD_R_IDCODE   = 0x1
-TWD_CMD_R_AINFO    = 0x2
-TWD_CMD_R_STAT     = 0x4
-TWD_CMD_W_CSR      = 0x6
-TWD_CMD_R_CSR      = 0x7
-TWD_CMD_R_ADDR     = 0x8
-TWD_CMD_W_ADDR     = 0x9
-TWD_CMD_W_ADDR_R   = 0xa
-TWD_CMD_R_DATA     = 0xb
-TWD_CMD_W_DATA     = 0xc
-TWD_CMD_R_BUFF     = 0xd
-
-TWD_CSR_VERSION_LSB       = 28
-TWD_CSR_VERSION_BITS      = 0xf << TWD_CSR_VERSION_LSB
-TWD_CSR_ASIZE_LSB         = 24
-TWD_CSR_ASIZE_BITS        = 0x7 << TWD_CSR_ASIZE_LSB
-TWD_CSR_EPARITY_BITS      = 1 << 18
-TWD_CSR_EBUSFAULT_BITS    = 1 << 17
-TWD_CSR_EBUSY_BITS        = 1 << 16
-TWD_CSR_AINCR_BITS        = 1 << 12
-TWD_CSR_BUSY_BITS         = 1 << 8
-TWD_CSR_NDTMRESETACK_BITS = 1 << 5
-TWD_CSR_NDTMRESETREQ_BITS = 1 << 4
-TWD_CSR_MDROPADDR_BITS    = 0xf
+TWD_PERIOD = 50
 
 VUART_STAT = 0x80
 VUART_STAT_RXVLD = 1 << 31
@@ -79,100 +103,33 @@ VUART_STAT_TXRDY = 1 << 30
 VUART_INFO = 0x81
 VUART_FIFO = 0x82
 
-async def twd_shift_out(dut, bits, n):
-    if n % 8 != 0:
-        bits = bits << (8 - n)
-    for i in range(n):
-        bitidx = i ^ 0x7
-        dut.DIO.value = (bits >> bitidx) & 1
-        await Timer(TWD_PERIOD / 2, "ns")
-        dut.DCK.value = 1
-        await Timer(TWD_PERIOD / 2, "ns")
-        dut.DCK.value = 0
-
-async def twd_shift_in(dut, n):
-    accum = 0
-    dut.DIO.value = Release()
-    for i in range(n):
-        bitidx = i ^ 0x7
-        accum = accum | ((int(dut.DIO.value) & 1) << bitidx)
-        await Timer(TWD_PERIOD / 2, "ns")
-        dut.DCK.value = 1
-        await Timer(TWD_PERIOD / 2, "ns")
-        dut.DCK.value = 0
-    if n % 8 != 0:
-        accum = accum >> (8 - n)
-    return accum
-
-def odd_parity(x):
-    return 1 - (x.bit_count() & 1)
-
-async def twd_command(dut, cmd, n_bits, wdata=None):
-    await twd_shift_out(dut, 1 << 5 | (cmd << 1) | (odd_parity(cmd)), 6)
-    if cmd == TWD_CMD_DISCONNECT:
-        return None
-    if wdata is None:
-        _ = await twd_shift_in(dut, 2)
-        rdata = await twd_shift_in(dut, n_bits)
-        parity = await twd_shift_in(dut, 1)
-        assert parity == odd_parity(rdata)
-        _ = await twd_shift_in(dut, 3)
-        return rdata
-    else:
-        await twd_shift_out(dut, 0, 2)
-        await twd_shift_out(dut, wdata, n_bits)
-        await twd_shift_out(dut, odd_parity(wdata) << 3, 4)
-
-twd_cached_addr = None
-async def twd_connect(dut):
-    global twd_cached_addr
-    twd_cached_addr = None
-    connect_seq = [
-        0x00, 0xa7, 0xa3, 0x92, 0xdd, 0x9a, 0xbf, 0x04, 0x31, 0xff, 0xff,
-        0xff, 0xff, 0xff, 0xff, 0xff, 0xff, 0xff, 0x0f
-    ]
-    _ = await twd_shift_in(dut, 80)
-    await twd_command(dut, TWD_CMD_DISCONNECT, 0)
-    for b in connect_seq:
-        await twd_shift_out(dut, b, 8)
-    csr_rdata = await twd_command(dut, TWD_CMD_R_CSR, 32)
-    assert ((csr_rdata & TWD_CSR_VERSION_BITS) >> TWD_CSR_VERSION_LSB) == 1
-    assert ((csr_rdata & TWD_CSR_ASIZE_BITS) >> TWD_CSR_ASIZE_LSB) == 0
-    await twd_command(dut, TWD_CMD_W_CSR, 32,
-        TWD_CSR_EPARITY_BITS |
-        TWD_CSR_EBUSFAULT_BITS |
-        TWD_CSR_EBUSY_BITS
-    )
+debug_links = {}
+
+def new_debug_link(dut, pipelined=True):
+    link = RVDebug(TWD(PinTransport(dut.DIO, dut.DCK, TWD_PERIOD), pipelined, log=cocotb.log))
+    debug_links[dut] = link
+    return link
+
+async def twd_connect(dut, pipelined=True):
+    await new_debug_link(dut, pipelined).twd.connect()
 
 async def twd_read_idcode(dut):
-    return await twd_command(dut, TWD_CMD_R_IDCODE, 32)
+    return await debug_links[dut].twd.read_idcode()
 
 async def twd_write_bus(dut, addr, wdata):
-    global twd_cached_addr
-    if addr != twd_cached_addr:
-        await twd_command(dut, TWD_CMD_W_ADDR, 8, addr)
-        twd_cached_addr = addr
-    await twd_command(dut, TWD_CMD_W_DATA, 32, wdata)
-    while True:
-        stat = await twd_command(dut, TWD_CMD_R_STAT, 4)
-        if (stat & 1) == 0:
-            break
+    await debug_links[dut].twd.write_bus(addr, wdata)
+
+async def twd_barrier(dut):
+    await debug_links[dut].twd.barrier()
 
 async def twd_read_bus(dut, addr):
-    global twd_cached_addr
-    twd_cached_addr = addr
-    await twd_command(dut, TWD_CMD_W_ADDR_R, 8, addr)
-    for i in range(10):
-        stat = await twd_command(dut, TWD_CMD_R_STAT, 4)
-        if (stat & 1) == 0:
-            break
-    else:
-        assert False
-    return await twd_command(dut, TWD_CMD_R_BUFF, 32)
+    return await debug_links[dut].twd.read_bus(addr)
 
 async def twd_vuart_getchar(dut, max_poll=10):
     # The status flags are also present in the FIFO register, but still use
-    # STAT because the FIFO storage flops are Xs initially.
+    # STAT because the FIFO storage flops are Xs initially. Reading FIFO pops
+    # it, so let earlier writes complete and check them first.
+    await twd_barrier(dut)
     for i in range(max_poll):
         fifo_stat = await twd_read_bus(dut, VUART_FIFO)
         if fifo_stat & VUART_STAT_RXVLD:
@@ -182,203 +139,434 @@ async def twd_vuart_getchar(dut, max_poll=10):
 ###############################################################################
 # RISC-V debug helpers
 
-DM_DATA0                   = 0x04
-DM_DMCONTROL               = 0x10
-DM_DMSTATUS                = 0x11
-DM_ABSTRACTCS              = 0x16
-DM_COMMAND                 = 0x17
-DM_ABSTRACTAUTO            = 0x18
-DM_PROGBUF0                = 0x20
-DM_PROGBUF1                = 0x21
-
-DM_DMCONTROL_DMACTIVE      = 0x1
-DM_DMCONTROL_HARTSEL_LSB   = 16
-DM_DMCONTROL_HALTREQ       = 1 << 31
-DM_DMCONTROL_RESUMEREQ     = 1 << 30
-
-DM_DMSTATUS_VERSION_BITS   = 0xf
-DM_DMSTATUS_ANYHALTED      = 1 << 8
-DM_DMSTATUS_ALLHALTED      = 1 << 9
-DM_DMSTATUS_ANYRUNNING     = 1 << 10
-DM_DMSTATUS_ALLRUNNING     = 1 << 11
-DM_DMSTATUS_ANYUNAVAIL     = 1 << 12
-DM_DMSTATUS_ALLUNAVAIL     = 1 << 13
-DM_DMSTATUS_ALLNONEXISTENT = 1 << 14
-DM_DMSTATUS_ANYNONEXISTENT = 1 << 15
-DM_DMSTATUS_ALLRESUMEACK   = 1 << 16
-DM_DMSTATUS_ANYRESUMEACK   = 1 << 17
-DM_DMSTATUS_ALLHAVERESET   = 1 << 18
-DM_DMSTATUS_ANYHAVERESET   = 1 << 19
-
-DM_ABSTRACTCS_BUSY         = 1 << 12
-DM_ABSTRACTCS_CMDERR       = 0x7 << 8
-
-DM_COMMAND_SIZE_WORD       = 2 << 20
-DM_COMMAND_POSTEXEC        = 1 << 18
-DM_COMMAND_TRANSFER        = 1 << 17
-DM_COMMAND_WRITE           = 1 << 16
-DM_COMMAND_REGNO_LSB       = 0
-
-CSR_MVENDORID              = 0xf11
-CSR_MARCHID                = 0xf12
-CSR_MIMPID                 = 0xf13
-CSR_MHARTID                = 0xf14
-CSR_MISA                   = 0x301
-CSR_MIE                    = 0x304
-CSR_MIP                    = 0x344
-CSR_H3_MSLEEP              = 0xbf0
-CSR_TSELECT                = 0x7a0
-CSR_TDATA1                 = 0x7a1
-CSR_TDATA2                 = 0x7a2
-CSR_TDATA3                 = 0x7a3
-CSR_TINFO                  = 0x7a4
-CSR_TCONTROL               = 0x7a5
-CSR_DCSR                   = 0x7b0
-CSR_DPC                    = 0x7b1
-
-rvdebug_progbuf_cache = [0, 0]
 async def rvdebug_init(dut):
-    global rvdebug_progbuf_cache
-    rvdebug_progbuf_cache = [0, 0]
-    await twd_connect(dut)
-    dmstatus = await twd_read_bus(dut, DM_DMSTATUS)
-    assert (dmstatus & 0xf) == 2
-    await twd_write_bus(dut, DM_DMCONTROL, 0)
-    await twd_write_bus(dut, DM_DMCONTROL, DM_DMCONTROL_DMACTIVE)
+    await new_debug_link(dut).init()
 
 async def rvdebug_count_harts(dut):
-    await twd_write_bus(dut, DM_DMCONTROL, DM_DMCONTROL_DMACTIVE)
-    for i in range(32 + 1):
-        # 32 is max harts supported by Hazard3 DM
-        expect = DM_DMCONTROL_DMACTIVE | (i << DM_DMCONTROL_HARTSEL_LSB)
-        await twd_write_bus(dut, DM_DMCONTROL, expect)
-        actual = await twd_read_bus(dut, DM_DMCONTROL)
-        if expect != actual:
-            return i
-        status = await twd_read_bus(dut, DM_DMSTATUS)
-        if status & DM_DMSTATUS_ANYNONEXISTENT:
-            return i
-    return i
+    return await debug_links[dut].count_harts()
+
+async def rvdebug_put_dmcontrol(dut, dmcontrol):
+    await debug_links[dut].put_dmcontrol(dmcontrol)
 
 async def rvdebug_select_hart(dut, hart):
-    await twd_write_bus(dut, DM_DMCONTROL,
-        DM_DMCONTROL_DMACTIVE | (hart << DM_DMCONTROL_HARTSEL_LSB))
+    await debug_links[dut].select_hart(hart)
+
+async def rvdebug_select_harts(dut, harts):
+    await debug_links[dut].select_harts(harts)
+
+async def rvdebug_get_dmcontrol(dut):
+    return await debug_links[dut].get_dmcontrol()
 
 async def rvdebug_halt(dut):
-    dmcontrol = await twd_read_bus(dut, DM_DMCONTROL)
-    await twd_write_bus(dut, DM_DMCONTROL, dmcontrol | DM_DMCONTROL_HALTREQ)
-    while True:
-        stat = await twd_read_bus(dut, DM_DMSTATUS)
-        if stat & DM_DMSTATUS_ALLHALTED:
-            break
+    await debug_links[dut].halt()
 
 async def rvdebug_resume(dut):
-    dmcontrol = await twd_read_bus(dut, DM_DMCONTROL)
-    await twd_write_bus(dut, DM_DMCONTROL, dmcontrol | DM_DMCONTROL_RESUMEREQ)
-    while True:
-        stat = await twd_read_bus(dut, DM_DMSTATUS)
-        if stat & DM_DMSTATUS_ALLRESUMEACK:
-            break
+    await debug_links[dut].resume()
+
+async def rvdebug_halt_harts(dut, harts):
+    await debug_links[dut].halt_harts(harts)
+
+async def rvdebug_resume_harts(dut, harts):
+    await debug_links[dut].resume_harts(harts)
 
 async def rvdebug_put_gpr(dut, gpr, wdata):
-    await twd_write_bus(dut, DM_DATA0, wdata)
-    await twd_write_bus(dut, DM_COMMAND,
-        DM_COMMAND_TRANSFER |
-        DM_COMMAND_SIZE_WORD |
-        DM_COMMAND_WRITE |
-        ((0x1000 + gpr) << DM_COMMAND_REGNO_LSB)
-    )
-    while True:
-        stat = await twd_read_bus(dut, DM_ABSTRACTCS)
-        if (stat & DM_ABSTRACTCS_BUSY) == 0:
-            break
+    await debug_links[dut].put_gpr(gpr, wdata)
 
 async def rvdebug_wait_acmd_finish(dut):
-    for i in range(10):
-        stat = await twd_read_bus(dut, DM_ABSTRACTCS)
-        if (stat & DM_ABSTRACTCS_BUSY) == 0:
-            break
-    else:
-        assert False
+    return await debug_links[dut].wait_acmd_finish()
 
 async def rvdebug_get_gpr(dut, gpr):
-    await twd_write_bus(dut, DM_COMMAND,
-        DM_COMMAND_TRANSFER |
-        DM_COMMAND_SIZE_WORD |
-        ((0x1000 + gpr) << DM_COMMAND_REGNO_LSB)
-    )
-    await rvdebug_wait_acmd_finish(dut)
-    return await twd_read_bus(dut, DM_DATA0)
+    return await debug_links[dut].get_gpr(gpr)
 
 async def rvdebug_put_progbuf(dut, idx, instr):
-    global rvdebug_progbuf_cache
-    if rvdebug_progbuf_cache[idx] != instr:
-        rvdebug_progbuf_cache[idx] = instr
-        await twd_write_bus(dut, DM_PROGBUF0 + idx, instr)
+    await debug_links[dut].put_progbuf(idx, instr)
 
 async def rvdebug_put_csr(dut, csr, wdata):
-    gprsave = await rvdebug_get_gpr(dut, 8)
-    await twd_write_bus(dut, DM_DATA0, wdata)
-    await rvdebug_put_progbuf(dut, 0, 0x00001073 | (csr << 20) | (8 << 15)) # csrw xxx, s0
-    await rvdebug_put_progbuf(dut, 1, 0x00100073) # ebreak
-    await twd_write_bus(dut, DM_COMMAND,
-        DM_COMMAND_POSTEXEC |
-        DM_COMMAND_TRANSFER |
-        DM_COMMAND_SIZE_WORD |
-        DM_COMMAND_WRITE |
-        0x1008
-    )
-    await rvdebug_wait_acmd_finish(dut)
-    await rvdebug_put_gpr(dut, 8, gprsave)
+    return await debug_links[dut].put_csr(csr, wdata)
 
 async def rvdebug_get_csr(dut, csr):
-    gprsave = await rvdebug_get_gpr(dut, 8)
-    await rvdebug_put_progbuf(dut, 0, 0x00002073 | (csr << 20) | (8 << 7)) # csrr s0, xxx
-    await rvdebug_put_progbuf(dut, 1, 0xbff01073 | (8 << 15)) # csrw dmdata0, s0
-    await twd_write_bus(dut, DM_COMMAND, DM_COMMAND_POSTEXEC)
-    await rvdebug_wait_acmd_finish(dut)
-    rdata = await twd_read_bus(dut, DM_DATA0)
-    await rvdebug_put_gpr(dut, 8, gprsave)
-    return rdata
+    return await debug_links[dut].get_csr(csr)
 
 async def rvdebug_write_mem32(dut, addr, wdata):
-    save_s0 = await rvdebug_get_gpr(dut, 8)
-    save_s1 = await rvdebug_get_gpr(dut, 9)
-    await rvdebug_put_gpr(dut, 9, wdata)
-    await twd_write_bus(dut, DM_DATA0, addr)
-    await rvdebug_put_progbuf(dut, 0, 0x00002023 | (9 << 20) | (8 << 15)) # sw s1, (s0)
-    await rvdebug_put_progbuf(dut, 1, 0x00100073) # ebreak
-    await twd_write_bus(dut, DM_COMMAND,
-        DM_COMMAND_POSTEXEC |
-        DM_COMMAND_TRANSFER |
-        DM_COMMAND_SIZE_WORD |
-        DM_COMMAND_WRITE |
-        0x1008
-    )
-    await rvdebug_wait_acmd_finish(dut)
-    await rvdebug_put_gpr(dut, 8, save_s0)
-    await rvdebug_put_gpr(dut, 9, save_s1)
+    await debug_links[dut].write_mem32(addr, wdata)
 
 async def rvdebug_read_mem32(dut, addr):
-    save_s0 = await rvdebug_get_gpr(dut, 8)
-    await twd_write_bus(dut, DM_DATA0, addr)
-    await rvdebug_put_progbuf(dut, 0, 0x00002003 | (8 << 7) | (8 << 15)) # lw s0, (s0)
-    await rvdebug_put_progbuf(dut, 1, 0x00100073) # ebreak
-    await twd_write_bus(dut, DM_COMMAND,
-        DM_COMMAND_POSTEXEC |
-        DM_COMMAND_TRANSFER |
-        DM_COMMAND_SIZE_WORD |
-        DM_COMMAND_WRITE |
-        0x1008
-    )
-    await rvdebug_wait_acmd_finish(dut)
-    rdata = await rvdebug_get_gpr(dut, 8)
-    await rvdebug_put_gpr(dut, 8, save_s0)
-    return rdata
+    return await debug_links[dut].read_mem32(addr)
+
+async def rvdebug_read_mem_block(dut, addr, n_words):
+    return await debug_links[dut].read_mem_block(addr, n_words)
+
+async def rvdebug_write_mem_block(dut, addr, wdata):
+    return await debug_links[dut].write_mem_block(addr, wdata)
+
+###############################################################################
+# Whole-hart snapshots
+
+GPR_NAMES = [
+    "zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2",
+    "s0", "s1", "a0", "a1", "a2", "a3", "a4", "a5",
+    "a6", "a7", "s2", "s3", "s4", "s5", "s6", "s7",
+    "s8", "s9", "s10", "s11", "t3", "t4", "t5", "t6",
+]
+
+# Both harts are built with BREAKPOINT_TRIGGERS=0, so reading the trigger
+# CSRs (tselect, tdata*) faults, and they're left out.
+RVDEBUG_SNAPSHOT_CSRS = {
+    "mstatus":  CSR_MSTATUS,
+    "mie":      CSR_MIE,
+    "mip":      CSR_MIP,
+    "mtvec":    CSR_MTVEC,
+    "mepc":     CSR_MEPC,
+    "mcause":   CSR_MCAUSE,
+    "dpc":      CSR_DPC,
+    "dcsr":     CSR_DCSR,
+}
+
+async def rvdebug_snapshot(dut, hart=None, csrs=RVDEBUG_SNAPSHOT_CSRS):
+    """Read x1-x31 and the CSRs in `csrs` (name -> number) from a halted hart,
+    and return them as a dict keyed by register name, with None for CSRs which
+    fault. The GPR reads double as the s0 save for the CSR reads, so this
+    takes two round trips."""
+    link = debug_links[dut]
+    if hart is not None:
+        await link.select_hart(hart)
+    snap = dict(zip(GPR_NAMES[1:], await link.get_gprs(range(1, 32))))
+    snap.update(zip(csrs, await link.get_csrs(csrs.values(), s0=snap["s0"])))
+    return snap
+
+def rvdebug_snapshot_diff(old, new):
+    """Return [(name, old, new), ...] for every register which differs between
+    two snapshots, in snapshot order. Registers present in only one snapshot
+    are reported with None for the missing value."""
+    names = list(old) + [k for k in new if k not in old]
+    return [(k, old.get(k), new.get(k)) for k in names if old.get(k) != new.get(k)]
+
+def rvdebug_format_reg(x):
+    return "--------" if x is None else f"{x:08x}"
+
+def rvdebug_format_snapshot(snap):
+    return "\n".join(f"{k:>8} = {rvdebug_format_reg(v)}" for k, v in snap.items())
+
+def rvdebug_format_snapshot_diff(diff):
+    return "\n".join(f"{k:>8}: {rvdebug_format_reg(a)} -> {rvdebug_format_reg(b)}"
+        for k, a, b in diff)
+
+###############################################################################
+# GDB remote serial protocol server
+
+# Register numbering used by riscv32 gdb when no target description is given
+GDB_REGNO_PC   = 32
+GDB_REGNO_CSR0 = 65
+
+# Memory in these ranges is read a line at a time and cached until the next
+# resume. Everything else (i.e. peripherals) is read uncached.
+GDB_CACHE_LINE = 64
+GDB_CACHEABLE = [
+    (ERAM_BASE, ERAM_END),
+    (IRAM_BASE, IRAM_END),
+    (APU_RAM_BASE, APU_RAM_END),
+]
+
+# Interval between checks for a halt or a ^C from gdb, while the hart runs
+GDB_POLL_PERIOD_US = 20
+
+def gdb_parse_packet(state):
+    """Remove and return the first complete packet from the receive buffer,
+    or b"\x03" for an interrupt request. Return None if there is none yet."""
+    rx = state["rx"]
+    while rx:
+        if rx[0] == 0x03:
+            del rx[0]
+            return b"\x03"
+        if rx[0] != ord("$"):
+            # Acks, and junk between packets
+            del rx[0]
+            continue
+        end = rx.find(b"#")
+        if end < 0 or len(rx) < end + 3:
+            return None
+        payload = bytes(rx[1:end])
+        checksum = int(rx[end + 1:end + 3], 16)
+        del rx[:end + 3]
+        if checksum == sum(payload) & 0xff:
+            state["conn"].sendall(b"+")
+            return payload
+        state["conn"].sendall(b"-")
+    return None
+
+def gdb_recv_packet(state, block=True):
+    # Blocking is fine while the hart is halted: the simulation just stops
+    # until gdb asks for something, or the socket times out.
+    while True:
+        pkt = gdb_parse_packet(state)
+        if pkt is not None:
+            return pkt
+        if not block:
+            readable, _, _ = select.select([state["conn"]], [], [], 0)
+            if not readable:
+                return None
+        data = state["conn"].recv(4096)
+        if not data:
+            raise ConnectionError("gdb disconnected")
+        state["rx"] += data
+
+def gdb_send_packet(state, payload):
+    data = payload.encode("latin-1")
+    state["conn"].sendall(b"$" + data + f"#{sum(data) & 0xff:02x}".encode())
+
+def gdb_hex32(x):
+    return struct.pack("<I", x & 0xffffffff).hex()
+
+async def gdb_read_regs(dut, state):
+    if state["regs"] is None:
+        snap = await rvdebug_snapshot(dut, csrs={"dpc": CSR_DPC})
+        state["regs"] = [0] + [snap[GPR_NAMES[i]] for i in range(1, 32)] + [snap["dpc"]]
+    return state["regs"]
+
+async def gdb_read_reg(dut, state, regno):
+    if regno <= GDB_REGNO_PC:
+        return (await gdb_read_regs(dut, state))[regno]
+    if GDB_REGNO_CSR0 <= regno < GDB_REGNO_CSR0 + 4096:
+        return await rvdebug_get_csr(dut, regno - GDB_REGNO_CSR0)
+    return None
+
+async def gdb_write_reg(dut, state, regno, wdata):
+    if regno == 0:
+        return True
+    if regno < 32:
+        await rvdebug_put_gpr(dut, regno, wdata)
+    elif regno == GDB_REGNO_PC:
+        await rvdebug_put_csr(dut, CSR_DPC, wdata)
+    elif GDB_REGNO_CSR0 <= regno < GDB_REGNO_CSR0 + 4096:
+        await rvdebug_put_csr(dut, regno - GDB_REGNO_CSR0, wdata)
+        return True
+    else:
+        return False
+    if state["regs"] is not None:
+        state["regs"][regno] = wdata
+    return True
+
+async def gdb_read_word(dut, state, addr):
+    line = addr & -GDB_CACHE_LINE
+    if not any(lo <= line < hi for lo, hi in GDB_CACHEABLE):
+        rdata = await rvdebug_read_mem_block(dut, addr, 1)
+        return None if rdata is None else rdata[0]
+    if line not in state["mem"]:
+        rdata = await rvdebug_read_mem_block(dut, line, GDB_CACHE_LINE // 4)
+        if rdata is None:
+            return None
+        state["mem"][line] = rdata
+    return state["mem"][line][(addr - line) // 4]
+
+async def gdb_read_mem(dut, state, addr, length):
+    buf = bytearray()
+    for waddr in range(addr & ~0x3, addr + length, 4):
+        w = await gdb_read_word(dut, state, waddr)
+        if w is None:
+            return None
+        buf += struct.pack("<I", w)
+    return bytes(buf[addr & 0x3:(addr & 0x3) + length])
+
+async def gdb_write_mem(dut, state, addr, data):
+    start = addr & ~0x3
+    end = (addr + len(data) + 3) & ~0x3
+    if start == addr and end == addr + len(data):
+        buf = bytearray(data)
+    else:
+        # Merge partial words with existing memory contents
+        buf = await gdb_read_mem(dut, state, start, end - start)
+        if buf is None:
+            return False
+        buf = bytearray(buf)
+        buf[addr - start:addr - start + len(data)] = data
+    wdata = [w[0] for w in struct.iter_unpack("<I", buf)]
+    state["mem"].clear()
+    return await rvdebug_write_mem_block(dut, start, wdata)
+
+async def gdb_run(dut, state, step=False):
+    dcsr = await rvdebug_get_csr(dut, CSR_DCSR)
+    dcsr_run = (dcsr | DCSR_STEP) if step else (dcsr & ~DCSR_STEP)
+    if dcsr_run != dcsr:
+        await rvdebug_put_csr(dut, CSR_DCSR, dcsr_run)
+    state["mem"].clear()
+    state["regs"] = None
+    await rvdebug_resume(dut)
+    while True:
+        stat = await twd_read_bus(dut, DM_DMSTATUS)
+        if stat & DM_DMSTATUS_ALLHALTED:
+            return "S05"
+        if gdb_recv_packet(state, block=False) == b"\x03":
+            await rvdebug_halt(dut)
+            return "S02"
+        await Timer(GDB_POLL_PERIOD_US, "us")
+
+async def gdb_handle_packet(dut, state, pkt):
+    """Return the reply to send, or None to end the session."""
+    if pkt == "\x03":
+        return "S02"
+    if pkt == "?":
+        return "S05"
+    if pkt.startswith("qSupported"):
+        return "PacketSize=1000"
+    if pkt == "qAttached":
+        return "1"
+    cmd, args = pkt[:1], pkt[1:]
+    if cmd == "H":
+        return "OK"
+    if cmd == "g":
+        return "".join(gdb_hex32(x) for x in await gdb_read_regs(dut, state))
+    if cmd == "G":
+        regs = [w[0] for w in struct.iter_unpack("<I", bytes.fromhex(args))]
+        for regno, wdata in enumerate(regs[:GDB_REGNO_PC + 1]):
+            await gdb_write_reg(dut, state, regno, wdata)
+        return "OK"
+    if cmd == "p":
+        rdata = await gdb_read_reg(dut, state, int(args, 16))
+        return "E01" if rdata is None else gdb_hex32(rdata)
+    if cmd == "P":
+        regno, wdata = args.split("=")
+        wdata = int.from_bytes(bytes.fromhex(wdata), "little")
+        return "OK" if await gdb_write_reg(dut, state, int(regno, 16), wdata) else "E01"
+    if cmd == "m":
+        addr, length = (int(x, 16) for x in args.split(","))
+        rdata = await gdb_read_mem(dut, state, addr, length)
+        return "E01" if rdata is None else rdata.hex()
+    if cmd == "M":
+        spec, wdata = args.split(":")
+        addr, _ = (int(x, 16) for x in spec.split(","))
+        return "OK" if await gdb_write_mem(dut, state, addr, bytes.fromhex(wdata)) else "E01"
+    if cmd in ("c", "s"):
+        if args:
+            await gdb_write_reg(dut, state, GDB_REGNO_PC, int(args, 16))
+        return await gdb_run(dut, state, step=cmd == "s")
+    if cmd == "D":
+        gdb_send_packet(state, "OK")
+        await rvdebug_resume(dut)
+        return None
+    if cmd == "k":
+        return None
+    # Empty reply means "unsupported". Notably this includes Z0, so gdb falls
+    # back to patching ebreaks into memory for breakpoints.
+    return ""
+
+async def gdb_server(dut, port, hart=0):
+    """Serve one gdb session on localhost:port, debugging the given hart
+    (which must already be halted), until gdb detaches or kills the target.
+    The simulation is slow, so use a generous `set remotetimeout` in gdb.
+    Waiting on gdb stops the simulation, so it times out after GDB_TIMEOUT
+    seconds."""
+    await rvdebug_select_hart(dut, hart)
+    dcsr = await rvdebug_get_csr(dut, CSR_DCSR)
+    await rvdebug_put_csr(dut, CSR_DCSR, dcsr | DCSR_EBREAKM)
+    with socket.create_server(("localhost", port)) as srv:
+        srv.settimeout(gdb_timeout_s)
+        cocotb.log.info(f"Waiting for gdb on localhost:{port}")
+        try:
+            conn, _ = srv.accept()
+        except TimeoutError:
+            raise TimeoutError(f"gdb didn't connect to localhost:{port} "
+                f"within {gdb_timeout_s:g} s (GDB_TIMEOUT)") from None
+    conn.settimeout(gdb_timeout_s)
+    state = {"conn": conn, "rx": bytearray(), "mem": {}, "regs": None}
+    with conn:
+        try:
+            while True:
+                pkt = gdb_recv_packet(state).decode("latin-1")
+                reply = await gdb_handle_packet(dut, state, pkt)
+                if reply is None:
+                    break
+                gdb_send_packet(state, reply)
+        except TimeoutError:
+            raise TimeoutError(f"No request from gdb within {gdb_timeout_s:g} s (GDB_TIMEOUT)") from None
+        except ConnectionError as e:
+            cocotb.log.info(f"gdb session ended: {e}")
 
 ###############################################################################
 # Helpers
 
+swtest_root = Path(__file__).resolve().parent.parent / "software/tests"
+
+def make_app(target, app, suffix=".bin", quiet=False):
+    """Build software/tests/<target>/<app>.c, return the path of the binary
+    image"""
+    swtest_dir = swtest_root / target
+    rc = subprocess.run(["make", "-C", swtest_dir, f"APP={app}"], capture_output=quiet)
+    assert rc.returncode == 0, rc.stdout
+    return swtest_dir / f"build/{app}{suffix}"
+
+def build_app(target, app, suffix=".bin"):
+    """Build software/tests/<target>/<app>.c, return the binary image"""
+    with open(make_app(target, app, suffix), "rb") as f:
+        prog_bytes = f.read()
+    cocotb.log.info(f"Program size = {len(prog_bytes)}")
+    return prog_bytes
+
+def load_eram(dut, prog_bytes, addr=ERAM_BASE):
+    prog_hwords = list(w[0] for w in struct.iter_unpack("<h", prog_bytes))
+    for i, hword in enumerate(prog_hwords):
+        dut.eram_u.mem[(addr - ERAM_BASE) // 2 + i].value = hword
+        dut.eram_u.mem[(addr - ERAM_BASE) // 2 + i].value = Release()
+
+def load_iram(dut, prog_bytes):
+    prog_words = list(w[0] for w in struct.iter_unpack("<l", prog_bytes))
+    for i, word in enumerate(prog_words):
+        y = i // 512
+        row = i % 512
+        for x in range(4):
+            data = (word >> (x * 8)) & 0xff
+            dut.chip_u.i_chip_core.iram_u.sram.g_dg512.g_depth[y].g_width[x].ram_u.mem[row].value = data
+            dut.chip_u.i_chip_core.iram_u.sram.g_dg512.g_depth[y].g_width[x].ram_u.mem[row].value = Release()
+
+def flash_image(prog_bytes, size=1024):
+    """Pad a flash binary and append its checksum, as mkflashexec does, for a
+    bootrom built with BINARY_SIZE_BYTES=size."""
+    assert len(prog_bytes) <= size - 4
+    padded = prog_bytes + bytes(size - 4 - len(prog_bytes))
+    return padded + struct.pack("<L", zlib.adler32(padded))
+
+def load_flash(dut, prog_bytes):
+    for i, b in enumerate(prog_bytes):
+        dut.flash_u.mem[i].value = b
+        dut.flash_u.mem[i].value = Release()
+
+async def rvdebug_start_at(dut, pc):
+    """Halt the selected hart and resume it at pc"""
+    await rvdebug_halt(dut)
+    # GPRs aren't reset, so initialise the one that's saved and restored:
+    await rvdebug_put_gpr(dut, 8, 0)
+    await rvdebug_put_csr(dut, CSR_DPC, pc)
+    cocotb.log.info(f"Resuming at {pc:x}")
+    await rvdebug_resume(dut)
+
+async def vuart_read_until_done(dut, max_poll=10):
+    """Echo VUART output until the program prints !TPASS or !TFAIL, or goes
+    quiet. Check it passed, and return its output minus the pass marker."""
+    vuart_stdout = []
+    def test_done():
+        if len(vuart_stdout) < 6:
+            return False
+        endstr = "".join(vuart_stdout[-6:])
+        if endstr == "!TPASS":
+            return True
+        if endstr == "!TFAIL":
+            return True
+        return False
+
+    while not test_done():
+        c = await twd_vuart_getchar(dut, max_poll=max_poll)
+        if c is None: break
+        sys.stdout.write(chr(c))
+        vuart_stdout.append(chr(c))
+
+    sys.stdout.write("\n")
+    vuart_stdout = "".join(vuart_stdout)
+
+    assert vuart_stdout.endswith("!TPASS")
+    vuart_stdout = vuart_stdout[:-6]
+
+    cocotb.log.info(f"Processor standard output:\n\n{vuart_stdout}\n")
+    return vuart_stdout
+
 async def start_up(dut):
     if gl:
         dut.chip_u.VDD.value = 1
@@ -389,6 +577,65 @@ async def start_up(dut):
     dut.clk_running.value = 1
     await Timer(1, "us")
     dut.RSTn.value = 1
+    if busmon or bustrace:
+        busmon_start(dut)
+
+metrics_file = Path(os.getenv("COCOTB_RESULTS_FILE", "results.xml")).with_name("metrics.jsonl")
+
+def record_metric(name, value):
+    """Save a figure of merit (lower is better) alongside results.xml, for
+    timing_history.py to track across runs."""
+    cocotb.log.info(f"Metric {name} = {value}")
+    with open(metrics_file, "a") as f:
+        f.write(json.dumps({"name": name, "value": value}) + "\n")
+
+# Upper bound on the time from the end of the bootrom's flash read to its jump
+# into IRAM (the image checksum), used only when we can't see the jump itself.
+BOOT_CSN_QUIET_US = 1000
+
+async def wait_boot_handoff(dut):
+    """Wait for the bootrom to jump to the image it loaded into IRAM. Return
+    the simulation time (ns) of the handoff.
+
+    RTL: the first instruction fetch accepted by IRAM. GL: internal nets aren't
+    available, so instead wait for flash CSn to go high and stay high for
+    BOOT_CSN_QUIET_US, and return the time of that final CSn rising edge,
+    which is earlier than the jump by the checksum time."""
+    if not gl:
+        core = dut.chip_u.i_chip_core
+        while True:
+            await RisingEdge(dut.CLK)
+            # An address phase completes on a clock edge with HREADY high,
+            # and HPROT[0] is clear for instruction fetches
+            if (core.iram_htrans.value[1] == 1 and core.iram_hready.value == 1
+                    and core.iram_hprot.value[0] == 0):
+                return get_sim_time("ns")
+    t_rise = None
+    csn_prev = None
+    while True:
+        edge = Edge(dut.GPIO)
+        if t_rise is None:
+            await edge
+        else:
+            quiet = Timer(BOOT_CSN_QUIET_US, "us")
+            if await First(edge, quiet) is quiet:
+                return t_rise
+        csn = dut.GPIO.value[GPIO_FLASH_CSN]
+        if csn == 1 and csn_prev == 0:
+            t_rise = get_sim_time("ns")
+        elif csn == 0:
+            t_rise = None
+        csn_prev = csn
+
+async def boot_from_flash(dut, timeout_ms=20):
+    """Reset the chip and wait for the bootrom to hand off to IRAM. Record the
+    boot time from reset release as the boot_cycles metric, and return it."""
+    await start_up(dut)
+    t_reset = get_sim_time("ns")
+    t_handoff = await with_timeout(wait_boot_handoff(dut), timeout_ms, "ms")
+    boot_cycles = round((t_handoff - t_reset) / CLK_PERIOD_NS)
+    record_metric("boot_cycles", boot_cycles)
+    return boot_cycles
 
 ###############################################################################
 # Debug-driven tests
@@ -402,6 +649,30 @@ async def test_twd_idcode(dut):
     cocotb.log.info(f"IDCODE = {idcode:08x}")
     assert idcode == 0x00280035
 
+@cocotb.test()
+async def test_twd_pipelined_traffic(dut):
+    """Run a batch of writes and reads against the TWD emulator, pipelined
+    and polled, and count the bits shifted."""
+    traffic = {}
+    for pipelined in (True, False):
+        transport = EmulatorTransport(TWDEmulator())
+        conn = TWD(transport, pipelined, log=cocotb.log)
+        await conn.connect()
+        bits, round_trips = transport.bits, transport.round_trips
+        for i in range(8):
+            conn.queue_write(0x10, i)
+        for i in range(8):
+            conn.queue_write(0x40 + i, i * 0x01010101)
+        reads = [conn.queue_read(0x40 + i) for i in range(8)]
+        await conn.flush()
+        assert [r.value for r in reads] == [i * 0x01010101 for i in range(8)]
+        traffic[pipelined] = (transport.bits - bits, transport.round_trips - round_trips)
+        cocotb.log.info(f"pipelined={pipelined}: {traffic[pipelined][0]} bits, "
+            f"{traffic[pipelined][1]} round trips")
+    # Each posted write saves an R_STAT (16 bits), and the batch costs one
+    # R_CSR (44 bits)
+    assert traffic[True] == (traffic[False][0] - 16 * 16 + 44, 1)
+
 @cocotb.test()
 async def test_debug_archid(dut):
     """Connect to RISC-V core 0 and check marchid and misa CSRs"""
@@ -443,6 +714,30 @@ async def test_debug_hart_ids(dut):
         cocotb.log.info(f"mhartid = {mhartid:08x}")
         assert mhartid == hart
 
+@cocotb.test()
+async def test_debug_snapshot_diff(dut):
+    """Snapshot core 0 before and after writing a GPR and a CSR, and check
+    that the diff shows just those"""
+    await start_up(dut)
+    await rvdebug_init(dut)
+    await rvdebug_select_hart(dut, 0)
+    await rvdebug_halt(dut)
+    # GPRs aren't reset
+    await debug_links[dut].run_commands([gpr_write_step(gpr, 0) for gpr in range(1, 32)])
+    before = await rvdebug_snapshot(dut)
+    cocotb.log.info(f"Before:\n{rvdebug_format_snapshot(before)}")
+    assert None not in before.values()
+    await rvdebug_put_gpr(dut, 9, 0x12345678)
+    assert await rvdebug_put_csr(dut, CSR_MEPC, 0x2468ace0)
+    after = await rvdebug_snapshot(dut)
+    diff = rvdebug_snapshot_diff(before, after)
+    cocotb.log.info(f"Diff:\n{rvdebug_format_snapshot_diff(diff)}")
+    # mip follows the interrupt inputs, even while halted
+    assert [d for d in diff if d[0] != "mip"] == [
+        ("s1", 0, 0x12345678),
+        ("mepc", before["mepc"], 0x2468ace0),
+    ]
+
 @cocotb.test()
 async def test_iram_smoke(dut):
     """Smoke test for IWRAM (cover all four banks with 32-bit read/write)"""
@@ -474,9 +769,9 @@ async def test_cross_apu_cpu_mem(dut):
     """Check APU and CPU can see each other's writes to APU memory"""
     await start_up(dut)
     await rvdebug_init(dut)
+    await rvdebug_halt_harts(dut, [0, 1])
     for i in range(2):
         await rvdebug_select_hart(dut, i)
-        await rvdebug_halt(dut)
         await rvdebug_put_gpr(dut, 8, 0)
         await rvdebug_put_gpr(dut, 9, 0)
 
@@ -502,14 +797,11 @@ async def test_riscv_soft_irq(dut):
     await start_up(dut)
     cocotb.log.info(f"Initialising debug")
     await rvdebug_init(dut)
-    await rvdebug_select_hart(dut, 0)
-    await rvdebug_halt(dut)
-    await rvdebug_put_gpr(dut, 8, 0)
-    await rvdebug_put_gpr(dut, 9, 0)
-    await rvdebug_select_hart(dut, 1)
-    await rvdebug_halt(dut)
-    await rvdebug_put_gpr(dut, 8, 0)
-    await rvdebug_put_gpr(dut, 9, 0)
+    await rvdebug_halt_harts(dut, [0, 1])
+    for i in range(2):
+        await rvdebug_select_hart(dut, i)
+        await rvdebug_put_gpr(dut, 8, 0)
+        await rvdebug_put_gpr(dut, 9, 0)
 
     for irq_mask in range(4):
         irq_apu = (irq_mask >> 1) & 1
@@ -520,10 +812,14 @@ async def test_riscv_soft_irq(dut):
         await rvdebug_select_hart(dut, 0)
         mip = await rvdebug_get_csr(dut, CSR_MIP)
         cocotb.log.info(f"CPU mip = {mip:08x}")
+        if ((mip >> 3) & 0x1) != irq_cpu:
+            cocotb.log.error(f"CPU state:\n{rvdebug_format_snapshot(await rvdebug_snapshot(dut))}")
         assert ((mip >> 3) & 0x1) == irq_cpu
         await rvdebug_select_hart(dut, 1)
         mip = await rvdebug_get_csr(dut, CSR_MIP)
         cocotb.log.info(f"APU mip = {mip:08x}")
+        if ((mip >> 3) & 0x1) != irq_apu:
+            cocotb.log.error(f"APU state:\n{rvdebug_format_snapshot(await rvdebug_snapshot(dut))}")
         assert ((mip >> 3) & 0x1) == irq_apu
 
 
@@ -794,8 +1090,7 @@ expected_lcd_capture = {
 ###############################################################################
 # Execution-driven tests
 
-@cocotb.test()
-@cocotb.parametrize(app=[
+EXECUTE_ERAM_APPS = [
     "hellow",
     "start_apu",
     "byte_strobe",
@@ -815,22 +1110,16 @@ expected_lcd_capture = {
     "spi_stream_pause",
     "apu_timer_smoke",
     "riscv_mtime_smoke",
-])
+]
+
+@cocotb.test()
+@cocotb.parametrize(app=EXECUTE_ERAM_APPS)
 async def test_execute_eram(dut, app="hellow"):
     """Execute code from ERAM"""
     cocotb.log.info(f"Application: {app}")
     assert app in expected_outputs or app in expected_lcd_capture, f"Missing test signature for {app}"
 
-    swtest_dir = Path(__file__).resolve().parent.parent / "software/tests/eram"
-    rc = subprocess.run(["make", "-C", swtest_dir, f"APP={app}"])
-    assert rc.returncode == 0
-    with open(swtest_dir / f"build/{app}.bin", "rb") as f:
-        prog_bytes = f.read()
-    cocotb.log.info(f"Program size = {len(prog_bytes)}")
-    prog_hwords = list(w[0] for w in struct.iter_unpack("<h", prog_bytes))
-    for i, hword in enumerate(prog_hwords):
-        dut.eram_u.mem[i].value = hword
-        dut.eram_u.mem[i].value = Release()
+    load_eram(dut, build_app("eram", app))
 
     # Test pattern at start of flash
     for i in range(256):
@@ -849,36 +1138,9 @@ async def test_execute_eram(dut, app="hellow"):
         dut.lcd_bus_width.value = "parallel" in app
 
     await rvdebug_init(dut)
-    await rvdebug_halt(dut)
-    await rvdebug_put_gpr(dut, 8, 0)
-    await rvdebug_put_csr(dut, CSR_DPC, ERAM_BASE)
-    cocotb.log.info(f"Resuming at {ERAM_BASE:x}")
-    await rvdebug_resume(dut)
-
-    vuart_stdout = []
-    def test_done():
-        if len(vuart_stdout) < 6:
-            return False
-        endstr = "".join(vuart_stdout[-6:])
-        if endstr == "!TPASS":
-            return True
-        if endstr == "!TFAIL":
-            return True
-        return False
-
-    while not test_done():
-        c = await twd_vuart_getchar(dut, max_poll=200)
-        if c is None: break
-        sys.stdout.write(chr(c))
-        vuart_stdout.append(chr(c))
+    await rvdebug_start_at(dut, ERAM_BASE)
 
-    sys.stdout.write("\n")
-    vuart_stdout = "".join(vuart_stdout)
-
-    assert vuart_stdout.endswith("!TPASS")
-    vuart_stdout = vuart_stdout[:-6]
-
-    cocotb.log.info(f"Processor standard output:\n\n{vuart_stdout}\n")
+    vuart_stdout = await vuart_read_until_done(dut, max_poll=200)
     if app in expected_outputs:
         assert vuart_stdout.strip() == expected_outputs[app], f"Did not match expected output:\n{expected_outputs[app]}"
 
@@ -893,121 +1155,953 @@ async def test_execute_eram(dut, app="hellow"):
             for b in expected_lcd_capture[app]: print(f"{b:03x}")
         assert lcd_capture == expected_lcd_capture[app]
 
-@cocotb.test()
-@cocotb.parametrize(app=[
+EXECUTE_IRAM_APPS = [
     "hellow",
     "start_apu",
     "byte_strobe",
-])
+]
+
+@cocotb.test()
+@cocotb.parametrize(app=EXECUTE_IRAM_APPS)
 async def test_execute_iram(dut, app="hellow"):
     """Execute code from IRAM"""
     assert app in expected_outputs
-    swtest_dir = Path(__file__).resolve().parent.parent / "software/tests/iram"
-    rc = subprocess.run(["make", "-C", swtest_dir, f"APP={app}"])
-    assert rc.returncode == 0
-    with open(swtest_dir / f"build/{app}.bin", "rb") as f:
-        prog_bytes = f.read()
-    cocotb.log.info(f"Program size = {len(prog_bytes)}")
-    prog_words = list(w[0] for w in struct.iter_unpack("<l", prog_bytes))
-    for i, word in enumerate(prog_words):
-        y = i // 512
-        row = i % 512
-        for x in range(4):
-            data = (word >> (x * 8)) & 0xff
-            dut.chip_u.i_chip_core.iram_u.sram.g_dg512.g_depth[y].g_width[x].ram_u.mem[row].value = data
-            dut.chip_u.i_chip_core.iram_u.sram.g_dg512.g_depth[y].g_width[x].ram_u.mem[row].value = Release()
+    load_iram(dut, build_app("iram", app))
 
     await start_up(dut)
     await twd_connect(dut)
 
     await rvdebug_init(dut)
-    await rvdebug_halt(dut)
-    await rvdebug_put_gpr(dut, 8, 0)
-    await rvdebug_put_csr(dut, CSR_DPC, IRAM_BASE)
-    cocotb.log.info(f"Resuming at {IRAM_BASE:x}")
-    await rvdebug_resume(dut)
-
-    vuart_stdout = []
-    def test_done():
-        if len(vuart_stdout) < 6:
-            return False
-        endstr = "".join(vuart_stdout[-6:])
-        if endstr == "!TPASS":
-            return True
-        if endstr == "!TFAIL":
-            return True
-        return False
-
-    while not test_done():
-        c = await twd_vuart_getchar(dut, max_poll=10)
-        if c is None: break
-        sys.stdout.write(chr(c))
-        vuart_stdout.append(chr(c))
-
-    sys.stdout.write("\n")
-    vuart_stdout = "".join(vuart_stdout)
+    await rvdebug_start_at(dut, IRAM_BASE)
 
-    assert vuart_stdout.endswith("!TPASS")
-    vuart_stdout = vuart_stdout[:-6]
-
-    cocotb.log.info(f"Processor standard output:\n\n{vuart_stdout}\n")
+    vuart_stdout = await vuart_read_until_done(dut, max_poll=10)
     assert vuart_stdout.strip() == expected_outputs[app], f"Did not match expected output:\n{expected_outputs[app]}"
 
 # Just one of these because after the bootrom runs it's just IRAM execution.
-@cocotb.test()
-@cocotb.parametrize(app=[
+EXECUTE_FLASH_APPS = [
     "hellow"
-])
+]
+
+@cocotb.test()
+@cocotb.parametrize(app=EXECUTE_FLASH_APPS)
 async def test_execute_flash(dut, app="hellow"):
     """Run bootrom, with code loaded into flash. ROM should load code into IRAM then run it."""
-    swtest_dir = Path(__file__).resolve().parent.parent / "software/tests/flash"
-    rc = subprocess.run(["make", "-C", swtest_dir, f"APP={app}"])
-    assert rc.returncode == 0
-    with open(swtest_dir / f"build/{app}.padded.bin", "rb") as f:
-        prog_bytes = f.read()
-    cocotb.log.info(f"Program size = {len(prog_bytes)}")
-    for i, b in enumerate(prog_bytes):
-        dut.flash_u.mem[i].value = b
-        dut.flash_u.mem[i].value = Release()
+    load_flash(dut, build_app("flash", app, ".padded.bin"))
+
+    boot_cycles = await boot_from_flash(dut)
+    cocotb.log.info(f"Boot took {boot_cycles} cycles ({boot_cycles * CLK_PERIOD_NS / 1000:.1f} us)")
+    await twd_connect(dut)
+
+    vuart_stdout = await vuart_read_until_done(dut, max_poll=100)
+    if app == "hellow":
+        assert vuart_stdout == "Hello, world!\r\n"
+
+# The execution-driven tests depend on nothing but the simulation sources,
+# one firmware image and their expected output, so their passes are cached
+# by the results cache (results_cache.py) in __main__: test: (software/tests
+# target, apps, image suffix)
+EXECUTE_TESTS = {
+    "test_execute_eram":  ("eram", EXECUTE_ERAM_APPS, ".bin"),
+    "test_execute_iram":  ("iram", EXECUTE_IRAM_APPS, ".bin"),
+    "test_execute_flash": ("flash", EXECUTE_FLASH_APPS, ".padded.bin"),
+}
+
+# Testbench modules whose changes invalidate cached results
+TESTBENCH_MODULES = [Path(__file__).resolve().parent / f
+    for f in ("chip_top_tb.py", "twd.py", "rvdebug.py", "busmon.py", "timing_history.py")]
+
+def execute_test_fingerprints(test_filter=None):
+    """Return {test name: fingerprint} for the test_execute_* tests selected
+    by test_filter. Builds their firmware."""
+    import results_cache
+    sources, defines, includes = get_sources_defines_includes()
+    build = results_cache.build_fingerprint(sim, sources, defines, includes)
+    fingerprints = {}
+    for test, (target, apps, suffix) in EXECUTE_TESTS.items():
+        test_source = results_cache.function_source(__file__, test)
+        names = {results_cache.param_test_name(test, app=app): app for app in apps}
+        for name in results_cache.selected(names, test_filter):
+            app = names[name]
+            expected = [expected_outputs.get(app), expected_lcd_capture.get(app)]
+            fingerprints[name] = results_cache.test_fingerprint(build,
+                make_app(target, app, suffix, quiet=True), test_source, expected, TESTBENCH_MODULES)
+    return fingerprints
+
+###############################################################################
+# Benchmarks
+
+bench_dir = Path(__file__).resolve().parent / "bench_results"
+
+# Must match software/include/bench.h
+BENCH_CPU_KERNELS = {
+    0:  "overhead",
+    1:  "crc16",
+    2:  "matmul",
+    3:  "sort",
+    4:  "state",
+    5:  "memcpy_eram",
+    6:  "memcpy_iram",
+    7:  "memcpy_eram_to_iram",
+    8:  "memset_eram",
+    9:  "memset_iram",
+    10: "softirq",
+}
+BENCH_MARK_END  = 1 << 8
+BENCH_MARK_DONE = 0xff
+
+async def rvdebug_wait_halted(dut, poll_us=10):
+    while True:
+        stat = await twd_read_bus(dut, DM_DMSTATUS)
+        if stat & DM_DMSTATUS_ALLHALTED:
+            return
+        await Timer(poll_us, "us")
+
+async def hart_run_cycles(dut, counter, hart=0):
+    """Count cycles during which the hart is not halted in Debug mode, into
+    counter["cycles"]. The CPU is configured without mcycle/minstret
+    (CSR_COUNTER=0), so this stands in for mcycle with dcsr.stopcount set.
+    RTL only, as it probes the debug module's hart status."""
+    halted = dut.chip_u.i_chip_core.dbg_halted
+    counter["cycles"] = 0
+    while True:
+        await RisingEdge(dut.CLK)
+        if halted.value[hart] == 0:
+            counter["cycles"] += 1
+
+async def bench_collect_marks(dut, counter):
+    """Resume the selected (halted) hart, and service its bench_mark() ebreaks
+    until it reaches BENCH_MARK_DONE. Return {kernel id: cycles} between each
+    start/end mark pair, from a hart_run_cycles() counter. The hart is left
+    running."""
+    results = {}
+    start = {}
+    while True:
+        await rvdebug_resume(dut)
+        await rvdebug_wait_halted(dut)
+        mark = await rvdebug_get_gpr(dut, 10)
+        if mark != BENCH_MARK_DONE:
+            kernel = mark & ~BENCH_MARK_END
+            if mark & BENCH_MARK_END:
+                results[kernel] = counter["cycles"] - start.pop(kernel)
+            else:
+                start[kernel] = counter["cycles"]
+        # Step over the ebreak
+        dpc = await rvdebug_get_csr(dut, CSR_DPC)
+        await rvdebug_put_csr(dut, CSR_DPC, dpc + 4)
+        if mark == BENCH_MARK_DONE:
+            await rvdebug_resume(dut)
+            return results
+
+def bench_write_cpu_results(target, rows):
+    """Save one target's results, then rewrite the combined CSV table with
+    the ERAM-vs-IRAM slowdown for each kernel which has both."""
+    bench_dir.mkdir(exist_ok=True)
+    with open(bench_dir / f"cpu_{target}.json", "w") as f:
+        json.dump(rows, f, indent=2)
+    tables = {}
+    for t in ("eram", "iram"):
+        if (bench_dir / f"cpu_{t}.json").exists():
+            with open(bench_dir / f"cpu_{t}.json") as f:
+                tables[t] = json.load(f)
+    with open(bench_dir / "cpu.csv", "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["target", "kernel", "cycles", "slowdown_vs_iram"])
+        for t, trows in tables.items():
+            for kernel, r in trows.items():
+                iram = tables.get("iram", {}).get(kernel)
+                slowdown = f"{r['cycles'] / iram['cycles']:.3f}" if iram and iram["cycles"] else ""
+                w.writerow([t, kernel, r["cycles"], slowdown])
+
+@cocotb.test(skip=not bench or gl)
+@cocotb.parametrize(target=["eram", "iram"])
+async def test_benchmark_cpu(dut, target="eram"):
+    """Time the bench_cpu kernels in CPU cycles, executing from ERAM or IRAM.
+    Results go to bench_results/cpu.csv."""
+    prog_bytes = build_app(target, "bench_cpu")
+    if target == "eram":
+        load_eram(dut, prog_bytes)
+        entry = ERAM_BASE
+    else:
+        load_iram(dut, prog_bytes)
+        entry = IRAM_BASE
 
     await start_up(dut)
+    await rvdebug_init(dut)
+    await rvdebug_halt(dut)
+    await rvdebug_put_gpr(dut, 8, 0)
+    dcsr = await rvdebug_get_csr(dut, CSR_DCSR)
+    await rvdebug_put_csr(dut, CSR_DCSR, dcsr | DCSR_EBREAKM)
+    await rvdebug_put_csr(dut, CSR_DPC, entry)
+
+    counter = {}
+    counter_task = cocotb.start_soon(hart_run_cycles(dut, counter))
+    marks = await bench_collect_marks(dut, counter)
+    counter_task.cancel()
+    vuart_stdout = await vuart_read_until_done(dut, max_poll=200)
+
+    overhead_cycles = marks.pop(0)
+    rows = {BENCH_CPU_KERNELS[k]: {"cycles": c - overhead_cycles} for k, c in sorted(marks.items())}
+    rows["overhead"] = {"cycles": overhead_cycles}
+
+    cocotb.log.info(f"{'Kernel':<20} {'Cycles':>8}")
+    for kernel, r in rows.items():
+        cocotb.log.info(f"{kernel:<20} {r['cycles']:>8}")
+    bench_write_cpu_results(target, rows)
+    assert set(rows) == set(BENCH_CPU_KERNELS.values())
+    assert vuart_stdout.startswith("Check ")
+
+# Must match software/tests/eram/bench_ppu.c
+BENCH_PPU_SCENE_ADDR = 0x30000
+BENCH_PPU_WIDTH      = 320
+BENCH_PPU_HEIGHT     = 16
+
+# Scene name: (sprites per line, tile layers)
+BENCH_PPU_SCENES = {
+    "fill":      (0, 0),
+    "sprites4":  (4, 0),
+    "sprites16": (16, 0),
+    "sprites32": (32, 0),
+    "tiles1":    (0, 1),
+    "tiles2":    (0, 2),
+    "mixed":     (16, 2),
+}
+
+async def ppu_monitor(dut, n_lines):
+    """Watch the PPU scanout and memory interfaces for two frames of n_lines.
+
+    During the first frame (scanout disabled) act as an infinitely fast
+    display: release each scanline buffer as soon as it is presented, so the
+    PPU never waits for a free buffer and the interval between buffers is its
+    render time. During the second frame just watch the display controller.
+
+    Return one dict per scanline: "t" (cycle at which the line was presented
+    in frame 0, or released in frame 1), "mem_fetch" and "mem_stall" (PPU
+    memory address handshakes, and cycles stalled waiting for the bus), and
+    "starved" (cycles with no buffer ready for the display, frame 1 only)."""
+    core = dut.chip_u.i_chip_core
+    release = core.ppu_scanout_buf_release
+    lines = []
+    cur = {"mem_fetch": 0, "mem_stall": 0, "starved": 0}
+    t = 0
+    forcing = False
+    holdoff = 0
+    while len(lines) < 2 * n_lines:
+        await RisingEdge(dut.CLK)
+        t += 1
+        if forcing:
+            release.value = Release()
+            forcing = False
+            # buf_rdy sampled on this edge still reflects the old buffer
+            holdoff = 1
+        if core.ppu_mem_addr_vld.value == 1:
+            if core.ppu_mem_addr_rdy.value == 1:
+                cur["mem_fetch"] += 1
+            else:
+                cur["mem_stall"] += 1
+        buf_rdy = core.ppu_scanout_buf_rdy.value == 1
+        end_of_line = False
+        if len(lines) < n_lines:
+            if holdoff:
+                holdoff -= 1
+            elif buf_rdy:
+                release.value = Force(1)
+                forcing = True
+                end_of_line = True
+        else:
+            if not buf_rdy:
+                cur["starved"] += 1
+            end_of_line = release.value == 1
+        if end_of_line:
+            lines.append({"t": t, **cur})
+            cur = {"mem_fetch": 0, "mem_stall": 0, "starved": 0}
+    return lines
+
+def bench_ppu_summarise(lines, n_lines):
+    """Reduce per-line monitor records to per-scene figures. The first line
+    of each frame is dropped, as its interval includes the frame setup."""
+    frame0 = lines[:n_lines]
+    frame1 = lines[n_lines:]
+    render = [b["t"] - a["t"] for a, b in zip(frame0, frame0[1:])]
+    budget = [b["t"] - a["t"] - b["starved"] for a, b in zip(frame1, frame1[1:])]
+    budget_cycles = sorted(budget)[len(budget) // 2]
+    return {
+        "render_cycles_mean": sum(render) / len(render),
+        "render_cycles_max": max(render),
+        "budget_cycles": budget_cycles,
+        "headroom_cycles": budget_cycles - max(render),
+        "headroom_pct": 100.0 * (budget_cycles - max(render)) / budget_cycles,
+        "mem_fetch_per_line": sum(l["mem_fetch"] for l in frame0[1:]) / len(render),
+        "mem_stall_per_line": sum(l["mem_stall"] for l in frame0[1:]) / len(render),
+        "underrun_cycles": sum(l["starved"] for l in frame1[1:]),
+    }
+
+def bench_ppu_limits(scenes):
+    """Estimate how many sprites and tile layers fit in one line budget, from
+    the marginal cost of the largest sprite-only and tile-only scenes over the
+    fill-only scene. Return {contention: {...}}."""
+    limits = {}
+    for contention in (False, True):
+        suffix = "_contended" if contention else ""
+        base = scenes.get("fill" + suffix)
+        if base is None:
+            continue
+        spare = base["budget_cycles"] - base["render_cycles_max"]
+        lim = {}
+        for kind, index in (("sprites", 0), ("tile_layers", 1)):
+            runs = [(BENCH_PPU_SCENES[name][index], scenes[name + suffix]) for name, objs in BENCH_PPU_SCENES.items()
+                if objs[index] and not objs[1 - index] and name + suffix in scenes]
+            if not runs:
+                continue
+            n, r = max(runs, key=lambda x: x[0])
+            cost = (r["render_cycles_max"] - base["render_cycles_max"]) / n
+            lim[f"cycles_per_{kind[:-1]}"] = cost
+            lim[f"max_{kind}"] = int(spare // cost) if cost > 0 else None
+        limits["contended" if contention else "idle"] = lim
+    return limits
+
+def bench_write_ppu_results(name, row):
+    bench_dir.mkdir(exist_ok=True)
+    path = bench_dir / "ppu.json"
+    scenes = {}
+    if path.exists():
+        with open(path) as f:
+            scenes = json.load(f)["scenes"]
+    scenes[name] = row
+    limits = bench_ppu_limits(scenes)
+    with open(path, "w") as f:
+        json.dump({"scenes": scenes, "limits": limits}, f, indent=2)
+    with open(bench_dir / "ppu.csv", "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["scene"] + list(row))
+        for scene, r in scenes.items():
+            w.writerow([scene] + [f"{v:.1f}" if isinstance(v, float) else v for v in r.values()])
+    return limits
+
+@cocotb.test(skip=not bench or gl)
+@cocotb.parametrize(scene=list(BENCH_PPU_SCENES), contention=[False, True])
+async def test_benchmark_ppu(dut, scene="fill", contention=False):
+    """Measure PPU render cycles per scanline for a synthetic scene, against
+    the display controller's line budget, optionally with the CPU contending
+    for ERAM. Results go to bench_results/ppu.csv."""
+    n_sprites, n_tile_layers = BENCH_PPU_SCENES[scene]
+    load_eram(dut, build_app("eram", "bench_ppu"))
+    load_eram(dut, struct.pack("<5I", BENCH_PPU_WIDTH, BENCH_PPU_HEIGHT,
+        n_sprites, n_tile_layers, int(contention)), BENCH_PPU_SCENE_ADDR)
+
+    await start_up(dut)
+    monitor = cocotb.start_soon(ppu_monitor(dut, BENCH_PPU_HEIGHT))
+    await rvdebug_init(dut)
+    await rvdebug_start_at(dut, ERAM_BASE)
+    await vuart_read_until_done(dut, max_poll=500)
+    assert monitor.done(), "Did not see two full frames on the scanout interface"
+
+    row = {"sprites": n_sprites, "tile_layers": n_tile_layers, "contention": int(contention),
+        **bench_ppu_summarise(monitor.result(), BENCH_PPU_HEIGHT)}
+    name = scene + ("_contended" if contention else "")
+    for k, v in row.items():
+        cocotb.log.info(f"{name}: {k} = {v:.1f}" if isinstance(v, float) else f"{name}: {k} = {v}")
+    limits = bench_write_ppu_results(name, row)
+    for load, lim in limits.items():
+        cocotb.log.info(f"Estimated limits ({load}): {lim}")
+
+async def spi_csn_monitor(dut, times):
+    """Record the first falling and last rising edge (ns) of flash CSn into
+    times["first_fall"] and times["last_rise"]."""
+    csn_prev = None
+    while True:
+        await Edge(dut.GPIO)
+        csn = dut.GPIO.value[GPIO_FLASH_CSN]
+        if csn == 0 and csn_prev == 1 and "first_fall" not in times:
+            times["first_fall"] = get_sim_time("ns")
+        elif csn == 1 and csn_prev == 0:
+            times["last_rise"] = get_sim_time("ns")
+        csn_prev = csn
+
+@cocotb.test(skip=not bench)
+async def test_benchmark_boot(dut):
+    """Boot hellow from flash, padded to BOOT_IMAGE_SIZE (default 1024, which
+    must match the bootrom in the build), and record the boot time and the
+    flash load time. Run across bootrom variants by boot_bench.py."""
+    size = int(os.getenv("BOOT_IMAGE_SIZE", 1024))
+    load_flash(dut, flash_image(build_app("flash", "hellow"), size))
+    times = {}
+    csn_task = cocotb.start_soon(spi_csn_monitor(dut, times))
+    boot_cycles = await boot_from_flash(dut)
+    csn_task.cancel()
+
+    load_cycles = round((times["last_rise"] - times["first_fall"]) / CLK_PERIOD_NS)
+    record_metric("flash_load_cycles", load_cycles)
+    mbyte_per_s = size / (load_cycles * CLK_PERIOD_NS * 1e-3)
+    cocotb.log.info(f"Boot {boot_cycles} cycles, flash load {load_cycles} cycles, {mbyte_per_s:.2f} MB/s")
+
     await twd_connect(dut)
+    vuart_stdout = await vuart_read_until_done(dut, max_poll=100)
+    assert vuart_stdout == "Hello, world!\r\n"
+
+# Must match software/tests/eram/spi_stream_sweep.c
+SWEEP_TABLE_ADDR = 0x30000
+SWEEP_RUN_GAP_US = 100
+
+def spi_stream_sweep_runs():
+    """Return (clkdiv, n_words, consumer_delay_us, pause_every, pause_us) for
+    each run of the sweep. Pauses must be well under SWEEP_RUN_GAP_US."""
+    runs = []
+    for clkdiv in (2, 4, 8, 16):
+        for n_words in (4, 64):
+            for consumer_delay_us in (0, 2):
+                runs.append((clkdiv, n_words, consumer_delay_us, 0, 0))
+    for pause_every in (4, 16):
+        runs.append((4, 64, 0, pause_every, 5))
+    return runs
+
+async def spi_pin_monitor(dut, segments):
+    """Append {"fall", "rise", "bits"} to segments for every flash chip select
+    assertion: the CSn edge times (ns) and the number of SCK rising edges."""
+    csn_prev = None
+    sck_prev = None
+    seg = None
+    while True:
+        await Edge(dut.GPIO)
+        csn = dut.GPIO.value[GPIO_FLASH_CSN]
+        sck = dut.GPIO.value[GPIO_FLASH_SCK]
+        if csn == 0 and csn_prev == 1:
+            seg = {"fall": get_sim_time("ns"), "bits": 0}
+        elif csn == 1 and csn_prev == 0 and seg is not None:
+            seg["rise"] = get_sim_time("ns")
+            segments.append(seg)
+            seg = None
+        elif seg is not None and sck == 1 and sck_prev == 0:
+            seg["bits"] += 1
+        csn_prev = csn
+        sck_prev = sck
+
+def spi_stream_sweep_results(runs, segments):
+    """Group CSn segments into runs (split on gaps of more than half the
+    firmware's run gap), and return one result dict per run."""
+    groups = []
+    for seg in segments:
+        if not groups or seg["fall"] - groups[-1][-1]["rise"] > SWEEP_RUN_GAP_US * 500:
+            groups.append([])
+        groups[-1].append(seg)
+    assert len(groups) == len(runs), f"Expected {len(runs)} runs on the SPI pins, saw {len(groups)}"
+    results = []
+    for (clkdiv, n_words, consumer_delay_us, pause_every, pause_us), group in zip(runs, groups):
+        window = (group[-1]["rise"] - group[0]["fall"]) / CLK_PERIOD_NS
+        low = sum(seg["rise"] - seg["fall"] for seg in group) / CLK_PERIOD_NS
+        bits = sum(seg["bits"] for seg in group)
+        results.append({
+            "clkdiv": clkdiv,
+            "words": n_words,
+            "consumer_delay_us": consumer_delay_us,
+            "pause_every": pause_every,
+            "pause_us": pause_us,
+            "cycles": round(window),
+            "bytes_per_cycle": 4 * n_words / window,
+            "ideal_bytes_per_cycle": 1 / (8 * clkdiv),
+            # CSn low but SCK stopped, i.e. waiting for FIFO space, plus
+            # state machine overhead
+            "stall_cycles": round(low - bits * clkdiv),
+            "paused_cycles": round(window - low),
+            "overhead_bits": bits - 32 * n_words,
+        })
+    return results
+
+@cocotb.test(skip=not bench)
+async def test_spi_stream_sweep(dut):
+    """Sweep spi_stream clock divider, transfer length, consumer speed and
+    pause pattern, measuring sustained throughput and stalls on the SPI pins.
+    Results go to bench_results/spi_stream.csv."""
+    runs = spi_stream_sweep_runs()
+    table = [len(runs)] + [x for run in runs for x in run]
+    flash_data = bytes((i * 37 + 11) & 0xff for i in range(4 * max(r[1] for r in runs)))
+    expected_sum = sum(sum(w for (w,) in struct.iter_unpack("<I", flash_data[:4 * r[1]])) for r in runs) & 0xffffffff
+
+    load_eram(dut, build_app("eram", "spi_stream_sweep"))
+    load_eram(dut, struct.pack(f"<{len(table)}I", *table), SWEEP_TABLE_ADDR)
+    load_flash(dut, flash_data)
 
-    vuart_stdout = []
-    def test_done():
-        if len(vuart_stdout) < 6:
-            return False
-        endstr = "".join(vuart_stdout[-6:])
-        if endstr == "!TPASS":
-            return True
-        if endstr == "!TFAIL":
-            return True
-        return False
+    await start_up(dut)
+    segments = []
+    monitor = cocotb.start_soon(spi_pin_monitor(dut, segments))
+    await rvdebug_init(dut)
+    await rvdebug_start_at(dut, ERAM_BASE)
+    vuart_stdout = await vuart_read_until_done(dut, max_poll=500)
+    monitor.cancel()
+    assert vuart_stdout.strip() == f"Sum {expected_sum:08x}"
+
+    results = spi_stream_sweep_results(runs, segments)
+    cocotb.log.info(f"{'Div':>3} {'Words':>5} {'Delay':>5} {'Pause':>5} {'Cycles':>7} "
+        f"{'B/cyc':>6} {'Ideal':>6} {'Stall':>6} {'Paused':>6}")
+    for r in results:
+        cocotb.log.info(f"{r['clkdiv']:>3} {r['words']:>5} {r['consumer_delay_us']:>5} {r['pause_every']:>5} "
+            f"{r['cycles']:>7} {r['bytes_per_cycle']:>6.4f} {r['ideal_bytes_per_cycle']:>6.4f} "
+            f"{r['stall_cycles']:>6} {r['paused_cycles']:>6}")
+    bench_dir.mkdir(exist_ok=True)
+    with open(bench_dir / "spi_stream.csv", "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=list(results[0]))
+        w.writeheader()
+        w.writerows(results)
+
+# Must match software/tests/eram/apu_tone.c
+AUDIO_TONE_HZ = 1000
+
+async def audio_monitor(dut, capture, duration_ns, chunk_edges=1 << 16):
+    """Record edges on the AUDIO pin as (clock cycle, level) and feed them to
+    capture (an audio_capture.AudioCapture) a chunk at a time, until the first
+    edge after duration_ns from now. Only one chunk is held in memory."""
+    end = get_sim_time("ns") + duration_ns
+    times = []
+    levels = []
+    while True:
+        await Edge(dut.AUDIO)
+        now = get_sim_time("ns")
+        times.append(round(now / CLK_PERIOD_NS))
+        levels.append(1 if dut.AUDIO.value == 1 else 0)
+        if len(times) >= chunk_edges or now >= end:
+            capture.process_edges(times, levels)
+            times = []
+            levels = []
+        if now >= end:
+            break
 
-    for i in range(5):
-        cocotb.log.info(f"Waiting {i} ms")
-        await Timer(1, "ms")
+@cocotb.test(skip=not bench)
+async def test_audio_capture(dut):
+    """Play a 1 kHz tone through the APU audio output, decimate the AUDIO pin
+    to 48 kSa/s PCM as the simulation runs, and report the tone's SNR.
+    Capture length in AUDIO_CAPTURE_MS (default 10). Results go to
+    bench_results/audio.wav and audio.json."""
+    from audio_capture import AudioCapture, RATE, tone_snr
+    capture_ms = float(os.getenv("AUDIO_CAPTURE_MS", 10))
+    # Skip the filter and FIFO startup transients
+    settle_ms = 2
+    assert capture_ms > 2 * settle_ms
+
+    load_eram(dut, build_app("eram", "apu_tone"))
+    await start_up(dut)
+    await rvdebug_init(dut)
+    await rvdebug_start_at(dut, ERAM_BASE)
+
+    bench_dir.mkdir(exist_ok=True)
+    capture = AudioCapture(bench_dir / "audio.wav",
+        tail_samples=int((capture_ms - settle_ms) * 1e-3 * RATE))
+    try:
+        # The PWM toggles every 16 cycles except at full scale
+        await with_timeout(audio_monitor(dut, capture, capture_ms * 1e6), capture_ms + 1, "ms")
+    finally:
+        capture.close()
+
+    snr = tone_snr(capture.tail, capture.rate, AUDIO_TONE_HZ)
+    cocotb.log.info(f"Captured {capture.n_samples} samples at {capture.rate} Sa/s, "
+        f"{AUDIO_TONE_HZ} Hz tone SNR {snr:.1f} dB")
+    with open(bench_dir / "audio.json", "w") as f:
+        json.dump({"rate": capture.rate, "samples": capture.n_samples, "tone_hz": AUDIO_TONE_HZ,
+            "snr_db": snr}, f, indent=2)
+    # A model of apu_sdm.v gives ~53 dB for this tone and capture length; a
+    # broken pipeline (wrong rate, stuck output, clipping) does much worse.
+    assert snr > 40
 
-    while not test_done():
-        c = await twd_vuart_getchar(dut, max_poll=100)
-        if c is None: break
-        sys.stdout.write(chr(c))
-        vuart_stdout.append(chr(c))
+###############################################################################
+# Interrupt latency
+
+# Must match software/tests/eram/irq_latency.c
+IRQ_LATENCY_CONFIG_ADDR = 0x30000
+IRQ_LATENCY_SOURCES = {"softirq": 0, "timer_cpu": 1, "timer_apu": 2}
+IRQ_LATENCY_LOAD = 1 << 8
+IRQ_LATENCY_TIMEOUT = 10000
+
+# Offsets in __vector_table (software/common/crt0_eram.S)
+VECTOR_SOFTIRQ = 12
+VECTOR_EXTERNAL = 44
+
+def app_symbols(target, app):
+    """Return {name: address} for the symbols of an app built by build_app()."""
+    elf = swtest_root / target / f"build/{app}.elf"
+    nm = subprocess.run(["riscv32-unknown-elf-nm", elf], capture_output=True, text=True, check=True)
+    symbols = {}
+    for line in nm.stdout.splitlines():
+        fields = line.split()
+        if len(fields) == 3:
+            symbols[fields[2]] = int(fields[0], 16)
+    return symbols
+
+def ahb_write_to(bus, addr, mask):
+    """Return a function which is true on cycles with an AHB write address
+    phase to addr (compared under mask) on the bus with prefix cpu_h*."""
+    def f():
+        return (bus.cpu_htrans.value[1] == 1 and bus.cpu_hready.value == 1 and
+            bus.cpu_hwrite.value == 1 and int(bus.cpu_haddr.value) & mask == addr & mask)
+    return f
+
+def rising(signal):
+    """Return a function which is true on cycles where signal has just risen."""
+    prev = [1]
+    def f():
+        v = int(signal.value)
+        r = v and not prev[0]
+        prev[0] = v
+        return r
+    return f
+
+async def irq_latency_monitor(dut, start, bus, mask, stages, samples):
+    """Time IRQ entry on one hart, until cancelled. Each time start() is true
+    (an IPC write or IRQ edge), count cycles until the hart's bus (cpu_h*)
+    fetches each of stages (name, entry address) in order, and append
+    {name: cycles} to samples. Entry addresses are compared word-aligned
+    under mask. RTL only."""
+    t = None
+    stage = 0
+    cycle = 0
+    sample = {}
+    while True:
+        await RisingEdge(dut.CLK)
+        cycle += 1
+        if t is None:
+            if start():
+                t = cycle
+                stage = 0
+                sample = {}
+            continue
+        if bus.cpu_htrans.value[1] == 1 and bus.cpu_hready.value == 1 and bus.cpu_hprot.value[0] == 0:
+            name, entry = stages[stage]
+            if int(bus.cpu_haddr.value) & mask & ~3 == entry & mask & ~3:
+                sample[name] = cycle - t
+                stage += 1
+                if stage == len(stages):
+                    samples.append(sample)
+                    t = None
+                    continue
+        assert cycle - t < IRQ_LATENCY_TIMEOUT, \
+            f"No fetch from {stages[stage][0]} ({stages[stage][1]:#x}) {IRQ_LATENCY_TIMEOUT} cycles after IRQ"
+
+def irq_latency_summarise(samples):
+    """Reduce per-IRQ samples to {stage: {min, mean, max}} in cycles."""
+    stats = {}
+    for stage in samples[0]:
+        values = [s[stage] for s in samples]
+        stats[stage] = {"min": min(values), "mean": sum(values) / len(values), "max": max(values)}
+    return stats
+
+def bench_write_irq_latency_results(name, rows):
+    """Save one configuration's results, then rewrite the combined CSV table
+    from every configuration run so far."""
+    bench_dir.mkdir(exist_ok=True)
+    with open(bench_dir / f"irq_latency_{name}.json", "w") as f:
+        json.dump(rows, f, indent=2)
+    with open(bench_dir / "irq_latency.csv", "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["source", "load", "hart", "stage", "samples", "min_cycles", "mean_cycles", "max_cycles"])
+        for path in sorted(bench_dir.glob("irq_latency_*.json")):
+            with open(path) as g:
+                config = json.load(g)
+            for hart, r in config["harts"].items():
+                for stage, s in r["stats"].items():
+                    w.writerow([config["source"], config["load"], hart, stage, r["samples"],
+                        s["min"], f"{s['mean']:.1f}", s["max"]])
+
+@cocotb.test(skip=not bench or gl)
+@cocotb.parametrize(source=list(IRQ_LATENCY_SOURCES), load=["idle", "contention"])
+async def test_irq_latency(dut, source="softirq", load="idle"):
+    """Measure interrupt entry latency in cycles on the CPU and APU harts, for
+    IPC soft IRQs (from the write to softirq_set) and APU timer IRQs (from
+    the IRQ rising), with the system idle or with the PPU and CPU contending
+    for memory. Latency is to the first fetch of the trap vector (CPU, which
+    uses vectored mode) and of the handler. IRQ_LATENCY_SAMPLES IRQs per
+    hart (default 32). Results go to bench_results/irq_latency.csv."""
+    n_samples = int(os.getenv("IRQ_LATENCY_SAMPLES", 32))
+    load_eram(dut, build_app("eram", "irq_latency"))
+    load_eram(dut, struct.pack("<I", IRQ_LATENCY_SOURCES[source] |
+        (IRQ_LATENCY_LOAD if load == "contention" else 0)), IRQ_LATENCY_CONFIG_ADDR)
+    sym = app_symbols("eram", "irq_latency")
+
+    core = dut.chip_u.i_chip_core
+    apu = core.apu_u
+    apu_handler = ("handler", sym["apu_irq_handler"] - sym["apu_irq_prog"])
+    if source == "softirq":
+        # The APU replies to each soft IRQ with one to the CPU
+        monitors = {
+            "cpu": (ahb_write_to(apu, APU_IPC_SOFTIRQ_SET, 0xffff), core, 0xfffff,
+                [("vector", sym["__vector_table"] + VECTOR_SOFTIRQ), ("handler", sym["isr_machine_softirq"])]),
+            "apu": (ahb_write_to(core, APU_IPC_SOFTIRQ_SET, 0xfffff), apu, 0xffff, [apu_handler]),
+        }
+    elif source == "timer_cpu":
+        monitors = {
+            "cpu": (rising(apu.timer_irq), core, 0xfffff,
+                [("vector", sym["__vector_table"] + VECTOR_EXTERNAL), ("handler", sym["isr_apu_timer"])]),
+        }
+    else:
+        monitors = {"apu": (rising(apu.timer_irq), apu, 0xffff, [apu_handler])}
 
-    sys.stdout.write("\n")
-    vuart_stdout = "".join(vuart_stdout)
+    await start_up(dut)
+    samples = {hart: [] for hart in monitors}
+    tasks = [cocotb.start_soon(irq_latency_monitor(dut, *m, samples[hart])) for hart, m in monitors.items()]
+    await rvdebug_init(dut)
+    await rvdebug_start_at(dut, ERAM_BASE)
+    # Timer IRQs are 20 us apart, and soft IRQ round trips much less
+    timeout_us = 100 + 40 * n_samples
+    for _ in range(timeout_us // 10):
+        if all(len(s) >= n_samples for s in samples.values()) or any(t.done() for t in tasks):
+            break
+        await Timer(10, "us")
+    for t in tasks:
+        if t.done():
+            t.result()
+        t.cancel()
+    assert all(len(s) >= n_samples for s in samples.values()), \
+        f"Saw {', '.join(f'{len(s)} {h}' for h, s in samples.items())} IRQs in {timeout_us} us"
+
+    name = f"{source}_{load}"
+    rows = {"source": source, "load": load, "harts": {}}
+    for hart, s in samples.items():
+        stats = irq_latency_summarise(s[:n_samples])
+        rows["harts"][hart] = {"samples": n_samples, "stats": stats}
+        for stage, st in stats.items():
+            cocotb.log.info(f"{name}: {hart} {stage:<8} min {st['min']:>4} mean {st['mean']:>7.1f} max {st['max']:>4}")
+    bench_write_irq_latency_results(name, rows)
 
-    assert vuart_stdout.endswith("!TPASS")
-    vuart_stdout = vuart_stdout[:-6]
+###############################################################################
+# Bus monitors
+
+ERAM_MASTERS = ["cpu-i", "cpu-d", "ppu"]
+
+# Slaves of the CPU's AHB splitter, then the APB peripherals behind the "apb"
+# port, in order of their 4 kB slot from PERI_BASE (see addressmap.h)
+FABRIC_AHB_SLAVES = ["eram", "iram", "rom", "apu", "apb"]
+FABRIC_APB_SLAVES = ["timer", "padctrl", "ppu", "dispctrl", "vuart", "gpio", "uart", "syscfg"]
+FABRIC_SLAVES = FABRIC_AHB_SLAVES + FABRIC_APB_SLAVES
+
+def fabric_ahb_slave(addr):
+    """Index in FABRIC_SLAVES of the AHB slave decoding addr, as splitter_u
+    in chip_core.sv (bit 19 is not decoded)."""
+    if not addr & 0x40000:
+        return 0
+    return (addr >> 16 & 0x3) + 1
+
+busmon_tasks = []
+
+async def eram_monitor(dut, log):
+    """Record every ERAM access to log (a busmon.BusLog) until cancelled.
+
+    RTL: watch the SRAM controller's AHB port (CPU, split into instruction
+    fetch and load/store by HPROT[0]) and PPU DMA port. Latency is from the
+    address being accepted to the data phase ending (AHB) or the read data
+    returning (DMA, which returns data in order). GL: internal nets aren't
+    available, so log each halfword strobed on the SRAM pins, with no master
+    or latency."""
+    cycle = 0
+    try:
+        if not gl:
+            core = dut.chip_u.i_chip_core
+            ahb_pending = None
+            dma_pending = []
+            while True:
+                await RisingEdge(dut.CLK)
+                cycle += 1
+                if ahb_pending is not None and core.eram_hready_resp.value == 1:
+                    t, addr, size, write, port = ahb_pending
+                    log.record(t, addr, size, write, port, cycle - t)
+                    ahb_pending = None
+                if core.eram_htrans.value[1] == 1 and core.eram_hready.value == 1:
+                    ahb_pending = (cycle, int(core.eram_haddr.value),
+                        1 << int(core.eram_hsize.value), core.eram_hwrite.value == 1,
+                        ERAM_MASTERS.index("cpu-i" if core.eram_hprot.value[0] == 0 else "cpu-d"))
+                if core.ppu_mem_rdata_vld.value == 1 and dma_pending:
+                    t, addr = dma_pending.pop(0)
+                    log.record(t, addr, 2, False, ERAM_MASTERS.index("ppu"), cycle - t)
+                if core.ppu_mem_addr_vld.value == 1 and core.ppu_mem_addr_rdy.value == 1:
+                    dma_pending.append((cycle, 2 * int(core.ppu_mem_addr.value)))
+        else:
+            prev = None
+            while True:
+                await RisingEdge(dut.CLK)
+                cycle += 1
+                op = None
+                if dut.SRAM_CSn.value == 0 and (dut.SRAM_OEn.value == 0 or dut.SRAM_WEn.value == 0):
+                    op = (int(dut.SRAM_A.value), dut.SRAM_WEn.value == 0)
+                    if op != prev:
+                        log.record(cycle, 2 * op[0], 2, op[1], 0)
+                prev = op
+    finally:
+        log.close(cycle)
+
+async def fabric_monitor(dut, log):
+    """Record every transaction on the CPU's bus fabric to log (a
+    busmon.BusLog or BusRing) until cancelled, by the slave it went to.
+
+    Watches the CPU side of the AHB splitter, and decodes the slave from the
+    address, so idle cycles cost one signal read. APB transfers are recorded
+    again on the peripheral side of the bridge, decoded the same way.
+    Latency is from the AHB address phase (APB setup phase) to the end of
+    the data phase (access phase), so 1 for no wait states. RTL only."""
+    core = dut.chip_u.i_chip_core
+    cycle = 0
+    ahb_pending = None
+    apb_setup = None
+    try:
+        while True:
+            await RisingEdge(dut.CLK)
+            cycle += 1
+            hready = core.cpu_hready.value == 1
+            if ahb_pending is not None and hready:
+                t, addr, size, write, port = ahb_pending
+                log.record(t, addr, size, write, port, cycle - t)
+                ahb_pending = None
+            if hready and core.cpu_htrans.value[1] == 1:
+                addr = int(core.cpu_haddr.value) & 0xfffff
+                ahb_pending = (cycle, addr, 1 << int(core.cpu_hsize.value), core.cpu_hwrite.value == 1,
+                    fabric_ahb_slave(addr))
+            if core.peri_psel.value == 1:
+                if core.peri_penable.value == 0:
+                    apb_setup = (cycle, int(core.peri_paddr.value), core.peri_pwrite.value == 1)
+                elif apb_setup is not None and core.peri_pready.value == 1:
+                    t, addr, write = apb_setup
+                    log.record(t, PERI_BASE | addr & 0xffff, 4, write,
+                        len(FABRIC_AHB_SLAVES) + (addr >> 12 & 0x7), cycle - t)
+                    apb_setup = None
+    finally:
+        log.close(cycle)
+
+def busmon_start(dut):
+    """Start the enabled bus monitors, once per test, logging to
+    busmon/<test name>.<bus>.bin."""
+    global busmon_tasks
+    from busmon import BusLog, BusRing
+    if any(not t.done() for t in busmon_tasks):
+        return
+    name = re.sub(r"[^\w=.-]+", "_", cocotb.task.current_task().name.removeprefix("Test "))
+    busmon_dir.mkdir(exist_ok=True)
+    header = {"clk_period_ns": CLK_PERIOD_NS, "start_ns": get_sim_time("ns")}
+    busmon_tasks = []
+    if busmon:
+        path = busmon_dir / f"{name}.eram.bin"
+        log = BusLog(path, {**header,
+            "bus": "eram",
+            "ports": ["pins"] if gl else ERAM_MASTERS,
+            "port_kind": "master",
+            # Upper bound: one halfword per cycle on the SRAM pins
+            "peak_bytes_per_cycle": 2,
+        })
+        cocotb.log.info(f"Logging ERAM accesses to {path}")
+        busmon_tasks.append(cocotb.start_soon(eram_monitor(dut, log)))
+    if bustrace and gl:
+        cocotb.log.warning("Bus fabric trace needs internal nets, not available in GL")
+    elif bustrace:
+        path = busmon_dir / f"{name}.fabric.bin"
+        header = {**header,
+            "bus": "fabric",
+            "ports": FABRIC_SLAVES,
+            "port_kind": "slave",
+            "nested_ports": FABRIC_APB_SLAVES,
+            "peak_bytes_per_cycle": 4,
+            "zero_wait_latency": 1,
+        }
+        log = BusRing(path, header, bustrace_ring) if bustrace_ring else BusLog(path, header)
+        cocotb.log.info(f"Tracing bus fabric transactions to {path}")
+        busmon_tasks.append(cocotb.start_soon(fabric_monitor(dut, log)))
 
-    cocotb.log.info(f"Processor standard output:\n\n{vuart_stdout}\n")
-    if app == "hellow":
-        assert vuart_stdout == "Hello, world!\r\n"
+###############################################################################
+# Power workloads
+
+# Must match software/tests/eram/power.c
+POWER_WORKLOAD_ADDR = 0x30000
+POWER_WORKLOADS = {
+    "idle":   0,
+    "render": 1,
+    "audio":  2,
+}
+
+@cocotb.test(skip=not activity)
+@cocotb.parametrize(workload=list(POWER_WORKLOADS))
+async def test_power_activity(dut, workload="idle"):
+    """Run a power workload, let it settle for ACTIVITY_SETTLE_US (default
+    500), then dump switching activity in ACTIVITY_SCOPE for
+    ACTIVITY_WINDOW_US (default 100). The window is appended to
+    activity/windows.jsonl, for scripts/power_report.py to split the dump."""
+    settle_us = float(os.getenv("ACTIVITY_SETTLE_US", 500))
+    window_us = float(os.getenv("ACTIVITY_WINDOW_US", 100))
+
+    load_eram(dut, build_app("eram", "power"))
+    load_eram(dut, struct.pack("<I", POWER_WORKLOADS[workload]), POWER_WORKLOAD_ADDR)
+    await start_up(dut)
+    await rvdebug_init(dut)
+    await rvdebug_start_at(dut, ERAM_BASE)
+
+    # Nothing else drives the debug port from here on
+    await Timer(settle_us, "us")
+    start_ns = get_sim_time("ns")
+    dut.activity_enable.value = 1
+    await Timer(window_us, "us")
+    dut.activity_enable.value = 0
+    end_ns = get_sim_time("ns")
+
+    cocotb.log.info(f"Captured {workload} activity from {start_ns} to {end_ns} ns")
+    with open(activity_dir / "windows.jsonl", "a") as f:
+        f.write(json.dumps({"workload": workload, "scope": activity_scope, "gl": bool(gl),
+            "start_ns": start_ns, "end_ns": end_ns}) + "\n")
+
+###############################################################################
+# Stress tests
+
+# Must match software/tests/eram/bus_stress.c
+STRESS_TABLE_ADDR = 0x30000
+
+@cocotb.test(skip=stress_job is None)
+async def test_bus_stress(dut):
+    """Run one randomised bus contention job generated by bus_stress.py
+    (path in STRESS_JOB), then check the read checksum and final memory."""
+    with open(stress_job) as f:
+        job = json.load(f)
+    cocotb.log.info(f"Seed {job['seed']}: {len(job['cpu_ops'])} CPU ops, "
+        f"{len(job['apu_ops']) if job['apu'] else 0} APU ops, PPU {'on' if job['ppu'] else 'off'}")
+    load_eram(dut, build_app("eram", "bus_stress"))
+    load_eram(dut, struct.pack(f"<{len(job['table'])}I", *job["table"]), STRESS_TABLE_ADDR)
+
+    await start_up(dut)
+    await rvdebug_init(dut)
+    await rvdebug_start_at(dut, ERAM_BASE)
+    vuart_stdout = await vuart_read_until_done(dut, max_poll=200)
+    assert vuart_stdout.strip() == f"Checksum {job['checksum']:08x}"
+
+    # Read back every written word, a contiguous run at a time
+    await rvdebug_halt(dut)
+    expect = {int(a, 16): w for a, w in job["expect"].items()}
+    addrs = sorted(expect)
+    mismatches = 0
+    while addrs:
+        n = 1
+        while n < len(addrs) and addrs[n] == addrs[0] + 4 * n:
+            n += 1
+        rdata = await rvdebug_read_mem_block(dut, addrs[0], n)
+        assert rdata is not None
+        for addr, actual in zip(addrs[:n], rdata):
+            if actual != expect[addr]:
+                cocotb.log.error(f"{addr:05x}: expected {expect[addr]:08x}, got {actual:08x}")
+                mismatches += 1
+        addrs = addrs[n:]
+    assert mismatches == 0
+
+###############################################################################
+# Interactive debug
+
+@cocotb.test(skip=gdb_port is None)
+async def test_gdb_server(dut):
+    """Load GDB_APP (default hellow) into ERAM, halt at its entry point, and
+    wait for gdb to attach on GDB_PORT."""
+    app = os.getenv("GDB_APP", "hellow")
+    load_eram(dut, build_app("eram", app))
+    await start_up(dut)
+    await rvdebug_init(dut)
+    await rvdebug_halt(dut)
+    await rvdebug_put_gpr(dut, 8, 0)
+    await rvdebug_put_csr(dut, CSR_DPC, ERAM_BASE)
+    await gdb_server(dut, int(gdb_port))
 
 ###############################################################################
 # Test infrastructure
 
-def get_sources_defines_includes():
+def get_sources_defines_includes(rom=None):
+    """Return the simulation sources. rom optionally replaces the boot ROM
+    (hdl/mem/ahb_rom_boot.v) with a variant, for RTL sims only. Modules in
+    gl_blocks have their RTL replaced with netlists from gl_block_dir."""
 
     proj_path = Path(__file__).resolve().parent
     sources = []
@@ -1022,6 +2116,9 @@ def get_sources_defines_includes():
     ])
 
     defines["GF180MCU"]       = True # Use inserted cells
+    if activity:
+        defines["ACTIVITY_DUMP"]  = f'"{activity_dump}"'
+        defines["ACTIVITY_SCOPE"] = activity_scope
     # defines["BEHAV_SRAM_1RW"] = True # Don't use vendor models
 
     # SCL models: included even for RTL sims, as RTL may instantiate cells in some rare cases
@@ -1029,13 +2126,34 @@ def get_sources_defines_includes():
     sources.append(Path(pdk_root) / pdk / "libs.ref" / scl / "verilog" / "primitives.v")
 
     if gl:
-        # We use the powered netlist
-        sources.append(proj_path / f"../final/pnl/chip_top.pnl.v")
+        assert not gl_blocks, "GL_BLOCKS is for RTL sims"
+        assert gl_netlist in ("pnl", "nl")
+        sources.append(proj_path / f"../final/{gl_netlist}/chip_top.{gl_netlist}.v")
         defines["FUNCTIONAL"] = True
-        defines["USE_POWER_PINS"] = True
+        # The unpowered netlist has no power pins, and is much faster to
+        # simulate, but won't catch missing or misconnected supplies
+        if gl_netlist == "pnl":
+            defines["USE_POWER_PINS"] = True
     else:
         config = yaml.safe_load(open("../librelane/config.yaml"))
-        sources.extend([x.replace("dir::", "") for x in config["VERILOG_FILES"]])
+        rtl_sources = [x.replace("dir::", "") for x in config["VERILOG_FILES"]]
+        if rom is not None:
+            rtl_sources = [rom if str(x).endswith("/ahb_rom_boot.v") else x for x in rtl_sources]
+        for block in gl_blocks:
+            netlist = gl_block_dir / f"{block}.v"
+            assert netlist.exists(), f"No netlist for {block}, run scripts/synth_block.py"
+            # Block netlists are flat, so only the block's own file is
+            # replaced, and its submodules are still available to the rest
+            # of the RTL
+            defining = [x for x in rtl_sources
+                if re.search(rf"^\s*module\s+{block}\b", open(x).read(), re.M)]
+            assert len(defining) == 1, f"{block} must be defined by exactly one source"
+            assert len(re.findall(r"^\s*module\s", open(defining[0]).read(), re.M)) == 1, \
+                f"{defining[0]} defines modules other than {block}"
+            rtl_sources[rtl_sources.index(defining[0])] = netlist
+        if gl_blocks:
+            defines["FUNCTIONAL"] = True
+        sources.extend(rtl_sources)
         includes.extend([x.replace("dir::", "") for x in config["VERILOG_INCLUDE_DIRS"]])
 
     sources += [
@@ -1060,13 +2178,47 @@ def get_sources_defines_includes():
     return (sources, defines, includes)
 
 
-if __name__ == "__main__":
-
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--filter", help="Optional regex to filter testcases")
-    args = parser.parse_args()
-
-    sources, defines, includes = get_sources_defines_includes()
+# Per-host Verilator build profiles, written by verilator_tune.py
+verilator_profile_file = Path(__file__).resolve().parent / "verilator_profile.json"
+
+def verilator_profile():
+    """Return the Verilator build profile for this host: {"threads",
+    "build_jobs", "fast"}. Comes from verilator_profile.json if
+    verilator_tune.py has been run on this host, otherwise single-threaded.
+    VERILATOR_THREADS overrides the thread count, and VERILATOR_FAST=1 (or 0)
+    turns the fast optimisation options on (or off)."""
+    profile = {"threads": 1, "build_jobs": os.cpu_count(), "fast": False}
+    if verilator_profile_file.exists():
+        with open(verilator_profile_file) as f:
+            tuned = json.load(f).get(socket.gethostname())
+        if tuned is not None:
+            profile.update(tuned["profile"])
+    if os.getenv("VERILATOR_THREADS"):
+        profile["threads"] = int(os.getenv("VERILATOR_THREADS"))
+    if os.getenv("VERILATOR_FAST"):
+        profile["fast"] = os.getenv("VERILATOR_FAST") != "0"
+    return profile
+
+def verilator_build_args(profile):
+    build_args = ["--timing", "--trace", "--trace-fst", "--trace-structs"]
+    # The runner's make caps the C++ compile at a few jobs, so build here
+    # first, with the profile's job count (which also parallelises
+    # Verilator itself), and leave the runner nothing to do
+    build_args += ["--build", "-j", str(profile["build_jobs"])]
+    if profile["fast"]:
+        # The testbench never relies on X propagation (Verilator is 2-state
+        # anyway), so let Verilator pick whatever is fastest for X assigns
+        build_args += ["-O3", "--x-assign", "fast"]
+    if profile["threads"] > 1:
+        build_args += ["--threads", str(profile["threads"])]
+    return build_args
+
+def build_sim(build_dir="sim_build", waves=True, rom=None, profile=None, coverage=False):
+    """Build the simulator. profile is a Verilator build profile, by default
+    verilator_profile(); ignored for other simulators. coverage enables
+    Verilator line coverage, written to coverage.dat in the test directory
+    of each run (see impact.py)."""
+    sources, defines, includes = get_sources_defines_includes(rom)
 
     build_args = []
 
@@ -1076,7 +2228,13 @@ if __name__ == "__main__":
         pass
 
     if sim == "verilator":
-        build_args = ["--timing", "--trace", "--trace-fst", "--trace-structs"]
+        if profile is None:
+            profile = verilator_profile()
+        build_args = verilator_build_args(profile)
+
+    if coverage:
+        assert sim == "verilator", "Coverage needs SIM=verilator"
+        build_args += ["--coverage-line"]
 
     runner = get_runner(sim)
     runner.build(
@@ -1086,15 +2244,84 @@ if __name__ == "__main__":
         always=True,
         includes=includes,
         build_args=build_args,
-        waves=True,
+        build_dir=build_dir,
+        waves=waves,
     )
+    return runner
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", help="Optional regex to filter testcases")
+    parser.add_argument("--no-history", action="store_true",
+        help="Don't record per-test timings in the timing history")
+    parser.add_argument("--slowdown-threshold", type=float, default=0.2,
+        help="Flag tests this much slower than their timing baseline")
+    parser.add_argument("--force", action="store_true",
+        help="Simulate test_execute_* tests even if they passed before with the same fingerprint, "
+        "and don't record their results")
+    args = parser.parse_args()
+
+    # The results cache isn't used with --force, or when the tests are run
+    # for their captures rather than their results. Fingerprinting builds the
+    # firmware, so it's only done when the cache is.
+    import results_cache
+    use_cache = not (args.force or activity or busmon or bustrace)
+    cache = results_cache.load() if use_cache else {}
+    fingerprints = execute_test_fingerprints(args.filter) if use_cache else {}
+    reused = results_cache.reusable(cache, fingerprints)
+    # Nothing to simulate if the filter selects only cached passes. Parameters
+    # in the filter could select parametrizations of other tests, which their
+    # names don't show.
+    others = [n for n in globals() if n.startswith("test_") and n not in EXECUTE_TESTS]
+    only_cached = args.filter is not None and "=" not in args.filter and \
+        not results_cache.selected(others, args.filter)
+    if reused and len(reused) == len(fingerprints) and only_cached:
+        results_cache.report(cache, reused)
+        sys.exit(0)
+    test_filter = results_cache.exclude_filter(reused, args.filter) if reused else args.filter
+
+    # The activity dump replaces the full waveform dump: there can only be
+    # one dump file
+    waves = not activity
+    if activity:
+        activity_dir.mkdir(exist_ok=True)
+        # Windows are matched to the dump's sections in order, so start both
+        # afresh
+        (activity_dir / "windows.jsonl").unlink(missing_ok=True)
+        activity_dump.unlink(missing_ok=True)
+
+    # Verilator only supports $dumpfile in a trace-enabled build, which the
+    # runner makes with waves. The full dump is only written when the run
+    # asks for waves too.
+    runner = build_sim(waves=waves or sim == "verilator")
 
     plusargs = []
 
-    runner.test(
+    # record_metric() appends, so clear out the last run's metrics
+    (Path(runner.build_dir) / "metrics.jsonl").unlink(missing_ok=True)
+    results_xml = runner.test(
         hdl_toplevel="tb",
         test_module="chip_top_tb,",
         plusargs=plusargs,
-        waves=True,
-        test_filter=args.filter
+        waves=waves,
+        test_filter=test_filter
     )
+
+    import timing_history
+    if use_cache:
+        results_cache.save(results_cache.update(cache, timing_history.parse_results(results_xml), fingerprints))
+        results_cache.report(cache, reused)
+
+    if not args.no_history:
+        info = {"sim": sim, "gl": bool(gl)}
+        # Only recorded when not the default, to match older entries
+        if gl and gl_netlist != "pnl":
+            info["gl_netlist"] = gl_netlist
+        if gl_blocks:
+            info["gl_blocks"] = gl_blocks
+        timing_history.record(results_xml, **info)
+        # Only compare against runs with the same simulator and netlists
+        history = timing_history.same_config(timing_history.load(), info)
+        timing_history.report(history, threshold=args.slowdown_threshold)
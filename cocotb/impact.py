@@ -0,0 +1,268 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Coverage-based selection of the cocotb tests impacted by an HDL change.
+#
+# --record runs every test on its own in a Verilator build with line
+# coverage, and stores which source files (with their modules and covered
+# lines) each test exercises, as a file-to-test map. This takes about as long
+# as a full regression, in parallel, and only needs redoing when the map goes
+# stale.
+#
+# Without --record, the files changed relative to --base (git diff, plus
+# untracked files) select the tests which covered them, as a --filter for
+# chip_top_tb.py (or run it, with --run). Changes which coverage can't
+# attribute fall back to the full suite: the testbench, the firmware or the
+# source list itself, sources without any coverage points, or a map recorded
+# for other sources than the base.
+#
+# Only tests which ran at record time are in the map, so tests skipped
+# without their environment flags (BENCH etc.) are never selected.
+
+import argparse
+import datetime
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from results_cache import file_digest
+import timing_history
+
+TB_DIR = Path(__file__).resolve().parent
+REPO_ROOT = TB_DIR.parent
+DEFAULT_MAP = TB_DIR / "impact_map.json"
+
+# Changes under these can affect any test, and aren't seen by HDL coverage
+FULL_RUN_PATHS = ("cocotb/", "software/", "librelane/config.yaml")
+
+def repo_path(path):
+    """Path relative to the repository root, as git reports it, for files in
+    the repository. Relative paths are relative to the testbench directory,
+    as in get_sources_defines_includes()."""
+    path = Path(path)
+    if not path.is_absolute():
+        path = TB_DIR / path
+    path = Path(os.path.normpath(path))
+    try:
+        return path.relative_to(REPO_ROOT).as_posix()
+    except ValueError:
+        return str(path)
+
+def source_digests(sources, includes):
+    """{repo path: digest} of every simulation source and every file under
+    the include directories."""
+    digests = {repo_path(src): file_digest(src) for src in sources}
+    for inc in includes:
+        inc = Path(inc) if Path(inc).is_absolute() else TB_DIR / inc
+        for f in inc.rglob("*"):
+            if f.is_file():
+                digests[repo_path(f)] = file_digest(f)
+    return digests
+
+def parse_coverage(path):
+    """Return {repo path: {"modules": [...], "lines": [...]}} of the points
+    hit at least once in a Verilator coverage.dat."""
+    files = {}
+    with open(path, errors="replace") as f:
+        for l in f:
+            m = re.match(r"C '(.*)' (\d+)$", l.rstrip("\n"))
+            if not m or int(m.group(2)) == 0:
+                continue
+            point = dict(kv.split("\x02", 1) for kv in m.group(1).split("\x01") if "\x02" in kv)
+            if "f" not in point:
+                continue
+            cov = files.setdefault(repo_path(point["f"]), {"modules": set(), "lines": set()})
+            # Pages are v_<type>/<module>
+            if "/" in point.get("page", ""):
+                cov["modules"].add(point["page"].split("/", 1)[1])
+            if point.get("l", "").isdigit():
+                cov["lines"].add(int(point["l"]))
+    return {f: {"modules": sorted(c["modules"]), "lines": sorted(c["lines"])} for f, c in files.items()}
+
+def test_dir_name(name):
+    return re.sub(r"[^\w.-]", "_", name)
+
+def exact_filter(names):
+    """A chip_top_tb.py --filter selecting exactly the named tests."""
+    return r"(?:^|\.)(?:" + "|".join(re.escape(n) for n in sorted(names)) + r")$"
+
+###############################################################################
+# Recording
+
+def run_test(sim, build_dir, test_dir, name):
+    """Run one test in its own simulator process. Return (status, coverage).
+    Must be a top-level function for ProcessPoolExecutor."""
+    from cocotb_tools.runner import get_runner
+    test_dir = Path(test_dir)
+    test_dir.mkdir(parents=True, exist_ok=True)
+    (test_dir / "coverage.dat").unlink(missing_ok=True)
+    results_xml = get_runner(sim).test(
+        hdl_toplevel="tb",
+        test_module="chip_top_tb",
+        build_dir=build_dir,
+        test_dir=test_dir,
+        results_xml=test_dir / "results.xml",
+        test_filter=exact_filter([name]),
+        waves=False,
+    )
+    result = timing_history.parse_results(results_xml).get(name)
+    status = result["status"] if result else "missing"
+    coverage = parse_coverage(test_dir / "coverage.dat") if (test_dir / "coverage.dat").exists() else {}
+    return status, coverage
+
+def recorded_tests(sim, build_dir, out_dir, info):
+    """Names of the tests to record: those of the latest timing history run
+    with the same configuration, or else of a full run."""
+    history = timing_history.same_config(timing_history.load(), info)
+    if history:
+        return sorted(history[-1]["tests"])
+    from cocotb_tools.runner import get_runner
+    results_xml = get_runner(sim).test(
+        hdl_toplevel="tb",
+        test_module="chip_top_tb",
+        build_dir=build_dir,
+        test_dir=out_dir / "all",
+        results_xml=out_dir / "all" / "results.xml",
+        waves=False,
+    )
+    return sorted(timing_history.parse_results(results_xml))
+
+def simulation_info(sim, gl, gl_netlist, gl_blocks):
+    """Simulator configuration, as recorded with timing history entries."""
+    info = {"sim": sim, "gl": bool(gl)}
+    if gl and gl_netlist != "pnl":
+        info["gl_netlist"] = gl_netlist
+    if gl_blocks:
+        info["gl_blocks"] = gl_blocks
+    return info
+
+def record(args):
+    from chip_top_tb import (sim, gl, gl_netlist, gl_blocks, build_sim,
+        get_sources_defines_includes, make_app, swtest_root)
+
+    info = simulation_info(sim, gl, gl_netlist, gl_blocks)
+    out_dir = Path(args.out).resolve()
+    build_dir = out_dir / "sim_build"
+    build_sim(build_dir, waves=False, coverage=True)
+    # Build the firmware up front so the parallel tests don't race on make
+    for target in ("eram", "iram", "flash"):
+        for app in sorted((swtest_root / target).glob("*.c")):
+            make_app(target, app.stem, quiet=True)
+
+    names = args.tests or recorded_tests(sim, build_dir, out_dir, info)
+    print(f"Recording coverage of {len(names)} tests")
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {name: pool.submit(run_test, sim, build_dir, str(out_dir / test_dir_name(name)), name)
+            for name in names}
+        results = {name: f.result() for name, f in futures.items()}
+
+    files = {}
+    for name, (status, coverage) in results.items():
+        for f in coverage:
+            files.setdefault(f, []).append(name)
+    sources, _, includes = get_sources_defines_includes()
+    impact_map = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": timing_history.git_describe(),
+        "info": info,
+        "sources": source_digests(sources, includes),
+        "files": {f: sorted(t) for f, t in sorted(files.items())},
+        "tests": {name: {"status": status, "files": coverage}
+            for name, (status, coverage) in sorted(results.items())},
+    }
+    with open(args.map, "w") as f:
+        json.dump(impact_map, f, indent=1)
+
+    failed = [name for name, (status, _) in results.items() if status != "pass"]
+    for name in failed:
+        print(f"{results[name][0].upper()}: {name} (always selected)")
+    print(f"Recorded {len(results)} tests covering {len(files)} files to {args.map}")
+
+###############################################################################
+# Selection
+
+def changed_files(base):
+    """Files changed in the working tree relative to base, including
+    untracked ones, as repo paths."""
+    def git(*cmd):
+        rc = subprocess.run(["git", *cmd], capture_output=True, text=True, cwd=REPO_ROOT)
+        assert rc.returncode == 0, rc.stderr
+        return rc.stdout.splitlines()
+    return sorted(set(git("diff", "--name-only", base)) |
+        set(git("ls-files", "--others", "--exclude-standard")))
+
+def select(impact_map, changed, digests, info):
+    """Return (tests, reason): the impacted tests, or None for the full
+    suite, and why."""
+    if impact_map is None:
+        return None, "no impact map, run with --record"
+    if impact_map["info"] != info:
+        return None, f"impact map recorded for {impact_map['info']}, not {info}"
+    full = [f for f in changed if f.startswith(FULL_RUN_PATHS) and f not in digests]
+    if full:
+        return None, f"testbench, firmware or source list changed: {', '.join(full)}"
+    recorded = impact_map["sources"]
+    if set(recorded) != set(digests):
+        return None, "sources added or removed since the impact map was recorded"
+    # Sources which differ from the map, other than through this change,
+    # mean the map was recorded for another base
+    drift = [f for f in digests if digests[f] != recorded[f] and f not in changed]
+    if drift:
+        return None, f"impact map is stale ({len(drift)} sources changed outside the diff, e.g. {drift[0]})"
+
+    hdl = [f for f in changed if f in digests]
+    # No coverage points (e.g. cells, or modules only instantiated in some
+    # configurations) doesn't mean no test depends on the file
+    uncovered = [f for f in hdl if f not in impact_map["files"]]
+    if uncovered:
+        return None, f"sources without coverage changed: {', '.join(uncovered)}"
+    tests = {name for name, t in impact_map["tests"].items() if t["status"] != "pass"}
+    for f in hdl:
+        covering = impact_map["files"][f]
+        print(f"{f}: {len(covering)} tests")
+        tests.update(covering)
+    return sorted(tests), f"{len(hdl)} changed sources"
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Select the cocotb tests impacted by HDL changes")
+    parser.add_argument("--map", default=DEFAULT_MAP, help="impact map file")
+    parser.add_argument("--record", action="store_true",
+        help="record per-test coverage into the impact map (SIM=verilator)")
+    parser.add_argument("--tests", nargs="*", help="tests to record (default: those of the last run)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="parallel simulators")
+    parser.add_argument("--out", default="impact_build", help="output directory for --record")
+    parser.add_argument("--base", default="HEAD", help="git revision to diff against")
+    parser.add_argument("--run", action="store_true", help="run the selected tests")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args)
+        sys.exit(0)
+
+    from chip_top_tb import sim, gl, gl_netlist, gl_blocks, get_sources_defines_includes
+
+    impact_map = json.load(open(args.map)) if Path(args.map).exists() else None
+    sources, _, includes = get_sources_defines_includes()
+    tests, reason = select(impact_map, changed_files(args.base),
+        source_digests(sources, includes), simulation_info(sim, gl, gl_netlist, gl_blocks))
+    if tests is None:
+        print(f"Full run: {reason}")
+        cmd = [sys.executable, "chip_top_tb.py"]
+    elif not tests:
+        print(f"No impacted tests ({reason})")
+        sys.exit(0)
+    else:
+        print(f"{len(tests)} impacted tests ({reason}):")
+        for name in tests:
+            print(f"  {name}")
+        cmd = [sys.executable, "chip_top_tb.py", "--filter", exact_filter(tests)]
+    if not args.run:
+        print(shlex.join(cmd[1:]))
+        sys.exit(0)
+    sys.exit(subprocess.run(cmd, cwd=TB_DIR).returncode)
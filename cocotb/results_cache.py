@@ -0,0 +1,163 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Results cache for the cocotb regression.
+#
+# Each cacheable test (the test_execute_* parametrizations) gets a fingerprint
+# of everything its result depends on: the simulation sources, include files
+# and defines, the simulator version, the firmware image it runs, the source
+# of the test function, the testbench modules (its helpers, and the TWD and
+# RISC-V debug libraries) and the output it is checked against. A test which
+# passed before with the same fingerprint isn't simulated again, and is
+# reported as reused. Only passes are cached: a failing or missing result
+# removes the test's entry.
+
+import argparse
+import ast
+import datetime
+import hashlib
+import json
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+DEFAULT_CACHE = Path(__file__).resolve().parent / "results_cache.json"
+
+SIM_VERSION_COMMANDS = {
+    "icarus":    ["iverilog", "-V"],
+    "verilator": ["verilator", "--version"],
+}
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def simulator_version(sim):
+    """First line of the simulator's version banner, or None if unknown."""
+    cmd = SIM_VERSION_COMMANDS.get(sim)
+    if cmd is None:
+        return None
+    try:
+        rc = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    lines = rc.stdout.strip().splitlines()
+    return lines[0] if lines else None
+
+def build_fingerprint(sim, sources, defines, includes):
+    """Fingerprint of a simulator build: the version of sim, the contents of
+    every source and of every file under the include directories, and the
+    defines."""
+    h = hashlib.sha256()
+    h.update(json.dumps({
+        "sim": sim,
+        "version": simulator_version(sim),
+        "defines": {k: str(v) for k, v in sorted(defines.items())},
+    }).encode())
+    for src in sources:
+        h.update(f"{src}\0{file_digest(src)}\0".encode())
+    for inc in includes:
+        for f in sorted(p for p in Path(inc).rglob("*") if p.is_file()):
+            h.update(f"{f}\0{file_digest(f)}\0".encode())
+    return h.hexdigest()
+
+def function_source(module_path, name):
+    """Source of the function `name` defined in module_path, excluding its
+    decorators, so that e.g. adding a parametrization doesn't invalidate the
+    existing ones."""
+    source = Path(module_path).read_text()
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == name:
+            return ast.get_source_segment(source, node)
+    raise KeyError(f"No function {name} in {module_path}")
+
+def test_fingerprint(build, image, test_source, expected=None, modules=()):
+    """Fingerprint of one test: build fingerprint, firmware image path,
+    test function source, (JSON-serialisable) expected results and the
+    contents of the testbench modules it runs."""
+    h = hashlib.sha256()
+    h.update(json.dumps({
+        "build": build,
+        "image": file_digest(image),
+        "source": test_source,
+        "expected": expected,
+        "modules": {Path(m).name: file_digest(m) for m in modules},
+    }).encode())
+    return h.hexdigest()
+
+def param_test_name(test, **params):
+    """Name of one parametrization of a test, as cocotb reports it."""
+    return "/".join([test] + [f"{k}={v}" for k, v in params.items()])
+
+def selected(names, test_filter, module="chip_top_tb"):
+    """Names of the tests which the runner's test_filter selects."""
+    if test_filter is None:
+        return list(names)
+    return [n for n in names if re.search(test_filter, f"{module}.{n}")]
+
+def exclude_filter(names, test_filter=None):
+    """A test_filter selecting what test_filter selects, except the tests in
+    names."""
+    pattern = "^"
+    if names:
+        pattern += "(?!.*\\.(?:" + "|".join(re.escape(n) for n in names) + ")$)"
+    if test_filter is not None:
+        pattern += f"(?=.*(?:{test_filter}))"
+    return pattern
+
+def load(cache=DEFAULT_CACHE):
+    if not Path(cache).exists():
+        return {}
+    with open(cache) as f:
+        return json.load(f)
+
+def save(entries, cache=DEFAULT_CACHE):
+    with open(cache, "w") as f:
+        json.dump(entries, f, indent=2, sort_keys=True)
+
+def reusable(entries, fingerprints):
+    """Tests whose cached pass has the same fingerprint as now."""
+    return [name for name, fp in fingerprints.items()
+        if entries.get(name, {}).get("fingerprint") == fp]
+
+def update(entries, results, fingerprints):
+    """Record the results ({name: {"status", ...}}, see
+    timing_history.parse_results()) of the fingerprinted tests which ran."""
+    for name, fp in fingerprints.items():
+        if name not in results:
+            continue
+        if results[name]["status"] == "pass":
+            entries[name] = {
+                "fingerprint": fp,
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "wall_s": results[name]["wall_s"],
+            }
+        else:
+            entries.pop(name, None)
+    return entries
+
+def report(entries, reused, file=sys.stdout):
+    if not reused:
+        return
+    saved = sum(entries[n].get("wall_s", 0) for n in reused)
+    print(f"{'Test':<60} {'Status':<6}", file=file)
+    for name in reused:
+        print(f"{name:<60} {'reused':<6}", file=file)
+    print(f"\nReused {len(reused)} cached passes (about {saved:.0f} s of simulation), "
+        "rerun with --force to simulate them", file=file)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Show or clear the regression results cache")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="cache file")
+    parser.add_argument("--clear", action="store_true", help="forget every cached pass")
+    args = parser.parse_args()
+
+    if args.clear:
+        Path(args.cache).unlink(missing_ok=True)
+        sys.exit(0)
+    entries = load(args.cache)
+    for name, e in sorted(entries.items()):
+        print(f"{name:<60} {e['date']}  {e['fingerprint'][:12]}")
+    print(f"{len(entries)} cached passes")
@@ -0,0 +1,381 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# RISC-V debug module access over a TWD connection (see twd.py).
+#
+# An RVDebug holds the state of one connection to the DM: the last DMCONTROL
+# and HAWINDOW written and the program buffer contents, so that repeated hart
+# selections and progbuf-based accesses skip redundant writes. Abstract
+# commands go through run_commands(), which sends a whole sequence of them,
+# with their status checks and result reads, in one round trip. For example
+# a block of memory reads costs one round trip to save s0, and one for the
+# rest.
+
+DM_DATA0                   = 0x04
+DM_DMCONTROL               = 0x10
+DM_DMSTATUS                = 0x11
+DM_HAWINDOWSEL             = 0x14
+DM_HAWINDOW                = 0x15
+DM_ABSTRACTCS              = 0x16
+DM_COMMAND                 = 0x17
+DM_ABSTRACTAUTO            = 0x18
+DM_PROGBUF0                = 0x20
+DM_PROGBUF1                = 0x21
+
+DM_DMCONTROL_DMACTIVE      = 0x1
+DM_DMCONTROL_HARTSEL_LSB   = 16
+DM_DMCONTROL_HASEL         = 1 << 26
+DM_DMCONTROL_HALTREQ       = 1 << 31
+DM_DMCONTROL_RESUMEREQ     = 1 << 30
+
+DM_DMSTATUS_VERSION_BITS   = 0xf
+DM_DMSTATUS_ANYHALTED      = 1 << 8
+DM_DMSTATUS_ALLHALTED      = 1 << 9
+DM_DMSTATUS_ANYRUNNING     = 1 << 10
+DM_DMSTATUS_ALLRUNNING     = 1 << 11
+DM_DMSTATUS_ANYUNAVAIL     = 1 << 12
+DM_DMSTATUS_ALLUNAVAIL     = 1 << 13
+DM_DMSTATUS_ALLNONEXISTENT = 1 << 14
+DM_DMSTATUS_ANYNONEXISTENT = 1 << 15
+DM_DMSTATUS_ALLRESUMEACK   = 1 << 16
+DM_DMSTATUS_ANYRESUMEACK   = 1 << 17
+DM_DMSTATUS_ALLHAVERESET   = 1 << 18
+DM_DMSTATUS_ANYHAVERESET   = 1 << 19
+
+DM_ABSTRACTCS_BUSY         = 1 << 12
+DM_ABSTRACTCS_CMDERR_LSB   = 8
+DM_ABSTRACTCS_CMDERR       = 0x7 << DM_ABSTRACTCS_CMDERR_LSB
+DM_CMDERR_BUSY             = 1
+
+DM_COMMAND_SIZE_WORD       = 2 << 20
+DM_COMMAND_POSTEXEC        = 1 << 18
+DM_COMMAND_TRANSFER        = 1 << 17
+DM_COMMAND_WRITE           = 1 << 16
+DM_COMMAND_REGNO_LSB       = 0
+DM_REGNO_GPR0              = 0x1000
+
+CSR_MVENDORID              = 0xf11
+CSR_MARCHID                = 0xf12
+CSR_MIMPID                 = 0xf13
+CSR_MHARTID                = 0xf14
+CSR_MSTATUS                = 0x300
+CSR_MISA                   = 0x301
+CSR_MIE                    = 0x304
+CSR_MTVEC                  = 0x305
+CSR_MEPC                   = 0x341
+CSR_MCAUSE                 = 0x342
+CSR_MIP                    = 0x344
+CSR_H3_MSLEEP              = 0xbf0
+CSR_TSELECT                = 0x7a0
+CSR_TDATA1                 = 0x7a1
+CSR_TDATA2                 = 0x7a2
+CSR_TDATA3                 = 0x7a3
+CSR_TINFO                  = 0x7a4
+CSR_TCONTROL               = 0x7a5
+CSR_DCSR                   = 0x7b0
+CSR_DPC                    = 0x7b1
+
+DCSR_EBREAKM               = 1 << 15
+DCSR_STEP                  = 1 << 2
+
+# Max ABSTRACTCS polls for an abstract command to finish
+RVDEBUG_MAX_POLLS = 10
+
+S0 = 8
+S1 = 9
+
+INSTR_EBREAK = 0x00100073
+
+
+class RVDebugError(Exception):
+    pass
+
+
+def cmderr(abstractcs):
+    return (abstractcs & DM_ABSTRACTCS_CMDERR) >> DM_ABSTRACTCS_CMDERR_LSB
+
+
+def gpr_read_step(gpr):
+    """run_commands() step to read a GPR."""
+    return ([], DM_COMMAND_TRANSFER | DM_COMMAND_SIZE_WORD | (DM_REGNO_GPR0 + gpr), [DM_DATA0])
+
+
+def gpr_write_step(gpr, wdata):
+    """run_commands() step to write a GPR."""
+    return ([(DM_DATA0, wdata)],
+        DM_COMMAND_TRANSFER | DM_COMMAND_SIZE_WORD | DM_COMMAND_WRITE | (DM_REGNO_GPR0 + gpr), [])
+
+
+class RVDebug:
+    """Debug module access over a TWD connection (twd.TWD)."""
+
+    def __init__(self, twd):
+        self.twd = twd
+        self.progbuf = [0, 0]
+        # Last value written to DMCONTROL, excluding the haltreq/resumereq
+        # strobes, and last value written to HAWINDOW. None if unknown.
+        self.dmcontrol = None
+        self.hawindow = None
+
+    async def init(self):
+        """Connect, check the DM version, and activate the DM."""
+        self.progbuf = [0, 0]
+        await self.twd.connect()
+        dmstatus = await self.twd.read_bus(DM_DMSTATUS)
+        if (dmstatus & DM_DMSTATUS_VERSION_BITS) != 2:
+            raise RVDebugError(f"Unsupported DM version (dmstatus {dmstatus:08x})")
+        self.twd.queue_write(DM_DMCONTROL, 0)
+        await self.twd.write_bus(DM_DMCONTROL, DM_DMCONTROL_DMACTIVE)
+        self.dmcontrol = DM_DMCONTROL_DMACTIVE
+        self.hawindow = None
+
+    def _queue_write(self, addr, wdata):
+        """Queue a DM register write, skipping PROGBUF writes of the value it
+        already holds."""
+        idx = addr - DM_PROGBUF0
+        if 0 <= idx < len(self.progbuf):
+            if self.progbuf[idx] == wdata:
+                return
+            self.progbuf[idx] = wdata
+        self.twd.queue_write(addr, wdata)
+
+    async def _poll(self, addr, bits, max_poll=None):
+        """Read addr until any of bits is set, or max_poll reads. The first
+        read goes out with anything already queued."""
+        n = 0
+        while True:
+            rdata = await self.twd.read_bus(addr)
+            if rdata & bits:
+                return rdata
+            n += 1
+            if max_poll is not None and n >= max_poll:
+                raise RVDebugError(f"Timed out polling DM register {addr:#x} = {rdata:08x}")
+
+    async def count_harts(self):
+        # Probing writes out-of-range HARTSEL values, so the cached DMCONTROL
+        # value is no longer trustworthy.
+        self.dmcontrol = None
+        self.twd.queue_write(DM_DMCONTROL, DM_DMCONTROL_DMACTIVE)
+        for i in range(32 + 1):
+            # 32 is max harts supported by Hazard3 DM
+            expect = DM_DMCONTROL_DMACTIVE | (i << DM_DMCONTROL_HARTSEL_LSB)
+            self.twd.queue_write(DM_DMCONTROL, expect)
+            actual = self.twd.queue_read(DM_DMCONTROL)
+            status = self.twd.queue_read(DM_DMSTATUS)
+            await self.twd.flush()
+            if expect != actual.value or status.value & DM_DMSTATUS_ANYNONEXISTENT:
+                return i
+        return i
+
+    def _queue_dmcontrol(self, dmcontrol):
+        if dmcontrol != self.dmcontrol:
+            self.twd.queue_write(DM_DMCONTROL, dmcontrol)
+            self.dmcontrol = dmcontrol
+
+    def _queue_select_harts(self, harts):
+        mask = sum(1 << h for h in harts)
+        if mask != self.hawindow:
+            self.twd.queue_write(DM_HAWINDOWSEL, 0)
+            self.twd.queue_write(DM_HAWINDOW, mask)
+            self.hawindow = mask
+        self._queue_dmcontrol(
+            DM_DMCONTROL_DMACTIVE | DM_DMCONTROL_HASEL |
+            (min(harts) << DM_DMCONTROL_HARTSEL_LSB))
+
+    async def put_dmcontrol(self, dmcontrol):
+        self._queue_dmcontrol(dmcontrol)
+        await self.twd.flush()
+
+    async def select_hart(self, hart):
+        await self.put_dmcontrol(DM_DMCONTROL_DMACTIVE | (hart << DM_DMCONTROL_HARTSEL_LSB))
+
+    async def select_harts(self, harts):
+        """Select a group of harts using the hart array mask, so that halt
+        and resume requests apply to all of them at once. HARTSEL points to
+        the lowest-numbered hart, which is the target of abstract commands."""
+        self._queue_select_harts(harts)
+        await self.twd.flush()
+
+    async def get_dmcontrol(self):
+        if self.dmcontrol is None:
+            self.dmcontrol = await self.twd.read_bus(DM_DMCONTROL)
+        return self.dmcontrol
+
+    # Halt and resume apply to all selected harts, and wait for all of them:
+
+    async def halt(self):
+        dmcontrol = await self.get_dmcontrol()
+        self.twd.queue_write(DM_DMCONTROL, dmcontrol | DM_DMCONTROL_HALTREQ)
+        await self._poll(DM_DMSTATUS, DM_DMSTATUS_ALLHALTED)
+
+    async def resume(self):
+        dmcontrol = await self.get_dmcontrol()
+        self.twd.queue_write(DM_DMCONTROL, dmcontrol | DM_DMCONTROL_RESUMEREQ)
+        await self._poll(DM_DMSTATUS, DM_DMSTATUS_ALLRESUMEACK)
+
+    async def halt_harts(self, harts):
+        self._queue_select_harts(harts)
+        await self.halt()
+
+    async def resume_harts(self, harts):
+        self._queue_select_harts(harts)
+        await self.resume()
+
+    async def put_progbuf(self, idx, instr):
+        self._queue_write(DM_PROGBUF0 + idx, instr)
+        await self.twd.flush()
+
+    async def wait_acmd_finish(self):
+        """Wait for the current abstract command, and return ABSTRACTCS."""
+        for i in range(RVDEBUG_MAX_POLLS):
+            stat = await self.twd.read_bus(DM_ABSTRACTCS)
+            if (stat & DM_ABSTRACTCS_BUSY) == 0:
+                return stat
+        raise RVDebugError("Abstract command did not finish")
+
+    async def clear_cmderr(self):
+        await self.twd.write_bus(DM_ABSTRACTCS, DM_ABSTRACTCS_CMDERR)
+
+    async def run_commands(self, steps):
+        """Run a sequence of abstract commands in one round trip. Each step
+        is (writes, command, reads): (DM register, value) pairs to write
+        first, the COMMAND value, and DM registers to read once it has
+        finished. Return the list of read values of each step. If a command
+        fails, its entry is None, and it is the last one: the failure is
+        cleared, and later commands were ignored by the DM.
+
+        ABSTRACTCS is read at the end of each step, before the next one
+        starts, so a failure is attributed to the right step. A command
+        still running when its results are read, or when the next step
+        starts, is only resolved if nothing else has gone wrong; otherwise
+        it is not known which steps took effect, and this raises. Abstract
+        commands take a few cycles, and a TWD access tens of DCK cycles, so
+        this shouldn't happen."""
+        pending = []
+        for writes, command, reads in steps:
+            for addr, wdata in writes:
+                self._queue_write(addr, wdata)
+            # Starting a command twice would run it twice
+            self.twd.queue_write(DM_COMMAND, command, replay=False)
+            data = [self.twd.queue_read(a) for a in reads]
+            pending.append((data, self.twd.queue_read(DM_ABSTRACTCS)))
+        await self.twd.flush()
+        results = []
+        for i, (data, stat) in enumerate(pending):
+            abstractcs = stat.value
+            if abstractcs & DM_ABSTRACTCS_BUSY or cmderr(abstractcs) == DM_CMDERR_BUSY:
+                final = await self.wait_acmd_finish()
+                if cmderr(abstractcs) == 0 and (cmderr(final) == 0 or i + 1 == len(pending)):
+                    abstractcs = final
+                else:
+                    # Rejected PROGBUF writes leave the cache wrong
+                    self.progbuf = [None] * len(self.progbuf)
+                    await self.clear_cmderr()
+                    raise RVDebugError(f"Abstract command {i} of {len(pending)} "
+                        f"too slow to pipeline (abstractcs {abstractcs:08x})")
+            if cmderr(abstractcs):
+                await self.clear_cmderr()
+                results.append(None)
+                return results
+            results.append([d.value for d in data])
+        return results
+
+    async def _run_restoring(self, steps, restore):
+        """Run steps then restore steps in one batch, and the restore steps
+        again on their own if one of steps fails. Return the results of
+        steps, as run_commands()."""
+        results = await self.run_commands(steps + restore)
+        if len(results) < len(steps) or results[len(steps) - 1] is None:
+            restored = await self.run_commands(restore)
+        else:
+            restored = results[len(steps):]
+        if len(restored) < len(restore) or None in restored:
+            raise RVDebugError("Failed to restore registers after abstract commands")
+        return results[:len(steps)]
+
+    async def put_gpr(self, gpr, wdata):
+        if await self.run_commands([gpr_write_step(gpr, wdata)]) != [[]]:
+            raise RVDebugError(f"Failed to write x{gpr}")
+
+    async def get_gprs(self, gprs):
+        gprs = list(gprs)
+        results = await self.run_commands([gpr_read_step(gpr) for gpr in gprs])
+        if len(results) < len(gprs) or results[-1] is None:
+            raise RVDebugError(f"Failed to read x{gprs[len(results) - 1]}")
+        return [r[0] for r in results]
+
+    async def get_gpr(self, gpr):
+        return (await self.get_gprs([gpr]))[0]
+
+    async def put_csr(self, csr, wdata):
+        """Write a CSR through s0, which is saved and restored. Return False
+        if the write faults."""
+        save_s0 = await self.get_gpr(S0)
+        results = await self._run_restoring([(
+            [(DM_DATA0, wdata),
+                (DM_PROGBUF0, 0x00001073 | (csr << 20) | (S0 << 15)), # csrw xxx, s0
+                (DM_PROGBUF1, INSTR_EBREAK)],
+            DM_COMMAND_POSTEXEC | DM_COMMAND_TRANSFER | DM_COMMAND_SIZE_WORD |
+                DM_COMMAND_WRITE | (DM_REGNO_GPR0 + S0),
+            [],
+        )], [gpr_write_step(S0, save_s0)])
+        return results[0] is not None
+
+    async def get_csrs(self, csrs, s0=None):
+        """Read CSRs through s0, which is saved and restored once for all of
+        them (pass its value as s0 to skip the save). Return their values,
+        with None for any which faults."""
+        csrs = list(csrs)
+        if s0 is None:
+            s0 = await self.get_gpr(S0)
+        values = []
+        while len(values) < len(csrs):
+            results = await self._run_restoring([(
+                [(DM_PROGBUF0, 0x00002073 | (csr << 20) | (S0 << 7)), # csrr s0, xxx
+                    (DM_PROGBUF1, 0xbff01073 | (S0 << 15))], # csrw dmdata0, s0
+                DM_COMMAND_POSTEXEC,
+                [DM_DATA0],
+            ) for csr in csrs[len(values):]], [gpr_write_step(S0, s0)])
+            values += [None if r is None else r[0] for r in results]
+        return values
+
+    async def get_csr(self, csr):
+        return (await self.get_csrs([csr]))[0]
+
+    # Block transfers save and restore s0/s1 once per block rather than once
+    # per word. Return None/False if any access faults.
+
+    async def read_mem_block(self, addr, n_words):
+        save_s0 = await self.get_gpr(S0)
+        results = await self._run_restoring([(
+            [(DM_DATA0, addr + 4 * i),
+                (DM_PROGBUF0, 0x00002003 | (S0 << 7) | (S0 << 15)), # lw s0, (s0)
+                (DM_PROGBUF1, 0xbff01073 | (S0 << 15))], # csrw dmdata0, s0
+            DM_COMMAND_POSTEXEC | DM_COMMAND_TRANSFER | DM_COMMAND_SIZE_WORD |
+                DM_COMMAND_WRITE | (DM_REGNO_GPR0 + S0),
+            [DM_DATA0],
+        ) for i in range(n_words)], [gpr_write_step(S0, save_s0)])
+        if None in results:
+            return None
+        return [r[0] for r in results]
+
+    async def write_mem_block(self, addr, wdata):
+        save_s0, save_s1 = await self.get_gprs([S0, S1])
+        results = await self._run_restoring([gpr_write_step(S0, addr)] + [(
+            [(DM_DATA0, w),
+                (DM_PROGBUF0, 0x00002023 | (S1 << 20) | (S0 << 15)), # sw s1, (s0)
+                (DM_PROGBUF1, 0x00440413)], # addi s0, s0, 4
+            DM_COMMAND_POSTEXEC | DM_COMMAND_TRANSFER | DM_COMMAND_SIZE_WORD |
+                DM_COMMAND_WRITE | (DM_REGNO_GPR0 + S1),
+            [],
+        ) for w in wdata], [gpr_write_step(S0, save_s0), gpr_write_step(S1, save_s1)])
+        return None not in results
+
+    async def read_mem32(self, addr):
+        rdata = await self.read_mem_block(addr, 1)
+        if rdata is None:
+            raise RVDebugError(f"Fault reading {addr:08x}")
+        return rdata[0]
+
+    async def write_mem32(self, addr, wdata):
+        if not await self.write_mem_block(addr, [wdata]):
+            raise RVDebugError(f"Fault writing {addr:08x}")
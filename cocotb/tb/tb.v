@@ -109,4 +109,25 @@ always @ (posedge LCD_CLK or negedge lcd_capture_enable) begin
 	end
 end
 
+// Switching activity capture for power analysis: dump only ACTIVITY_SCOPE,
+// and only while activity_enable is set, so each capture window is a
+// separate $dumpon/$dumpoff section of one small dump.
+`ifdef ACTIVITY_DUMP
+reg activity_enable = 1'b0;
+
+initial begin
+	$dumpfile(`ACTIVITY_DUMP);
+	$dumpvars(0, `ACTIVITY_SCOPE);
+	$dumpoff;
+end
+
+always @ (activity_enable) begin
+	if (activity_enable) begin
+		$dumpon;
+	end else begin
+		$dumpoff;
+	end
+end
+`endif
+
 endmodule
@@ -0,0 +1,172 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Per-test wall time and simulated time history for the cocotb regression.
+#
+# Each run appends one JSON record to a history file (one record per line).
+# The report compares the latest run against the median of the previous few
+# passing runs of each test, and flags tests which got slower by more than a
+# threshold, either in wall time or in simulated cycles. Tests can also save
+# named metrics (e.g. boot time) to metrics.jsonl next to results.xml, which are
+# tracked the same way.
+
+import argparse
+import datetime
+import json
+import statistics
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+# Must match CLK_PERIOD in tb/tb.v
+CLK_PERIOD_NS = 1000.0 / 24
+
+# Keys of a record which identify the simulation configuration. Only records
+# with the same configuration are comparable.
+CONFIG_KEYS = ("sim", "gl", "gl_netlist", "gl_blocks")
+
+DEFAULT_HISTORY = Path(__file__).resolve().parent / "timing_history.jsonl"
+
+def git_describe():
+    rc = subprocess.run(["git", "describe", "--always", "--dirty"],
+        capture_output=True, text=True, cwd=Path(__file__).resolve().parent)
+    return rc.stdout.strip() if rc.returncode == 0 else None
+
+def parse_results(results_xml):
+    """Return {test name: {"status", "wall_s", "sim_ns", "cycles"}} from a
+    cocotb results.xml."""
+    tests = {}
+    for tc in ET.parse(results_xml).getroot().iter("testcase"):
+        if tc.find("skipped") is not None:
+            continue
+        failed = tc.find("failure") is not None or tc.find("error") is not None
+        sim_ns = float(tc.get("sim_time_ns", 0))
+        tests[tc.get("name")] = {
+            "status": "fail" if failed else "pass",
+            "wall_s": float(tc.get("time", 0)),
+            "sim_ns": sim_ns,
+            "cycles": round(sim_ns / CLK_PERIOD_NS),
+        }
+    return tests
+
+def parse_metrics(results_xml):
+    """Return {name: value} from the metrics.jsonl written alongside a
+    results.xml by record_metric() in chip_top_tb.py."""
+    path = Path(results_xml).with_name("metrics.jsonl")
+    if not path.exists():
+        return {}
+    metrics = {}
+    with open(path) as f:
+        for l in f:
+            if l.strip():
+                m = json.loads(l)
+                metrics[m["name"]] = m["value"]
+    return metrics
+
+def record(results_xml, history=DEFAULT_HISTORY, **info):
+    """Append the timings from one results.xml to the history file. Extra
+    keyword arguments (e.g. sim="icarus") are stored with the record."""
+    return record_entry(parse_results(results_xml), parse_metrics(results_xml), history, **info)
+
+def record_entry(tests, metrics, history=DEFAULT_HISTORY, **info):
+    """Append one record of already-collected results to the history file."""
+    entry = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_describe(),
+        **info,
+        "tests": tests,
+        "metrics": metrics,
+    }
+    with open(history, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    return entry
+
+def load(history=DEFAULT_HISTORY):
+    if not Path(history).exists():
+        return []
+    with open(history) as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+def config(entry):
+    """Simulation configuration of a record, as {key: value} of the
+    CONFIG_KEYS it has."""
+    return {k: entry[k] for k in CONFIG_KEYS if k in entry}
+
+def same_config(entries, info):
+    """The records of entries with the configuration info."""
+    return [e for e in entries if config(e) == info]
+
+def find_regressions(entries, threshold=0.2, window=5, keys=("cycles", "wall_s")):
+    """Compare the last entry against the median of up to `window` earlier
+    passing results for each test. Return a list of
+    (test, key, baseline, latest, ratio) for every value which exceeds
+    baseline * (1 + threshold). Metrics are reported with key "metric"."""
+    if not entries:
+        return []
+    latest = entries[-1]
+    regressions = []
+    for name, value in latest.get("metrics", {}).items():
+        prev = [e["metrics"][name] for e in entries[:-1] if name in e.get("metrics", {})][-window:]
+        if prev:
+            baseline = statistics.median(prev)
+            if baseline > 0 and value > baseline * (1 + threshold):
+                regressions.append((name, "metric", baseline, value, value / baseline))
+    for name, result in latest["tests"].items():
+        if result["status"] != "pass":
+            continue
+        prev = [e["tests"][name] for e in entries[:-1]
+            if name in e["tests"] and e["tests"][name]["status"] == "pass"]
+        prev = prev[-window:]
+        if not prev:
+            continue
+        for key in keys:
+            baseline = statistics.median(p[key] for p in prev)
+            if baseline > 0 and result[key] > baseline * (1 + threshold):
+                regressions.append((name, key, baseline, result[key], result[key] / baseline))
+    return regressions
+
+def report(entries, threshold=0.2, window=5, keys=("cycles", "wall_s"), file=sys.stdout):
+    if not entries:
+        print("No timing history.", file=file)
+        return []
+    latest = entries[-1]
+    print(f"{'Test':<60} {'Status':<6} {'Cycles':>12} {'Wall (s)':>10}", file=file)
+    for name, r in latest["tests"].items():
+        print(f"{name:<60} {r['status']:<6} {r['cycles']:>12} {r['wall_s']:>10.2f}", file=file)
+    for name, value in latest.get("metrics", {}).items():
+        print(f"Metric {name}: {value:g}", file=file)
+    regressions = find_regressions(entries, threshold, window, keys)
+    if regressions:
+        print(f"\nSlower than baseline (median of last {window} passes) by more than {threshold:.0%}:", file=file)
+        for name, key, baseline, value, ratio in regressions:
+            print(f"  {name}: {key} {baseline:g} -> {value:g} ({ratio:.2f}x)", file=file)
+    else:
+        print(f"\nNo timing regressions beyond {threshold:.0%}.", file=file)
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Record and report per-test regression timings"
+    )
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="history file")
+    parser.add_argument("--record", metavar="RESULTS_XML",
+        help="append the results of one run before reporting")
+    parser.add_argument("--threshold", type=float, default=0.2,
+        help="fractional slowdown to flag, e.g. 0.2 for 20%%")
+    parser.add_argument("--window", type=int, default=5,
+        help="number of previous passing runs in the baseline")
+    parser.add_argument("--cycles-only", action="store_true",
+        help="ignore wall time, which is noisy on shared machines")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.history)
+    keys = ("cycles",) if args.cycles_only else ("cycles", "wall_s")
+    # Compare the latest run only against runs with the same configuration
+    history = load(args.history)
+    if history:
+        history = same_config(history, config(history[-1]))
+    regressions = report(history, args.threshold, args.window, keys)
+    sys.exit(1 if regressions else 0)
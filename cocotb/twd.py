@@ -0,0 +1,736 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Two-wire debug (TWD) host, independent of how the wires are driven.
+#
+# A Transport carries bit-level shifts to the target: PinTransport drives the
+# DIO/DCK pins of a cocotb simulation, and SocketTransport sends the shifts to
+# a TCP server, which is a debug adapter on the bench, or the TWDEmulator
+# here (run this file to start one). EmulatorTransport shifts straight into a
+# TWDEmulator. Shifts are queued and only performed on flush(), so a batch of
+# commands costs one round trip over a socket.
+#
+# A TWD is one connection over a transport, with its own cached bus address.
+# Writes and reads are queued, and all of it goes out on the next flush(),
+# with the sticky error flags checked once at the end.
+# rvdebug.py builds the RISC-V debug module on top.
+#
+# SocketTransport protocol: the host sends ops, each a kind byte, b"o" (shift
+# out) or b"i" (shift in), then the number of bits as a u16, then for b"o"
+# the bits as a little-endian integer of ceil(n / 8) bytes. A b"f" byte ends
+# the batch, and the server replies with the bits of each b"i" of the batch,
+# in order and in the same encoding. Bits go on the wire in shift_order().
+
+import argparse
+import logging
+import socket
+import struct
+
+TWD_CMD_DISCONNECT = 0x0
+TWD_CMD_R_IDCODE   = 0x1
+TWD_CMD_R_AINFO    = 0x2
+TWD_CMD_R_STAT     = 0x4
+TWD_CMD_W_CSR      = 0x6
+TWD_CMD_R_CSR      = 0x7
+TWD_CMD_R_ADDR     = 0x8
+TWD_CMD_W_ADDR     = 0x9
+TWD_CMD_W_ADDR_R   = 0xa
+TWD_CMD_R_DATA     = 0xb
+TWD_CMD_W_DATA     = 0xc
+TWD_CMD_R_BUFF     = 0xd
+
+TWD_CSR_VERSION_LSB       = 28
+TWD_CSR_VERSION_BITS      = 0xf << TWD_CSR_VERSION_LSB
+TWD_CSR_ASIZE_LSB         = 24
+TWD_CSR_ASIZE_BITS        = 0x7 << TWD_CSR_ASIZE_LSB
+TWD_CSR_EPARITY_BITS      = 1 << 18
+TWD_CSR_EBUSFAULT_BITS    = 1 << 17
+TWD_CSR_EBUSY_BITS        = 1 << 16
+TWD_CSR_AINCR_BITS        = 1 << 12
+TWD_CSR_BUSY_BITS         = 1 << 8
+TWD_CSR_NDTMRESETACK_BITS = 1 << 5
+TWD_CSR_NDTMRESETREQ_BITS = 1 << 4
+TWD_CSR_MDROPADDR_BITS    = 0xf
+
+TWD_CSR_ERR_BITS = TWD_CSR_EPARITY_BITS | TWD_CSR_EBUSFAULT_BITS | TWD_CSR_EBUSY_BITS
+
+TWD_STAT_BUSY = 1 << 0
+
+# Data bits of each command, for an 8-bit bus address (ASIZE 0)
+TWD_CMD_READ_BITS = {
+    TWD_CMD_R_IDCODE: 32,
+    TWD_CMD_R_AINFO:  32,
+    TWD_CMD_R_STAT:   4,
+    TWD_CMD_R_CSR:    32,
+    TWD_CMD_R_ADDR:   8,
+    TWD_CMD_R_DATA:   32,
+    TWD_CMD_R_BUFF:   32,
+}
+TWD_CMD_WRITE_BITS = {
+    TWD_CMD_W_CSR:    32,
+    TWD_CMD_W_ADDR:   8,
+    TWD_CMD_W_ADDR_R: 8,
+    TWD_CMD_W_DATA:   32,
+}
+
+TWD_CONNECT_SEQ = bytes([
+    0x00, 0xa7, 0xa3, 0x92, 0xdd, 0x9a, 0xbf, 0x04, 0x31, 0xff, 0xff,
+    0xff, 0xff, 0xff, 0xff, 0xff, 0xff, 0xff, 0x0f
+])
+
+# Max status polls for a bus read to complete
+TWD_MAX_POLLS = 10
+
+TWD_EMULATOR_PORT = 9824
+
+
+class TWDError(Exception):
+    pass
+
+
+def odd_parity(x):
+    return 1 - (x.bit_count() & 1)
+
+
+def shift_order(n):
+    """Bit indices of an n-bit field in the order they are shifted: a byte at
+    a time, least-significant byte first and each byte MSB first. Fields of
+    under 8 bits go MSB first."""
+    if n % 8 != 0:
+        return range(n - 1, -1, -1)
+    return [i ^ 0x7 for i in range(n)]
+
+
+def n_bytes(n_bits):
+    return (n_bits + 7) // 8
+
+
+###############################################################################
+# Transports
+
+class Pending:
+    """Result of a queued shift-in, set when the transport is flushed."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = None
+
+
+class Transport:
+    """Queue of bit-level shifts to a TWD target. Subclasses implement
+    _execute(ops), which performs ("o", bits, n) and ("i", Pending, n) ops in
+    order and sets the value of each Pending. round_trips and bits count
+    the flushes and the DCK cycles shifted."""
+
+    def __init__(self):
+        self.queue = []
+        self.round_trips = 0
+        self.bits = 0
+
+    def shift_out(self, bits, n):
+        self.queue.append(("o", bits, n))
+
+    def shift_in(self, n):
+        p = Pending()
+        self.queue.append(("i", p, n))
+        return p
+
+    async def flush(self):
+        if not self.queue:
+            return
+        ops, self.queue = self.queue, []
+        self.round_trips += 1
+        self.bits += sum(n for _, _, n in ops)
+        await self._execute(ops)
+
+    async def _execute(self, ops):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PinTransport(Transport):
+    """Bit-bang the DIO and DCK pins of a cocotb simulation, at the given DCK
+    period in ns. DIO is released whenever the target drives it."""
+
+    def __init__(self, dio, dck, period_ns=50):
+        super().__init__()
+        self.dio = dio
+        self.dck = dck
+        self.period_ns = period_ns
+
+    async def _execute(self, ops):
+        from cocotb.handle import Release
+        from cocotb.triggers import Timer
+        half = self.period_ns / 2
+        for kind, x, n in ops:
+            if kind == "o":
+                for b in shift_order(n):
+                    self.dio.value = (x >> b) & 1
+                    await Timer(half, "ns")
+                    self.dck.value = 1
+                    await Timer(half, "ns")
+                    self.dck.value = 0
+            else:
+                accum = 0
+                self.dio.value = Release()
+                for b in shift_order(n):
+                    accum |= (int(self.dio.value) & 1) << b
+                    await Timer(half, "ns")
+                    self.dck.value = 1
+                    await Timer(half, "ns")
+                    self.dck.value = 0
+                x.value = accum
+
+
+class SocketTransport(Transport):
+    """Send shifts to an adapter or emulator listening on host:port, one
+    round trip per flush. The socket is blocking, which in a simulation just
+    stops simulated time until the reply arrives."""
+
+    def __init__(self, host="localhost", port=TWD_EMULATOR_PORT, timeout=10):
+        super().__init__()
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def _execute(self, ops):
+        req = bytearray()
+        reads = []
+        for kind, x, n in ops:
+            req += struct.pack("<cH", kind.encode(), n)
+            if kind == "o":
+                req += x.to_bytes(n_bytes(n), "little")
+            else:
+                reads.append((x, n))
+        req += b"f"
+        self.sock.sendall(req)
+        resp = recv_exactly(self.sock, sum(n_bytes(n) for _, n in reads))
+        pos = 0
+        for p, n in reads:
+            p.value = int.from_bytes(resp[pos:pos + n_bytes(n)], "little")
+            pos += n_bytes(n)
+
+    def close(self):
+        self.sock.close()
+
+
+class EmulatorTransport(Transport):
+    """Shift straight into a TWDEmulator in this process."""
+
+    def __init__(self, emulator):
+        super().__init__()
+        self.emulator = emulator
+
+    async def _execute(self, ops):
+        for kind, x, n in ops:
+            if kind == "o":
+                for b in shift_order(n):
+                    self.emulator.clock((x >> b) & 1)
+            else:
+                accum = 0
+                for b in shift_order(n):
+                    accum |= (self.emulator.clock(None) or 0) << b
+                x.value = accum
+
+
+def recv_exactly(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        data = sock.recv(n - len(buf))
+        if not data:
+            raise ConnectionError("TWD transport disconnected")
+        buf += data
+    return bytes(buf)
+
+
+###############################################################################
+# Connection
+
+class TWDRead:
+    """Handle for a queued bus read. value is the read data once the batch
+    has been flushed and checked."""
+
+    __slots__ = ("addr", "stat", "buff", "value")
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.stat = None
+        self.buff = None
+        self.value = None
+
+
+class TWD:
+    """A TWD connection over a transport.
+
+    With pipelined=True, queued accesses are all sent on the next flush(),
+    back to back: writes as [W_ADDR,] W_DATA, reads as W_ADDR_R, R_STAT,
+    R_BUFF, with no status polls. An access issued while the previous one is
+    still in flight is dropped and sets the sticky EBUSY flag, and no access
+    starts while an error flag is set, so one R_CSR at the end of the flush
+    shows whether all of it was accepted. A read whose STAT shows BUSY was
+    too slow for its R_BUFF, and is finished off or read again.
+
+    On an error, the connection waits for the bus, clears the flags, and
+    redoes the batch from the last good check, unpipelined. This can repeat
+    accesses which went through, so writes which aren't safe to repeat are
+    queued with replay=False, and checked on their own: an R_CSR before and
+    after one shows whether it was accepted. Reads with side effects belong
+    after a barrier().
+
+    With pipelined=False, every access is polled to completion on its own,
+    in order, on flush()."""
+
+    def __init__(self, transport, pipelined=True, log=None):
+        self.transport = transport
+        self.pipelined = pipelined
+        self.log = log or logging.getLogger(__name__)
+        self.cached_addr = None
+        # Queued accesses, ("w", addr, wdata) or ("r", addr, TWDRead), and
+        # when pipelining, ("c", None, csr) for the Pending of each R_CSR
+        self.batch = []
+        # Accesses queued since the last R_CSR
+        self.unchecked = False
+        # Read data and parity Pendings of the queued commands
+        self.parity_checks = []
+
+    def command(self, cmd, n_bits, wdata=None):
+        """Queue a command. Return a Pending for the data of a read, whose
+        parity is checked when the transport is flushed."""
+        t = self.transport
+        t.shift_out(1 << 5 | (cmd << 1) | odd_parity(cmd), 6)
+        if cmd == TWD_CMD_DISCONNECT:
+            return None
+        if wdata is None:
+            t.shift_in(2)
+            rdata = t.shift_in(n_bits)
+            parity = t.shift_in(1)
+            t.shift_in(3)
+            self.parity_checks.append((cmd, rdata, parity))
+            return rdata
+        t.shift_out(0, 2)
+        t.shift_out(wdata, n_bits)
+        t.shift_out(odd_parity(wdata) << 3, 4)
+        return None
+
+    async def flush_transport(self):
+        """Send the queued commands and check the parity of their replies,
+        without checking any bus access."""
+        await self.transport.flush()
+        checks, self.parity_checks = self.parity_checks, []
+        for cmd, rdata, parity in checks:
+            if parity.value != odd_parity(rdata.value):
+                raise TWDError(f"Bad parity on reply to command {cmd:#x}")
+
+    async def connect(self):
+        """Connect, check the DTM version and address size, and clear the
+        error flags."""
+        self.cached_addr = None
+        self.batch = []
+        self.unchecked = False
+        self.transport.shift_in(80)
+        self.command(TWD_CMD_DISCONNECT, 0)
+        for b in TWD_CONNECT_SEQ:
+            self.transport.shift_out(b, 8)
+        csr = self.command(TWD_CMD_R_CSR, 32)
+        await self.flush_transport()
+        version = (csr.value & TWD_CSR_VERSION_BITS) >> TWD_CSR_VERSION_LSB
+        asize = (csr.value & TWD_CSR_ASIZE_BITS) >> TWD_CSR_ASIZE_LSB
+        if version != 1 or asize != 0:
+            raise TWDError(f"Unsupported DTM (CSR {csr.value:08x})")
+        self.command(TWD_CMD_W_CSR, 32, TWD_CSR_ERR_BITS)
+        await self.flush_transport()
+
+    async def disconnect(self):
+        await self.flush()
+        self.command(TWD_CMD_DISCONNECT, 0)
+        await self.flush_transport()
+
+    async def read_idcode(self):
+        idcode = self.command(TWD_CMD_R_IDCODE, 32)
+        await self.flush_transport()
+        return idcode.value
+
+    async def read_csr(self):
+        csr = self.command(TWD_CMD_R_CSR, 32)
+        await self.flush_transport()
+        return csr.value
+
+    def _send_write(self, addr, wdata):
+        if addr != self.cached_addr:
+            self.command(TWD_CMD_W_ADDR, 8, addr)
+            self.cached_addr = addr
+        self.command(TWD_CMD_W_DATA, 32, wdata)
+
+    def _queue_check(self):
+        if self.unchecked:
+            self.batch.append(("c", None, self.command(TWD_CMD_R_CSR, 32)))
+            self.unchecked = False
+
+    def queue_write(self, addr, wdata, replay=True):
+        """Queue a write. With replay=False, it is never redone once the DTM
+        has accepted it, at the cost of an R_CSR before and after it."""
+        if self.pipelined and not replay:
+            self._queue_check()
+        self.batch.append(("w", addr, wdata))
+        if self.pipelined:
+            self._send_write(addr, wdata)
+            self.unchecked = True
+            if not replay:
+                self._queue_check()
+
+    def queue_read(self, addr):
+        """Queue a read, which observes every earlier write. Return a TWDRead
+        whose value is set by the next flush()."""
+        r = TWDRead(addr)
+        self.batch.append(("r", addr, r))
+        if self.pipelined:
+            self.cached_addr = addr
+            self.command(TWD_CMD_W_ADDR_R, 8, addr)
+            r.stat = self.command(TWD_CMD_R_STAT, 4)
+            r.buff = self.command(TWD_CMD_R_BUFF, 32)
+            self.unchecked = True
+        return r
+
+    async def flush(self):
+        """Send everything queued, and check it."""
+        if self.pipelined:
+            self._queue_check()
+        batch, self.batch = self.batch, []
+        if not self.pipelined:
+            await self._replay(batch)
+            return
+        await self.flush_transport()
+        # Everything up to a good check was accepted
+        start = 0
+        for i, (kind, _, csr) in enumerate(batch):
+            if kind != "c":
+                continue
+            if csr.value & TWD_CSR_ERR_BITS:
+                await self._recover(batch, start, i, csr.value)
+                return
+            start = i + 1
+        await self._finish_reads(batch, len(batch))
+
+    async def _recover(self, batch, start, i, csr):
+        """The check at batch[i] failed with the error flags in csr, and
+        batch[:start] was accepted. Clear the flags, finish the reads of
+        batch[:start], and redo the rest unpipelined."""
+        redo = [access for access in batch[start:] if access[0] != "c"]
+        await self._wait_idle()
+        self.log.warning(f"TWD error flags {csr & TWD_CSR_ERR_BITS:05x}, "
+            f"redoing {len(redo)} queued accesses unpipelined")
+        # Flags are write-1-to-clear. The dropped access may have been a
+        # W_ADDR, so forget the cached address too.
+        self.command(TWD_CMD_W_CSR, 32, TWD_CSR_ERR_BITS)
+        self.cached_addr = None
+        await self.flush_transport()
+        if csr & TWD_CSR_EBUSFAULT_BITS:
+            # A write completed with a fault, which redoing it won't fix
+            raise TWDError("TWD bus fault")
+        await self._finish_reads(batch[:i], start)
+        await self._replay(redo)
+        csr = await self.read_csr()
+        if csr & TWD_CSR_ERR_BITS:
+            raise TWDError(f"TWD error flags {csr & TWD_CSR_ERR_BITS:05x} after unpipelined replay")
+
+    async def _finish_reads(self, batch, n):
+        """Set the values of the reads in batch[:n], which were accepted.
+        batch is what was sent up to the first failed check, if any."""
+        for i, (kind, addr, r) in enumerate(batch[:n]):
+            if kind != "r":
+                continue
+            if (r.stat.value & TWD_STAT_BUSY) == 0:
+                r.value = r.buff.value
+                continue
+            # Too slow for its R_BUFF. Writes after it leave its data in
+            # BUFF, but a later read replaces it, and then it's read again.
+            kinds = {kind for kind, _, _ in batch[i + 1:]}
+            if "r" not in kinds:
+                r.value = await self._finish_read(addr)
+            elif "w" in kinds:
+                raise TWDError(f"TWD read of {addr:#x} too slow to pipeline with later writes")
+            else:
+                r.value = await self._read_polled(addr)
+
+    async def _replay(self, batch):
+        for kind, addr, x in batch:
+            if kind == "w":
+                await self._write_polled(addr, x)
+            else:
+                x.value = await self._read_polled(addr)
+
+    async def _wait_idle(self):
+        while True:
+            csr = await self.read_csr()
+            if (csr & TWD_CSR_BUSY_BITS) == 0:
+                return csr
+
+    async def _finish_read(self, addr):
+        for i in range(TWD_MAX_POLLS):
+            stat = self.command(TWD_CMD_R_STAT, 4)
+            await self.flush_transport()
+            if (stat.value & TWD_STAT_BUSY) == 0:
+                break
+        else:
+            raise TWDError(f"TWD read of {addr:#x} did not complete")
+        buff = self.command(TWD_CMD_R_BUFF, 32)
+        await self.flush_transport()
+        return buff.value
+
+    async def _write_polled(self, addr, wdata):
+        self._send_write(addr, wdata)
+        while True:
+            stat = self.command(TWD_CMD_R_STAT, 4)
+            await self.flush_transport()
+            if (stat.value & TWD_STAT_BUSY) == 0:
+                break
+
+    async def _read_polled(self, addr):
+        self.cached_addr = addr
+        self.command(TWD_CMD_W_ADDR_R, 8, addr)
+        return await self._finish_read(addr)
+
+    async def write_bus(self, addr, wdata):
+        """Queue a write and flush. When pipelining, it's checked for having
+        been accepted, but may still be in flight, see barrier()."""
+        self.queue_write(addr, wdata)
+        await self.flush()
+
+    async def read_bus(self, addr):
+        r = self.queue_read(addr)
+        await self.flush()
+        return r.value
+
+    async def read_bus_many(self, addrs):
+        """Read several addresses in one round trip."""
+        reads = [self.queue_read(a) for a in addrs]
+        await self.flush()
+        return [r.value for r in reads]
+
+    async def barrier(self):
+        """Flush, then wait for the last write to complete, and check that
+        none of them faulted. No-op when not pipelining."""
+        await self.flush()
+        if not self.pipelined:
+            return
+        csr = await self._wait_idle()
+        if csr & TWD_CSR_ERR_BITS:
+            self.command(TWD_CMD_W_CSR, 32, TWD_CSR_ERR_BITS)
+            await self.flush_transport()
+            raise TWDError(f"TWD error flags {csr & TWD_CSR_ERR_BITS:05x} at barrier")
+
+
+###############################################################################
+# Emulator
+
+class TWDEmulator:
+    """Bit-level model of a TWD target, to exercise hosts and transports
+    without hardware. The bus behind the DTM is a dict of 32-bit words, read
+    as 0 where absent. Every bus access keeps the DTM busy for bus_latency
+    DCK cycles, and an access issued while busy is dropped with EBUSY, as on
+    the real DTM. No access starts while an error flag is set. Only the BUSY
+    bit of STAT is modelled, and R_DATA returns BUFF and starts a read of
+    ADDR."""
+
+    def __init__(self, bus=None, idcode=0x00280035, bus_latency=2):
+        self.bus = {} if bus is None else bus
+        self.idcode = idcode
+        self.bus_latency = bus_latency
+        self.connected = False
+        self.addr = 0
+        self.buff = 0
+        self.aincr = False
+        self.err = 0
+        self.busy = 0
+        self.access = None
+        self.seq_bits = 8 * len(TWD_CONNECT_SEQ)
+        self.seq = 0
+        for b in TWD_CONNECT_SEQ:
+            for i in shift_order(8):
+                self.seq = self.seq << 1 | (b >> i) & 1
+        self.history = 0
+        self.target = self._run()
+        next(self.target)
+
+    def clock(self, bit):
+        """One DCK cycle. bit is the host's DIO, or None if released. Return
+        the target's DIO, or None if not driving."""
+        self._tick()
+        if not self.connected:
+            if bit is not None:
+                mask = (1 << self.seq_bits) - 1
+                self.history = (self.history << 1 | bit) & mask
+                if self.history == self.seq:
+                    self.connected = True
+                    self.history = 0
+                    self.target = self._run()
+                    next(self.target)
+            return None
+        return self.target.send(bit)
+
+    def _tick(self):
+        if self.busy:
+            self.busy -= 1
+            if self.busy == 0:
+                kind, addr, wdata = self.access
+                if kind == "r":
+                    self.buff = self.bus.get(addr, 0)
+                else:
+                    self.bus[addr] = wdata
+
+    def _start(self, kind, addr, wdata=None):
+        if self.err:
+            return False
+        if self.busy:
+            self.err |= TWD_CSR_EBUSY_BITS
+            return False
+        self.access = (kind, addr, wdata)
+        self.busy = self.bus_latency
+        if self.busy == 0:
+            self.busy = 1
+            self._tick()
+        return True
+
+    def _run(self):
+        """Generator for a connected target. Each cycle it is sent the host's
+        bit, and yields the target's bit for that same cycle."""
+        bit = yield None
+        while True:
+            # Idle until a start bit
+            if bit != 1:
+                bit = yield None
+                continue
+            cmd_bits = 0
+            for i in range(5):
+                bit = yield None
+                cmd_bits = cmd_bits << 1 | (bit or 0)
+            cmd, parity = cmd_bits >> 1, cmd_bits & 1
+            if parity != odd_parity(cmd):
+                self.err |= TWD_CSR_EPARITY_BITS
+                bit = yield None
+                continue
+            if cmd == TWD_CMD_DISCONNECT:
+                self.connected = False
+                yield None
+                return
+            if cmd in TWD_CMD_READ_BITS:
+                n = TWD_CMD_READ_BITS[cmd]
+                rdata = self._read(cmd) & ((1 << n) - 1)
+                # Turnaround, data, parity, turnaround
+                bit = yield None
+                for i in range(2):
+                    bit = yield 0
+                for b in shift_order(n):
+                    bit = yield (rdata >> b) & 1
+                bit = yield odd_parity(rdata)
+                for i in range(3):
+                    bit = yield 0
+            elif cmd in TWD_CMD_WRITE_BITS:
+                n = TWD_CMD_WRITE_BITS[cmd]
+                for i in range(3):
+                    bit = yield None
+                wdata = 0
+                for b in shift_order(n):
+                    wdata |= (bit or 0) << b
+                    bit = yield None
+                parity = bit or 0
+                for i in range(4):
+                    bit = yield None
+                if parity != odd_parity(wdata):
+                    self.err |= TWD_CSR_EPARITY_BITS
+                else:
+                    self._write(cmd, wdata)
+            else:
+                bit = yield None
+
+    def _read(self, cmd):
+        if cmd == TWD_CMD_R_IDCODE:
+            return self.idcode
+        if cmd == TWD_CMD_R_CSR:
+            return (1 << TWD_CSR_VERSION_LSB | self.err |
+                (TWD_CSR_AINCR_BITS if self.aincr else 0) |
+                (TWD_CSR_BUSY_BITS if self.busy else 0))
+        if cmd == TWD_CMD_R_STAT:
+            return TWD_STAT_BUSY if self.busy else 0
+        if cmd == TWD_CMD_R_ADDR:
+            return self.addr
+        if cmd == TWD_CMD_R_BUFF:
+            return self.buff
+        if cmd == TWD_CMD_R_DATA:
+            rdata = self.buff
+            if self._start("r", self.addr) and self.aincr:
+                self.addr = (self.addr + 1) & 0xff
+            return rdata
+        return 0
+
+    def _write(self, cmd, wdata):
+        if cmd == TWD_CMD_W_CSR:
+            self.err &= ~(wdata & TWD_CSR_ERR_BITS)
+            self.aincr = bool(wdata & TWD_CSR_AINCR_BITS)
+        elif cmd == TWD_CMD_W_ADDR:
+            if self.busy:
+                self.err |= TWD_CSR_EBUSY_BITS
+            else:
+                self.addr = wdata
+        elif cmd == TWD_CMD_W_ADDR_R:
+            if not self.busy:
+                self.addr = wdata
+            self._start("r", wdata)
+        elif cmd == TWD_CMD_W_DATA:
+            if self._start("w", self.addr, wdata) and self.aincr:
+                self.addr = (self.addr + 1) & 0xff
+
+
+def serve_session(emulator, conn):
+    """Run one SocketTransport session against the emulator."""
+    f = conn.makefile("rb")
+    reply = bytearray()
+    while True:
+        kind = f.read(1)
+        if not kind:
+            return
+        if kind == b"f":
+            conn.sendall(reply)
+            reply = bytearray()
+            continue
+        n, = struct.unpack("<H", f.read(2))
+        if kind == b"o":
+            bits = int.from_bytes(f.read(n_bytes(n)), "little")
+            for b in shift_order(n):
+                emulator.clock((bits >> b) & 1)
+        elif kind == b"i":
+            accum = 0
+            for b in shift_order(n):
+                accum |= (emulator.clock(None) or 0) << b
+            reply += accum.to_bytes(n_bytes(n), "little")
+        else:
+            raise TWDError(f"Bad op {kind!r}")
+
+
+def serve(emulator, port=TWD_EMULATOR_PORT, host="localhost"):
+    """Serve SocketTransport connections to the emulator, one at a time,
+    until interrupted."""
+    with socket.create_server((host, port)) as srv:
+        while True:
+            conn, peer = srv.accept()
+            print(f"Connection from {peer[0]}:{peer[1]}")
+            with conn:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                try:
+                    serve_session(emulator, conn)
+                except (ConnectionError, TWDError) as e:
+                    print(f"Session ended: {e}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="TWD target emulator, for SocketTransport")
+    parser.add_argument("--port", type=int, default=TWD_EMULATOR_PORT, help="TCP port on localhost")
+    parser.add_argument("--idcode", type=lambda x: int(x, 0), default=0x00280035, help="IDCODE")
+    parser.add_argument("--latency", type=int, default=2, help="bus access time, in DCK cycles")
+
+    args = parser.parse_args()
+
+    print(f"Emulating TWD target on localhost:{args.port}")
+    serve(TWDEmulator(idcode=args.idcode, bus_latency=args.latency), args.port)
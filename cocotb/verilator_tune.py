@@ -0,0 +1,105 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Verilator thread-count autotuner.
+#
+# Builds the testbench with Verilator at a few thread counts, runs a reference
+# test on each build, and records the fastest configuration for this host in
+# verilator_profile.json, where build_sim() in chip_top_tb.py picks it up.
+# Builds and runs are done one at a time, since parallel jobs would compete
+# for the cores being measured.
+#
+# Whether extra threads help depends on the machine (core count, cache, SMT)
+# more than on the design, so the profile is keyed by hostname and each
+# machine should be tuned separately.
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import timing_history
+
+THREADS = [1, 2, 4, 8]
+
+# Runs a good mix of CPU, bus and peripheral activity in a few seconds
+REFERENCE_TEST = "test_execute_eram/app=hellow$"
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Tune the Verilator thread count for this host")
+    parser.add_argument("--threads", type=int, nargs="+",
+        default=[n for n in THREADS if n <= os.cpu_count()], help="thread counts to try")
+    parser.add_argument("--filter", default=REFERENCE_TEST, help="reference test(s) to time")
+    parser.add_argument("--repeat", type=int, default=2, help="runs per thread count (fastest is kept)")
+    parser.add_argument("--out", default="tune_build", help="output directory")
+    parser.add_argument("--dry-run", action="store_true", help="don't update the profile")
+    args = parser.parse_args()
+
+    from chip_top_tb import sim, build_sim, swtest_root, verilator_profile, verilator_profile_file
+    assert sim == "verilator", "Run with SIM=verilator"
+
+    out_dir = Path(args.out).resolve()
+    # Build the firmware up front so it isn't counted in the first run
+    rc = subprocess.run(["make", "-C", swtest_root / "eram", "APP=hellow"])
+    assert rc.returncode == 0
+
+    results = {}
+    for threads in args.threads:
+        profile = dict(verilator_profile(), threads=threads)
+        build_dir = out_dir / f"threads{threads}"
+        t0 = time.monotonic()
+        runner = build_sim(build_dir, waves=False, profile=profile)
+        build_s = time.monotonic() - t0
+        run_s = None
+        for i in range(args.repeat):
+            results_xml = runner.test(
+                hdl_toplevel="tb",
+                test_module="chip_top_tb",
+                build_dir=build_dir,
+                test_dir=build_dir,
+                results_xml=build_dir / f"results{i}.xml",
+                test_filter=args.filter,
+                waves=False,
+            )
+            tests = timing_history.parse_results(results_xml)
+            if not tests or any(t["status"] != "pass" for t in tests.values()):
+                run_s = None
+                break
+            wall_s = sum(t["wall_s"] for t in tests.values())
+            run_s = wall_s if run_s is None else min(run_s, wall_s)
+        results[threads] = {"profile": profile, "build_s": build_s, "run_s": run_s}
+
+    print(f"{'Threads':>7} {'Build (s)':>10} {'Run (s)':>8}")
+    for threads, r in results.items():
+        run = "FAILED" if r["run_s"] is None else f"{r['run_s']:.2f}"
+        print(f"{threads:>7} {r['build_s']:>10.1f} {run:>8}")
+
+    passed = {threads: r for threads, r in results.items() if r["run_s"] is not None}
+    if not passed:
+        sys.exit(1)
+    best = min(passed, key=lambda threads: passed[threads]["run_s"])
+    print(f"Fastest: {best} thread(s)")
+
+    if not args.dry_run:
+        profiles = {}
+        if verilator_profile_file.exists():
+            with open(verilator_profile_file) as f:
+                profiles = json.load(f)
+        profiles[socket.gethostname()] = {
+            "profile": passed[best]["profile"],
+            "cpu_count": os.cpu_count(),
+            "reference": args.filter,
+            "run_s": {str(threads): r["run_s"] for threads, r in results.items()},
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        with open(verilator_profile_file, "w") as f:
+            json.dump(profiles, f, indent=2)
+        print(f"Updated {verilator_profile_file}")
+
+    sys.exit(1 if len(passed) < len(results) else 0)
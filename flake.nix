@@ -68,6 +68,9 @@
           # Verification
           cocotb
           
+          # For audio capture decimation
+          numpy
+          
           # For KLayout Python DRC runner
           docopt
           
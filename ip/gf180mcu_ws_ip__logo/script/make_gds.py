@@ -3,9 +3,37 @@
 
 import klayout.db as db
 import argparse
+import os
 from PIL import Image
 
 
+def merge_tiled(region, dbu, tile_size, threads):
+    """Merge region tile by tile, in parallel. Merging is local, so only the
+    polygons cut by a tile border have to be merged again to join them up.
+    The result is identical to region.merged()."""
+
+    inner = db.Region()
+    cut = db.Region()
+
+    tp = db.TilingProcessor()
+    tp.dbu = dbu
+    tp.tile_size(tile_size, tile_size)
+    tp.threads = threads
+    tp.input("pixels", region)
+    tp.output("inner", inner)
+    tp.output("cut", cut)
+    # _tile is nil if the region fits in a single tile
+    tp.queue("""
+        var m = pixels.merged;
+        var border = _tile ? _tile.edges : nil;
+        _output(inner, border ? m.not_interacting(border) : m);
+        border && _output(cut, m.interacting(border))
+    """)
+    tp.execute("Merge pixels")
+
+    return inner + cut.merged()
+
+
 def convert_to_gds(
     input_filepath,
     output_filepath,
@@ -21,6 +49,8 @@ def convert_to_gds(
     pixel_size=6,
     foregrounds=["1/0"],
     boundaries=["0/0"],
+    tile_size=0,
+    threads=None,
 ):
 
     ly = db.Layout()
@@ -78,26 +108,47 @@ def convert_to_gds(
     if merge:
         top_region = db.Region()
 
+    pixels = new_image_binary.load()
+
+    def is_set(x, y):
+        pixel = pixels[x, y]
+        return pixel and not invert or not pixel and invert
+
     for y in range(new_image_binary.height):
-        for x in range(new_image_binary.width):
+        row_y = (new_image_binary.height - y - 1) * pixel_size
+        x = 0
+        while x < new_image_binary.width:
             # If pixel is set
-            pixel = new_image_binary.getpixel((x, y))
-
-            if pixel and not invert or not pixel and invert:
+            if not is_set(x, y):
+                x += 1
+                continue
+
+            if merge:
+                # Insert each run of set pixels as one box: far fewer shapes
+                # to merge, for the same result
+                run_start = x
+                while x < new_image_binary.width and is_set(x, y):
+                    x += 1
+                run = db.DBox(run_start * pixel_size, row_y, x * pixel_size, row_y + pixel_size)
+                top_region.insert(from_um * db.DPolygon(run))
+            else:
                 pixel = db.DBox(0.0, 0.0, pixel_size, pixel_size).moved(
-                    x * pixel_size, (new_image_binary.height - y - 1) * pixel_size
+                    x * pixel_size, row_y
                 )
-
-                if merge:
-                    pixel_polygon = db.DPolygon(pixel)
-                    top_region.insert(from_um * pixel_polygon)
-                else:
-                    for foreground_layer in foreground_layers:
-                        top.shapes(foreground_layer).insert(pixel)
+                for foreground_layer in foreground_layers:
+                    top.shapes(foreground_layer).insert(pixel)
+                x += 1
 
     if merge:
-        top_region.merge()
-
+        if tile_size:
+            top_region = merge_tiled(
+                top_region, ly.dbu, tile_size, threads or os.cpu_count()
+            )
+        else:
+            top_region.merge()
+
+        # Smoothing works along whole polygon outlines, so it can't be tiled
+        # without changing the result, but it's cheap once merged
         if smooth:
             top_region = top_region.smoothed(from_um * pixel_size * 0.99)
 
@@ -156,6 +207,15 @@ if __name__ == "__main__":
         help="gds layer/datatype pairs for boundary e.g. 0/0",
     )
     parser.add_argument("--smooth", action="store_true", help="smooth the edges")
+    parser.add_argument(
+        "--tile-size",
+        type=float,
+        default=0,
+        help="merge in tiles of this size in um, in parallel (default: in one piece)",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=None, help="threads for tiled merging"
+    )
 
     args = parser.parse_args()
 
@@ -174,4 +234,6 @@ if __name__ == "__main__":
         pixel_size=args.pixel_size,
         foregrounds=args.foreground,
         boundaries=args.boundary,
+        tile_size=args.tile_size,
+        threads=args.threads,
     )
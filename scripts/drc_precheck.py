@@ -0,0 +1,208 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Quick DRC pre-check for generated artwork and padring layouts.
+#
+# Runs the gf180mcu metal width, spacing, wide-metal spacing and minimum area
+# rules (the ones a bad pixel size or overlap in make_gds.py would break) on
+# a single cell, without the rest of the deck. All rules on all layers are
+# checked in one pass of KLayout's tiling processor, with a tile border wide
+# enough that every check near a tile edge sees the same shapes it would
+# untiled (markers on merged shapes crossing a tile border may still be split
+# at slightly different points). Optionally also checks metal density per
+# window: the deck these IPs are signed off with has no density rules, so
+# the limits must be given.
+#
+# Violations are written as markers to a KLayout report database (.lyrdb),
+# like the full deck's report. This is a pre-check only: sign-off is still
+# the full gf180mcu.drc run.
+
+import os
+import sys
+import argparse
+import klayout.db as db
+import klayout.rdb as rdb
+
+
+# From the gf180mcu KLayout deck (see ip/*/gds/report.xml): name, min width,
+# min space, min space to wide (> 10um) metal, min area (um, um^2). Metal5 is
+# the top metal in the 5LM stack the chip uses, so it gets the MT values, but
+# its own name so its markers don't mix with MetalTop's.
+RULES = {
+    (34, 0): ("M1", 0.23, 0.23, 0.3, 0.1444),
+    (36, 0): ("M2", 0.28, 0.28, 0.3, 0.1444),
+    (42, 0): ("M3", 0.28, 0.28, 0.3, 0.1444),
+    (46, 0): ("M4", 0.28, 0.28, 0.3, 0.1444),
+    (81, 0): ("M5", 0.44, 0.46, 0.6, 0.5625),
+    (53, 0): ("MT", 0.44, 0.46, 0.6, 0.5625),
+}
+
+WIDE_METAL = 10.0
+
+
+class MarkerReceiver(db.TileOutputReceiver):
+    """Collects edge pairs or polygons from all tiles. Results near tile
+    borders are found by both neighbours, so duplicates are dropped."""
+
+    def __init__(self):
+        self.results = {}
+
+    def put(self, ix, iy, tile, obj, dbu, clip):
+        for x in obj.each():
+            self.results[str(x)] = x
+
+
+class DensityReceiver(db.TileOutputReceiver):
+    """Collects {tile box: area}."""
+
+    def __init__(self):
+        self.areas = {}
+
+    def put(self, ix, iy, tile, obj, dbu, clip):
+        self.areas[tile] = obj
+
+
+def check(layout, cell, layers, tile_size, threads):
+    """Run RULES on layers of cell. Return {(rule, description): markers},
+    markers being edge pairs, or polygons for the area rule, in dbu."""
+
+    to_dbu = lambda um: int(round(um / layout.dbu))
+
+    tp = db.TilingProcessor()
+    tp.dbu = layout.dbu
+    tp.tile_size(tile_size, tile_size)
+    # Wide metal is found by sizing down and up again by half its width, plus
+    # the largest spacing
+    tp.tile_border(WIDE_METAL + 1, WIDE_METAL + 1)
+    tp.threads = threads
+
+    receivers = {}
+    script = []
+    for i, key in enumerate(layers):
+        name, width, space, wide_space, area = RULES[key]
+        tp.input(f"m{i}", layout, cell.cell_index(), layout.layer(*key))
+        rules = {
+            (f"{name}.1", f"min. {name} width : {width}um"):
+                f"m.width_check({to_dbu(width)})",
+            (f"{name}.2a", f"min. {name} spacing : {space}um"):
+                f"m.space_check({to_dbu(space)})",
+            (f"{name}.2b", f"Space to wide {name} (length & width > {WIDE_METAL}um) : {wide_space}um"):
+                f"m.sized({-to_dbu(WIDE_METAL / 2)}).sized({to_dbu(WIDE_METAL / 2)})"
+                f".separation_check(m, {to_dbu(wide_space)})",
+            (f"{name}.3", f"Minimum {name} area : {area}um^2"):
+                f"m.with_area(0, {int(round(area / layout.dbu ** 2))}, false)",
+        }
+        lines = [f"var m = m{i}.merged"]
+        for j, (rule, expr) in enumerate(rules.items()):
+            receivers[rule] = MarkerReceiver()
+            tp.output(f"r{i}_{j}", receivers[rule])
+            # Only report markers touching this tile, the rest of the border
+            # is there for context
+            lines.append(
+                f"_output(r{i}_{j}, _tile ? ({expr}).interacting(_tile) : {expr}, false)"
+            )
+        script.append("; ".join(lines))
+
+    for s in script:
+        tp.queue(s)
+    tp.execute("DRC pre-check")
+
+    return {rule: list(r.results.values()) for rule, r in receivers.items()}
+
+
+def density(layout, cell, layers, window, threads):
+    """Return {layer: {window box: density}}, window boxes in dbu."""
+
+    tp = db.TilingProcessor()
+    tp.dbu = layout.dbu
+    tp.tile_size(window, window)
+    tp.frame = cell.dbbox()
+    tp.threads = threads
+
+    receivers = {}
+    for i, key in enumerate(layers):
+        tp.input(f"m{i}", layout, cell.cell_index(), layout.layer(*key))
+        receivers[key] = DensityReceiver()
+        tp.output(f"d{i}", receivers[key])
+        tp.queue(f"_output(d{i}, m{i}.merged.area(_tile ? _tile.bbox : _frame.bbox))")
+    tp.execute("Density")
+
+    return {
+        key: {box: a / box.area() for box, a in r.areas.items() if box.area() > 0}
+        for key, r in receivers.items()
+    }
+
+
+def main(args):
+
+    layout = db.Layout()
+    layout.read(args.layout)
+    cell = layout.cell(args.cell) if args.cell else layout.top_cell()
+    assert cell is not None, f"Cell {args.cell} not found"
+
+    present = set((i.layer, i.datatype) for i in layout.layer_infos())
+    layers = [key for key in RULES if key in present]
+
+    results = check(layout, cell, layers, args.tile_size, args.threads)
+
+    report = rdb.ReportDatabase("DRC pre-check")
+    report.top_cell_name = cell.name
+    report.generator = f"drc_precheck.py {args.layout}"
+    report_cell = report.create_cell(cell.name)
+
+    n_violations = 0
+    for (rule, description), markers in results.items():
+        cat = report.create_category(rule)
+        cat.description = f"{rule} : {description}"
+        for marker in markers:
+            report.create_item(report_cell.rdb_id(), cat.rdb_id()).add_value(marker.to_dtype(layout.dbu))
+        if markers:
+            print(f"{rule:<6} {len(markers):>6}  {description}")
+        n_violations += len(markers)
+
+    if args.density_min is not None or args.density_max is not None:
+        lo = args.density_min if args.density_min is not None else 0.0
+        hi = args.density_max if args.density_max is not None else 1.0
+        for key, windows in density(layout, cell, layers, args.density_window, args.threads).items():
+            name = RULES[key][0]
+            print(f"{name} density: min {min(windows.values()):.1%} max {max(windows.values()):.1%}")
+            bad = [box for box, d in windows.items() if not lo <= d <= hi]
+            cat = report.create_category(f"{name}.density")
+            cat.description = f"{name} density in {args.density_window}um windows outside {lo:.0%}..{hi:.0%}"
+            for box in bad:
+                report.create_item(report_cell.rdb_id(), cat.rdb_id()).add_value(box.to_dtype(layout.dbu))
+            if bad:
+                print(f"{name}.density {len(bad):>6}  windows outside {lo:.0%}..{hi:.0%}")
+            n_violations += len(bad)
+
+    report.save(args.report)
+    print(f"{n_violations} violations in {cell.name}, report in {args.report}")
+    return n_violations
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="drc_precheck", description="Quick gf180mcu metal DRC pre-check."
+    )
+    parser.add_argument("layout", help="input layout")
+    parser.add_argument("--cell", help="cell to check (default: top cell)")
+    parser.add_argument("--report", default="precheck.lyrdb", help="output report database")
+    parser.add_argument(
+        "--tile-size", type=float, default=100, help="tile size in um"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=os.cpu_count(), help="worker threads"
+    )
+    parser.add_argument(
+        "--density-window", type=float, default=100, help="density window in um"
+    )
+    parser.add_argument(
+        "--density-min", type=float, default=None, help="minimum metal density, e.g. 0.3"
+    )
+    parser.add_argument(
+        "--density-max", type=float, default=None, help="maximum metal density, e.g. 0.7"
+    )
+
+    args = parser.parse_args()
+
+    sys.exit(1 if main(args) else 0)
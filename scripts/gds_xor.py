@@ -0,0 +1,196 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Per-layer XOR of two layouts, e.g. the final GDS of two LibreLane runs.
+#
+# All layers are XORed in a single pass of KLayout's tiling processor, so the
+# die is cut into tiles which are processed in parallel, and no layer is ever
+# flattened in one piece. Reports the changed area per layer, writes the
+# differences to a GDS (on their original layers), and renders them as a
+# highlighted overlay on a lay2img-style image of the new layout.
+
+import os
+import sys
+import json
+import argparse
+import klayout.lay as lay
+import klayout.db as db
+
+from lay2img import load_view, save_images
+
+
+class AreaReceiver(db.TileOutputReceiver):
+    """Sums the per-tile areas output by the tiling processor."""
+
+    def __init__(self):
+        self.area = 0
+
+    def put(self, ix, iy, tile, obj, dbu, clip):
+        self.area += obj
+
+
+def parse_layer(s):
+    layer, datatype = s.split("/")
+    return (int(layer), int(datatype))
+
+
+def xor_layouts(layout_a, layout_b, layers, tile_size, threads):
+    """XOR layers (list of (layer, datatype)) of the top cells of layout_a and
+    layout_b. Return (diff layout, {(layer, datatype): {"a", "b", "xor"}}),
+    areas in um^2."""
+
+    assert layout_a.dbu == layout_b.dbu, "Layouts must have the same database unit"
+    top_a = layout_a.top_cell()
+    top_b = layout_b.top_cell()
+
+    diff = db.Layout()
+    diff.dbu = layout_a.dbu
+    diff_top = diff.create_cell(f"XOR_{top_b.name}")
+
+    tp = db.TilingProcessor()
+    tp.dbu = layout_a.dbu
+    tp.tile_size(tile_size, tile_size)
+    tp.threads = threads
+    # No tile border: XOR is local, so the shapes in a tile decide its
+    # result exactly
+
+    # Areas are clipped to the tile, so shapes spanning tiles aren't counted
+    # twice. _tile is nil if the layout fits in a single tile.
+    def area(r):
+        return f"(_tile ? {r}.area(_tile.bbox) : {r}.area)"
+
+    receivers = {}
+    script = []
+    for i, (layer, datatype) in enumerate(layers):
+        info = db.LayerInfo(layer, datatype)
+        # layer() creates the layer if it's missing, which is equivalent to
+        # it being empty
+        tp.input(f"a{i}", layout_a, top_a.cell_index(), layout_a.layer(info))
+        tp.input(f"b{i}", layout_b, top_b.cell_index(), layout_b.layer(info))
+        tp.output(f"x{i}", diff, diff_top.cell_index(), diff.layer(info))
+        receivers[(layer, datatype)] = {k: AreaReceiver() for k in ("a", "b", "xor")}
+        for k, name in (("a", f"ra{i}"), ("b", f"rb{i}"), ("xor", f"rx{i}")):
+            tp.output(name, receivers[(layer, datatype)][k])
+        script.append(
+            f"var x{i}_ = a{i} ^ b{i}; _output(x{i}, x{i}_); "
+            f"_output(ra{i}, {area(f'a{i}')}); _output(rb{i}, {area(f'b{i}')}); "
+            f"_output(rx{i}, {area(f'x{i}_')})"
+        )
+    tp.queue("; ".join(script))
+    tp.execute("Layer XOR")
+
+    um2 = layout_a.dbu ** 2
+    areas = {
+        key: {k: r.area * um2 for k, r in rec.items()}
+        for key, rec in receivers.items()
+    }
+    return diff, areas
+
+
+def render(new_layout, diff_layout, output_image, width, height, oversampling, pdk_root, pdk):
+    """Render the new layout, lay2img-style, with the differences on top in
+    solid red. Small differences are marked so they still show up on a full
+    die image."""
+
+    lv = load_view(new_layout, pdk_root, pdk)
+    cv = lv.load_layout(diff_layout, True)
+
+    diff = lv.cellview(cv).layout()
+    for li in diff.layer_indexes():
+        if diff.top_cell().bbox_per_layer(li).empty():
+            continue
+        info = diff.get_info(li)
+        lp = lay.LayerPropertiesNode()
+        lp.source = f"{info.layer}/{info.datatype}@{cv + 1}"
+        lp.name = f"XOR {info.layer}/{info.datatype}"
+        lp.fill_color = 0xFF0000
+        lp.frame_color = 0xFF0000
+        lp.dither_pattern = 0
+        lp.width = 2
+        lp.marked = True
+        lv.insert_layer(lv.end_layers(), lp)
+
+    save_images(lv, output_image, width, height, oversampling)
+
+
+def main(args, pdk_root, pdk):
+
+    layout_a = db.Layout()
+    layout_a.read(args.old)
+    layout_b = db.Layout()
+    layout_b.read(args.new)
+
+    if args.layers:
+        layers = [parse_layer(l) for l in args.layers]
+    else:
+        layers = sorted(
+            set((i.layer, i.datatype) for ly in (layout_a, layout_b) for i in ly.layer_infos())
+        )
+
+    diff, areas = xor_layouts(layout_a, layout_b, layers, args.tile_size, args.threads)
+
+    print(f"{'Layer':<10} {'Old (um^2)':>14} {'New (um^2)':>14} {'XOR (um^2)':>14}")
+    changed = 0
+    for (layer, datatype), a in sorted(areas.items(), key=lambda x: -x[1]["xor"]):
+        if a["xor"] == 0 and not args.all:
+            continue
+        changed += a["xor"] > 0
+        print(f"{f'{layer}/{datatype}':<10} {a['a']:>14.3f} {a['b']:>14.3f} {a['xor']:>14.3f}")
+    print(f"{changed} of {len(layers)} layers differ")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {f"{l}/{d}": a for (l, d), a in sorted(areas.items())}, f, indent=2
+            )
+
+    if args.gds or args.image:
+        diff_gds = args.gds or os.path.splitext(args.image)[0] + "_xor.gds"
+        diff.write(diff_gds)
+        if args.image:
+            render(
+                args.new,
+                diff_gds,
+                args.image,
+                args.width,
+                args.height,
+                args.oversampling,
+                pdk_root,
+                pdk,
+            )
+
+    return changed
+
+
+if __name__ == "__main__":
+
+    pdk_root = os.getenv("PDK_ROOT", "gf180mcu")
+    pdk = os.getenv("PDK", "gf180mcuD")
+
+    parser = argparse.ArgumentParser(
+        prog="gds_xor", description="Per-layer XOR of two layouts."
+    )
+    parser.add_argument("old", help="old layout")
+    parser.add_argument("new", help="new layout")
+    parser.add_argument(
+        "--layers", nargs="+", help="layers to compare, as layer/datatype (default: all)"
+    )
+    parser.add_argument("--gds", help="output GDS of the differences")
+    parser.add_argument("--image", help="output image (differences over the new layout)")
+    parser.add_argument("--json", help="output per-layer areas as JSON")
+    parser.add_argument("--all", action="store_true", help="list unchanged layers too")
+    parser.add_argument(
+        "--tile-size", type=float, default=250, help="tile size in um"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=os.cpu_count(), help="worker threads"
+    )
+    parser.add_argument("--width", type=int, default=None, help="image width")
+    parser.add_argument("--height", type=int, default=None, help="image height")
+    parser.add_argument(
+        "--oversampling", type=int, default=1, help="oversampling factor"
+    )
+
+    args = parser.parse_args()
+
+    # Exit status is nonzero if anything differs, like diff
+    sys.exit(1 if main(args, pdk_root, pdk) else 0)
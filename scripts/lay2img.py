@@ -4,14 +4,35 @@
 import os
 import argparse
 import klayout.lay as lay
-import klayout.db as db
 
 
-def main(input_layout, output_image, width, height, oversampling, pdk_root, pdk):
-
-    # Background colors
-    background_white = "#FFFFFF"
-    background_black = "#000000"
+# Layers shown in the rendered image
+ENABLED_LAYERS = [
+    (22, 0),
+    (21, 0),
+    (204, 0),
+    (55, 0),
+    (30, 0),
+    (32, 0),
+    (31, 0),
+    (49, 0),
+    (33, 0),
+    (34, 0),
+    (35, 0),
+    (36, 0),
+    (38, 0),
+    (42, 0),
+    (40, 0),
+    (46, 0),
+    (41, 0),
+    (81, 0),
+    (37, 0),
+]
+
+
+def load_view(input_layout, pdk_root, pdk):
+    """Return a LayoutView of input_layout, with the PDK layer properties and
+    only the enabled layers visible."""
 
     lv = lay.LayoutView()
 
@@ -22,49 +43,39 @@ def main(input_layout, output_image, width, height, oversampling, pdk_root, pdk)
     lv.load_layout(input_layout, 0)
     lv.max_hier()
 
-    top_cell = lv.active_cellview().layout().top_cell()
-    top_bbox = top_cell.dbbox()
-    aspect_ratio = top_bbox.width() / top_bbox.height()
-
-    if not height and not width:
-        width = 1024
-
-    if not height:
-        height = int(width / aspect_ratio)
-
     # Load the layer properties
     lv.load_layer_props(
         os.path.join(pdk_root, pdk, "libs.tech", "klayout", "tech", "gf180mcu.lyp")
     )
 
     # Disable some layers
-    enabled_layers = [
-        (22, 0),
-        (21, 0),
-        (204, 0),
-        (55, 0),
-        (30, 0),
-        (32, 0),
-        (31, 0),
-        (49, 0),
-        (33, 0),
-        (34, 0),
-        (35, 0),
-        (36, 0),
-        (38, 0),
-        (42, 0),
-        (40, 0),
-        (46, 0),
-        (41, 0),
-        (81, 0),
-        (37, 0),
-    ]
     for lyp in lv.each_layer():
         layer_datatype = (lyp.source_layer, lyp.source_datatype)
 
-        if layer_datatype not in enabled_layers:
+        if layer_datatype not in ENABLED_LAYERS:
             lyp.visible = False
 
+    return lv
+
+
+def save_images(lv, output_image, width, height, oversampling):
+    """Save the view on white and black backgrounds, as <image>_white.png and
+    <image>_black.png."""
+
+    # Background colors
+    background_white = "#FFFFFF"
+    background_black = "#000000"
+
+    top_cell = lv.cellview(0).layout().top_cell()
+    top_bbox = top_cell.dbbox()
+    aspect_ratio = top_bbox.width() / top_bbox.height()
+
+    if not height and not width:
+        width = 1024
+
+    if not height:
+        height = int(width / aspect_ratio)
+
     # Save the images
     base_name = os.path.splitext(os.path.basename(output_image))[0]
     directory = os.path.dirname(output_image)
@@ -86,6 +97,12 @@ def main(input_layout, output_image, width, height, oversampling, pdk_root, pdk)
     )
 
 
+def main(input_layout, output_image, width, height, oversampling, pdk_root, pdk):
+
+    lv = load_view(input_layout, pdk_root, pdk)
+    save_images(lv, output_image, width, height, oversampling)
+
+
 if __name__ == "__main__":
 
     pdk_root = os.getenv("PDK_ROOT", "gf180mcu")
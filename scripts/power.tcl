@@ -0,0 +1,48 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Activity-annotated power analysis of the final netlist, for one workload.
+# Run by scripts/power_report.py as `openroad -exit power.tcl`, with:
+#
+#   POWER_LIBS     Liberty files (space-separated)
+#   POWER_NETLIST  Verilog netlist
+#   POWER_TOP      top module
+#   POWER_SDC      SDC (with the clocks, for their activity)
+#   POWER_SPEF     SPEF, or empty for no wire parasitics
+#   POWER_SAIF     SAIF activity for the workload
+#   POWER_SCOPE    scope of the design in the SAIF, e.g. tb/chip_u
+#   POWER_OUT      per-instance power output
+#
+# Nets without activity in the SAIF fall back to OpenSTA's default
+# propagated activity.
+
+foreach lib $::env(POWER_LIBS) {
+    read_liberty $lib
+}
+read_verilog $::env(POWER_NETLIST)
+link_design $::env(POWER_TOP)
+read_sdc $::env(POWER_SDC)
+if { $::env(POWER_SPEF) ne "" } {
+    read_spef $::env(POWER_SPEF)
+}
+
+read_saif -scope $::env(POWER_SCOPE) $::env(POWER_SAIF)
+report_activity_annotation
+report_power
+
+# One line per instance: name, name of the net on its first output (cells
+# created by synthesis have no hierarchy in their own name, but often drive
+# a named net), then internal, switching, leakage and total power (W)
+set corner [sta::cmd_corner]
+set f [open $::env(POWER_OUT) w]
+foreach inst [get_cells *] {
+    set net ""
+    foreach pin [get_pins -of_objects $inst -filter "direction == output"] {
+        set n [get_nets -quiet -of_objects $pin]
+        if { $n ne "" } {
+            set net [get_full_name $n]
+            break
+        }
+    }
+    puts $f "[get_full_name $inst]\t$net\t[join [sta::instance_power $inst $corner] \t]"
+}
+close $f
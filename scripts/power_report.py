@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+# SPDX-License-Identifier: Apache-2.0
+
+# Per-workload, per-block power from simulated switching activity.
+#
+# Takes the activity dump and capture windows written by the testbench
+# (ACTIVITY=1, test_power_activity in cocotb/chip_top_tb.py), converts each
+# workload's window to SAIF, and runs OpenROAD power analysis (power.tcl) on
+# the final netlist with that activity, one workload per process. Instance
+# powers are summed per block of the design hierarchy, down to --depth levels.
+#
+# Activity should come from a gate-level sim (GL=1 GL_NETLIST=nl): an RTL
+# dump only annotates the nets whose names survive synthesis, and everything
+# else falls back to default activity. The final netlist is flat, and cells
+# created by synthesis are attributed to a block by the name of the net they
+# drive; set SYNTH_AUTONAME for hierarchical names on every cell.
+
+import os
+import re
+import csv
+import glob
+import json
+import yaml
+import fnmatch
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from vcd2saif import convert, write_saif
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def liberty_files(config_path, pdk_root, pdk, scl, corner):
+    """Return the Liberty files for the standard cells, IO cells and macros
+    at corner, e.g. tt_025C_5v00."""
+    libs_ref = os.path.join(pdk_root, pdk, "libs.ref")
+    libs = sorted(glob.glob(os.path.join(libs_ref, scl, "lib", f"*{corner}.lib")))
+    libs += sorted(glob.glob(os.path.join(libs_ref, "gf180mcu_fd_io", "lib", f"*{corner}.lib")))
+
+    config_dir = os.path.dirname(os.path.abspath(config_path))
+    cfg = yaml.safe_load(open(config_path))
+    for macro in cfg.get("MACROS", {}).values():
+        # Keys are patterns over corner names, as in LibreLane
+        for pattern, paths in macro.get("lib", {}).items():
+            if not fnmatch.fnmatch(f"nom_{corner}", pattern):
+                continue
+            for p in paths:
+                if p.startswith("dir::"):
+                    p = os.path.join(config_dir, p[len("dir::"):])
+                elif p.startswith("pdk_dir::"):
+                    p = os.path.join(pdk_root, pdk, p[len("pdk_dir::"):])
+                libs.append(os.path.normpath(p))
+    return libs
+
+
+def block_of(inst, net, depth):
+    """Block (hierarchy prefix, up to depth levels) of an instance, from its
+    own name or else the name of the net it drives."""
+    for name in (inst, net):
+        parts = re.split(r"[./]", name)[:-1]
+        if parts:
+            return ".".join(parts[:depth])
+    return "(top)"
+
+
+def analyse(workload, saif, scope, libs, args, out_dir):
+    """Run power.tcl for one workload. Return {block: [internal, switching,
+    leakage, total]} in W."""
+    inst_path = os.path.join(out_dir, f"{workload}_inst.tsv")
+    env = dict(
+        os.environ,
+        POWER_LIBS=" ".join(libs),
+        POWER_NETLIST=args.netlist,
+        POWER_TOP=args.top,
+        POWER_SDC=args.sdc,
+        POWER_SPEF=args.spef or "",
+        POWER_SAIF=saif,
+        POWER_SCOPE=scope,
+        POWER_OUT=inst_path,
+    )
+    with open(os.path.join(out_dir, f"{workload}.log"), "w") as log:
+        rc = subprocess.run(
+            ["openroad", "-exit", "-no_splash", os.path.join(SCRIPT_DIR, "power.tcl")],
+            env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    if rc.returncode != 0:
+        raise RuntimeError(f"OpenROAD failed for {workload}, see {log.name}")
+
+    blocks = {}
+    with open(inst_path) as f:
+        for line in f:
+            inst, net, *power = line.rstrip("\n").split("\t")
+            b = blocks.setdefault(block_of(inst, net, args.depth), [0.0] * 4)
+            for i, p in enumerate(power):
+                b[i] += float(p)
+    return blocks
+
+
+def main(args):
+
+    PDK_ROOT = os.getenv("PDK_ROOT", os.path.expanduser("~/.ciel"))
+    PDK = os.getenv("PDK", "gf180mcuD")
+    SCL = os.getenv("SCL", "gf180mcu_fd_sc_mcu9t5v0")
+
+    out_dir = os.path.abspath(args.out)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with open(os.path.join(args.activity, "windows.jsonl")) as f:
+        windows = [json.loads(l) for l in f if l.strip()]
+    if not any(w["gl"] for w in windows):
+        print("Warning: RTL activity only annotates nets whose names survive synthesis")
+
+    dump = glob.glob(os.path.join(args.activity, "activity.*"))
+    assert len(dump) == 1, f"Expected one activity dump in {args.activity}"
+
+    saifs = {}
+
+    def on_window(i, vars, timescale, start, end):
+        assert i < len(windows), "More windows in the dump than in windows.jsonl"
+        workload = windows[i]["workload"]
+        saifs[workload] = os.path.join(out_dir, f"{workload}.saif")
+        write_saif(saifs[workload], vars, timescale, end - start)
+        print(f"{workload}: {saifs[workload]}")
+
+    n = convert(dump[0], on_window)
+    assert n == len(windows), f"{n} windows in the dump, {len(windows)} in windows.jsonl"
+
+    libs = liberty_files(args.config, PDK_ROOT, PDK, SCL, args.corner)
+    if args.spef is None:
+        print("Warning: no SPEF, switching power excludes wire capacitance")
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            w["workload"]: pool.submit(
+                analyse, w["workload"], saifs[w["workload"]], w["scope"].replace(".", "/"),
+                libs, args, out_dir,
+            )
+            for w in windows
+        }
+        results = {workload: f.result() for workload, f in futures.items()}
+
+    workloads = list(results)
+    blocks = sorted(
+        {b for r in results.values() for b in r},
+        key=lambda b: -max(results[w].get(b, [0] * 4)[3] for w in workloads),
+    )
+    totals = {w: [sum(p[i] for p in results[w].values()) for i in range(4)] for w in workloads}
+
+    table = os.path.join(out_dir, "power_blocks.csv")
+    with open(table, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["block", *(f"{w}_{k}_mw" for w in workloads
+            for k in ("internal", "switching", "leakage", "total"))])
+        for b in blocks:
+            writer.writerow([b, *(f"{p * 1e3:.6f}" for w in workloads
+                for p in results[w].get(b, [0] * 4))])
+    with open(os.path.join(out_dir, "power.json"), "w") as f:
+        json.dump({
+            "corner": args.corner,
+            "windows": windows,
+            "totals_mw": {w: dict(zip(("internal", "switching", "leakage", "total"),
+                (p * 1e3 for p in t))) for w, t in totals.items()},
+        }, f, indent=2)
+
+    width = max(len("Block"), *(len(b) for b in blocks))
+    print(f"{'Block':<{width}} " + " ".join(f"{w + ' (mW)':>14}" for w in workloads))
+    for b in blocks:
+        print(f"{b:<{width}} " + " ".join(f"{results[w].get(b, [0] * 4)[3] * 1e3:>14.3f}" for w in workloads))
+    print(f"{'Total':<{width}} " + " ".join(f"{totals[w][3] * 1e3:>14.3f}" for w in workloads))
+    print(f"{'of which switching':<{width}} " + " ".join(f"{totals[w][1] * 1e3:>14.3f}" for w in workloads))
+    print(f"Wrote {table}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Per-workload, per-block power from simulated activity")
+    parser.add_argument("--activity", default="cocotb/activity", help="testbench activity directory")
+    parser.add_argument("--config", default="librelane/config.yaml", help="path to config (for macro libs)")
+    parser.add_argument("--netlist", default="final/nl/chip_top.nl.v", help="netlist")
+    parser.add_argument("--top", default="chip_top", help="top module")
+    parser.add_argument("--sdc", default="final/sdc/chip_top.sdc", help="SDC")
+    parser.add_argument("--spef", default=(glob.glob("final/spef/nom*/*.spef") or [None])[0],
+        help="SPEF (default: nominal corner from final/)")
+    parser.add_argument("--corner", default="tt_025C_5v00", help="Liberty corner")
+    parser.add_argument("--depth", type=int, default=2, help="hierarchy levels per block")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="concurrent OpenROAD runs")
+    parser.add_argument("--out", default="power", help="output directory")
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+# SPDX-License-Identifier: Apache-2.0
+
+# Parallel parameter sweep over the full LibreLane flow.
+#
+# Takes a grid of config values (any config.yaml variable, dotted paths into
+# e.g. MACROS for macro positions, or sdc:VAR for a `set VAR ...` line in
+# chip_top.sdc, which is where the clk_sys frequency actually lives), and runs
+# every combination as an isolated LibreLane run in its own directory, a
+# bounded number at a time. Timing slack, area, wirelength and runtime of each
+# run are collected into one results table.
+#
+# Runs that can't be useful are stopped early: timing is assumed to get
+# monotonically harder with the clock, so once a configuration fails timing,
+# every configuration that only differs in having a faster clock is dropped
+# from the queue, or killed if already running. At the end, configurations
+# which are Pareto-dominated (slower clock, more area and more wirelength than
+# some other passing run) are marked as such.
+
+import os
+import re
+import csv
+import sys
+import glob
+import json
+import time
+import yaml
+import shutil
+import signal
+import argparse
+import itertools
+import subprocess
+
+# Direction in which each clock parameter makes timing harder. CLOCK_PERIOD
+# isn't one: chip_top.sdc defines the clocks itself.
+CLOCK_PARAMS = {
+    "sdc:CLK_SYS_MHZ": +1,
+}
+
+# Clock whose achievable frequency is estimated
+FMAX_CLOCK = "clk_sys"
+
+# Enough to get timing, area and wirelength, without sign-off checks
+DEFAULT_SKIP = ["KLayout.Antenna", "KLayout.DRC", "Magic.DRC", "Netgen.LVS", "KLayout.XOR"]
+
+METRICS = {
+    "setup_ws": "timing__setup__ws",
+    "setup_tns": "timing__setup__tns",
+    "hold_ws": "timing__hold__ws",
+    "area": "design__instance__area",
+    "wirelength": "route__wirelength",
+}
+
+
+def load_grid(grid_path, params):
+    """Return {name: [values]} from a YAML grid file and NAME=V1,V2,...
+    arguments (values are parsed as YAML)."""
+    grid = {}
+    if grid_path:
+        grid.update(yaml.safe_load(open(grid_path)))
+    for p in params:
+        name, values = p.split("=", 1)
+        grid[name] = [yaml.safe_load(v) for v in values.split(",")]
+    return grid
+
+
+def rebase_paths(value, src_dir, dst_dir):
+    """Rewrite dir:: paths in a config value so they still resolve from
+    dst_dir."""
+    if isinstance(value, dict):
+        return {k: rebase_paths(v, src_dir, dst_dir) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rebase_paths(v, src_dir, dst_dir) for v in value]
+    if isinstance(value, str) and value.startswith("dir::"):
+        path = os.path.join(src_dir, value[len("dir::"):].lstrip("/"))
+        return "dir::" + os.path.relpath(path, dst_dir)
+    return value
+
+
+def set_path(cfg, name, value):
+    """Set cfg[a][b][c] = value for name a.b.c."""
+    *parents, key = name.split(".")
+    for p in parents:
+        cfg = cfg.setdefault(p, {})
+    cfg[key] = value
+
+
+def write_config(config_path, sdc_path, run_dir, point):
+    """Write the config (and SDC, if any sdc: parameters are set) for one grid
+    point to run_dir. Return the config path."""
+    src_dir = os.path.dirname(os.path.abspath(config_path))
+    os.makedirs(run_dir, exist_ok=True)
+
+    cfg = rebase_paths(yaml.safe_load(open(config_path)), src_dir, run_dir)
+
+    sdc_vars = {k[len("sdc:"):]: v for k, v in point.items() if k.startswith("sdc:")}
+    if sdc_vars:
+        with open(sdc_path) as f:
+            sdc = f.read()
+        for var, value in sdc_vars.items():
+            sdc, n = re.subn(rf"^set\s+{re.escape(var)}\s+.*$", f"set {var} {value}", sdc, flags=re.M)
+            if n == 0:
+                raise ValueError(f"no `set {var}` in {sdc_path}")
+        with open(os.path.join(run_dir, os.path.basename(sdc_path)), "w") as f:
+            f.write(sdc)
+        for key in ("PNR_SDC_FILE", "SIGNOFF_SDC_FILE", "FALLBACK_SDC"):
+            cfg[key] = f"dir::{os.path.basename(sdc_path)}"
+
+    for name, value in point.items():
+        if not name.startswith("sdc:"):
+            set_path(cfg, name, value)
+
+    out_path = os.path.join(run_dir, "config.yaml")
+    with open(out_path, "w") as f:
+        yaml.safe_dump(cfg, f, sort_keys=False)
+    return out_path
+
+
+def read_metrics(run_dir):
+    """Return the metrics of the final state of a run, or of the last step
+    that completed if the flow didn't finish."""
+    final = os.path.join(run_dir, "final", "metrics.json")
+    if os.path.exists(final):
+        return json.load(open(final))
+    steps = sorted(
+        (d for d in os.listdir(run_dir) if re.match(r"\d+-", d)),
+        key=lambda d: int(d.split("-", 1)[0]),
+    ) if os.path.isdir(run_dir) else []
+    for d in reversed(steps):
+        state = os.path.join(run_dir, d, "state_out.json")
+        if os.path.exists(state):
+            return json.load(open(state)).get("metrics", {})
+    return {}
+
+
+def clock_setup_ws(run_dir, clock=FMAX_CLOCK):
+    """Worst setup slack (ns) of the paths captured by clock, over every
+    corner of the run's last STA step, from the paths in its max.rpt
+    reports. None if there are none."""
+    steps = [d for d in glob.glob(os.path.join(run_dir, "*-openroad-sta*"))
+        if re.match(r"\d+-", os.path.basename(d))]
+    if not steps:
+        return None
+    step = max(steps, key=lambda d: int(os.path.basename(d).split("-", 1)[0]))
+    ws = None
+    for report in glob.glob(os.path.join(step, "**", "max.rpt"), recursive=True):
+        endpoint_clock = None
+        for line in open(report):
+            m = re.match(r"Endpoint: .*clocked by (\S+?)\)", line)
+            if m:
+                endpoint_clock = m.group(1)
+            m = re.match(r"\s*(-?[\d.]+)\s+slack \(", line)
+            if m and endpoint_clock == clock:
+                ws = float(m.group(1)) if ws is None else min(ws, float(m.group(1)))
+                endpoint_clock = None
+    return ws
+
+
+def harder(a, b, clock):
+    """True if grid point b only differs from a in having a faster clock."""
+    if any(a[k] != b[k] for k in a if k != clock):
+        return False
+    return (b[clock] - a[clock]) * CLOCK_PARAMS[clock] > 0
+
+
+def dominates(a, b):
+    """True if result a is at least as good as b on clock, area and
+    wirelength, and better on one of them."""
+    ka = (-a["fmax_mhz"], a["area"], a["wirelength"])
+    kb = (-b["fmax_mhz"], b["area"], b["wirelength"])
+    return all(x <= y for x, y in zip(ka, kb)) and ka != kb
+
+
+def fmax_mhz(point, clk_ws, sdc_path):
+    """Estimate the fastest clk_sys (MHz) the run would close at, from its
+    target and the worst setup slack of clk_sys paths."""
+    mhz = point.get("sdc:CLK_SYS_MHZ")
+    if mhz is None:
+        m = re.search(r"^set\s+CLK_SYS_MHZ\s+(\S+)", open(sdc_path).read(), re.M)
+        mhz = float(m.group(1))
+    return 1000.0 / (1000.0 / mhz - clk_ws)
+
+
+def kill(proc):
+    """Stop a run and the tools it started, which share its session."""
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+
+def main(args):
+
+    PDK_ROOT = os.getenv("PDK_ROOT", os.path.expanduser("~/.ciel"))
+    PDK = os.getenv("PDK", "gf180mcuD")
+
+    print(f"PDK_ROOT = {PDK_ROOT}")
+    print(f"PDK = {PDK}")
+
+    grid = load_grid(args.grid, args.param)
+    assert grid, "Empty grid: give --grid and/or --param"
+    names = list(grid)
+    points = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    clock = next((k for k in CLOCK_PARAMS if k in grid), None)
+    if clock is not None:
+        # Easiest clock first, so failures prune as much of the queue as
+        # possible
+        points.sort(key=lambda p: p[clock] * CLOCK_PARAMS[clock])
+
+    out_dir = os.path.abspath(args.out)
+    sdc_path = os.path.join(os.path.dirname(os.path.abspath(args.config)), "chip_top.sdc")
+    skip = [a for s in args.skip for a in ("--skip", s)]
+
+    queue = list(enumerate(points))
+    running = {}
+    results = {}
+    print(f"{len(points)} configurations, {args.jobs} at a time")
+
+    def prune(failed):
+        """Drop or kill configurations known to fail because failed did."""
+        if clock is None or args.no_prune:
+            return
+        for i, p in list(queue):
+            if harder(failed, p, clock):
+                queue.remove((i, p))
+                results[i] = {"status": "pruned"}
+        for i, (proc, p, t0) in list(running.items()):
+            if harder(failed, p, clock):
+                kill(proc)
+                del running[i]
+                results[i] = {"status": "pruned", "runtime_s": time.monotonic() - t0}
+
+    try:
+        while queue or running:
+            while queue and len(running) < args.jobs:
+                i, p = queue.pop(0)
+                cfg_dir = os.path.join(out_dir, f"cfg{i:03d}")
+                if os.path.exists(cfg_dir):
+                    shutil.rmtree(cfg_dir)
+                cfg_path = write_config(args.config, sdc_path, cfg_dir, p)
+                log = open(os.path.join(cfg_dir, "flow.log"), "w")
+                proc = subprocess.Popen(
+                    ["librelane", cfg_path, "--pdk", PDK, "--pdk-root", PDK_ROOT,
+                     "--manual-pdk", "--run-tag", "sweep", "--overwrite", *skip],
+                    stdout=log, stderr=subprocess.STDOUT, start_new_session=True,
+                )
+                running[i] = (proc, p, time.monotonic())
+                print(f"cfg{i:03d} started: {p}")
+
+            time.sleep(args.poll)
+
+            for i, (proc, p, t0) in list(running.items()):
+                # May have been pruned by an earlier result in this pass
+                if i not in running or proc.poll() is None:
+                    continue
+                del running[i]
+                run_dir = os.path.join(out_dir, f"cfg{i:03d}", "runs", "sweep")
+                metrics = read_metrics(run_dir)
+                r = {k: metrics.get(v) for k, v in METRICS.items()}
+                r["clk_sys_ws"] = clock_setup_ws(run_dir)
+                r["runtime_s"] = time.monotonic() - t0
+                met = r["setup_ws"] is not None and r["setup_ws"] >= 0 and (r["hold_ws"] or 0) >= 0
+                if proc.returncode == 0 and met:
+                    r["status"] = "pass"
+                elif r["setup_ws"] is not None and not met:
+                    r["status"] = "fail"
+                else:
+                    r["status"] = "error"
+                if r["clk_sys_ws"] is not None:
+                    r["fmax_mhz"] = fmax_mhz(p, r["clk_sys_ws"], sdc_path)
+                results[i] = r
+                print(f"cfg{i:03d} {r['status']} in {r['runtime_s']:.0f} s")
+                if r["status"] == "fail":
+                    prune(p)
+    finally:
+        for proc, p, t0 in running.values():
+            kill(proc)
+
+    passed = [r for r in results.values() if r["status"] == "pass"
+        and r["wirelength"] is not None and r.get("fmax_mhz") is not None]
+    for r in passed:
+        r["pareto"] = not any(dominates(o, r) for o in passed if o is not r)
+
+    columns = ["status", "fmax_mhz", "clk_sys_ws", *METRICS, "runtime_s", "pareto"]
+    rows = [
+        {"config": f"cfg{i:03d}", **points[i], **{c: results[i].get(c) for c in columns}}
+        for i in sorted(results)
+    ]
+    os.makedirs(out_dir, exist_ok=True)
+    table = os.path.join(out_dir, "results.csv")
+    with open(table, "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=["config", *names, *columns])
+        w.writeheader()
+        w.writerows(rows)
+
+    def fmt(v):
+        if v is None:
+            return "-"
+        return f"{v:.3f}" if isinstance(v, float) else str(v)
+
+    header = ["config", *names, *columns]
+    widths = [max(len(h), *(len(fmt(r[h])) for r in rows)) for h in header]
+    print(" ".join(h.rjust(w) for h, w in zip(header, widths)))
+    for r in rows:
+        print(" ".join(fmt(r[h]).rjust(w) for h, w in zip(header, widths)))
+    print(f"Wrote {table}")
+
+    if passed:
+        best = max(passed, key=lambda r: r["fmax_mhz"])
+        i = next(i for i, r in results.items() if r is best)
+        print(f"Fastest passing: cfg{i:03d} {points[i]} ({best['fmax_mhz']:.2f} MHz)")
+
+    return any(r["status"] == "error" for r in results.values())
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Parallel LibreLane parameter sweep")
+    parser.add_argument("config", help="path to config")
+    parser.add_argument("--grid", help="YAML file of {parameter: [values]}")
+    parser.add_argument("--param", action="append", default=[],
+        help="NAME=V1,V2,... values to sweep (repeatable)")
+    parser.add_argument("--jobs", type=int, default=2, help="concurrent runs")
+    parser.add_argument("--skip", nargs="*", default=DEFAULT_SKIP, help="LibreLane steps to skip")
+    parser.add_argument("--no-prune", action="store_true",
+        help="run every configuration, even after an easier clock failed")
+    parser.add_argument("--poll", type=float, default=10, help="seconds between status checks")
+    parser.add_argument("--out", default="librelane/sweep", help="output directory")
+
+    args = parser.parse_args()
+
+    sys.exit(1 if main(args) else 0)
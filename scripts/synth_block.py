@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# SPDX-License-Identifier: Apache-2.0
+
+# Synthesise one module of the design to a flat, unpowered gate-level netlist,
+# for mixed RTL/gate-level simulation (GL_BLOCKS in cocotb/chip_top_tb.py).
+# Runs the same LibreLane Yosys synthesis step, with the same settings, as
+# the full flow, but with the block as the top level.
+#
+# A netlist has no parameters, so the block is synthesised with the values
+# given by --param (which should match its instantiation), and those
+# parameters are declared in the netlist, unused, so that the RTL parent can
+# still override them.
+
+import os
+import re
+import sys
+import yaml
+import argparse
+
+from typing import List, Type
+
+from librelane.state import DesignFormat
+from librelane.flows.sequential import SequentialFlow
+from librelane.steps import (
+    Checker,
+    Yosys,
+    Step,
+)
+from librelane.flows.flow import FlowError
+
+
+class BlockSynthFlow(SequentialFlow):
+
+    Steps: List[Type[Step]] = [
+        Yosys.JsonHeader,
+        Yosys.Synthesis,
+        Checker.YosysUnmappedCells,
+    ]
+
+
+def declare_params(netlist, block, params):
+    """Declare params (NAME=VALUE) after the module header of block."""
+    header = re.search(rf"^module\s+{re.escape(block)}\s*\(.*?\);\n", netlist, re.M | re.S)
+    if header is None:
+        raise ValueError(f"module {block} not found in netlist")
+    decls = "".join(f"  parameter {p.split('=', 1)[0]} = {p.split('=', 1)[1]};\n" for p in params)
+    return netlist[:header.end()] + decls + netlist[header.end():]
+
+
+def main(config_path, block, params, clock, out_dir):
+
+    PDK_ROOT = os.getenv("PDK_ROOT", os.path.expanduser("~/.ciel"))
+    PDK = os.getenv("PDK", "gf180mcuD")
+
+    print(f"PDK_ROOT = {PDK_ROOT}")
+    print(f"PDK = {PDK}")
+
+    flow_cfg = yaml.safe_load(open(config_path))
+    flow_cfg.pop("meta", None)
+    flow_cfg["DESIGN_NAME"] = block
+    flow_cfg["CLOCK_PORT"] = clock
+    flow_cfg.pop("CLOCK_NET", None)
+    flow_cfg["SYNTH_HIERARCHY_MODE"] = "flatten"
+    flow_cfg["SYNTH_PARAMETERS"] = params
+
+    flow = BlockSynthFlow(
+        flow_cfg,
+        design_dir=os.path.dirname(config_path),
+        pdk_root=PDK_ROOT,
+        pdk=PDK,
+    )
+
+    try:
+        state = flow.start(tag=f"synth_block_{block}", overwrite=True)
+    except FlowError as e:
+        print(f"Error: \n{e}")
+        sys.exit(1)
+
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, f"{block}.v")
+    with open(state[DesignFormat.NETLIST]) as f:
+        netlist = f.read()
+    with open(out_path, "w") as f:
+        f.write(declare_params(netlist, block, params))
+
+    print(f"Wrote {out_path}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Synthesise a block for mixed RTL/GL simulation")
+    parser.add_argument("config", help="path to config")
+    parser.add_argument("block", help="module name")
+    parser.add_argument("--param", action="append", default=[],
+        help="NAME=VALUE parameter to synthesise with (repeatable)")
+    parser.add_argument("--clock", default="clk", help="clock port of the block")
+    parser.add_argument("--out", default="cocotb/gl_blocks", help="output directory")
+
+    args = parser.parse_args()
+
+    main(args.config, args.block, args.param, args.clock, args.out)
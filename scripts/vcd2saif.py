@@ -0,0 +1,282 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Convert a VCD to SAIF switching activity, one SAIF per dump window.
+#
+# The testbench's activity dump (ACTIVITY=1 in cocotb/chip_top_tb.py) is one
+# VCD with a $dumpon/$dumpoff section per workload. The VCD is streamed once,
+# and for each section the time spent at 0, 1 and X (T0, T1, TX) and the
+# number of 0/1 transitions (TC) of every bit are accumulated, and written out
+# as SAIF when the section ends. Value changes at the start of a section are
+# the dump's initial values, not toggles. A VCD without $dumpon/$dumpoff is a
+# single window. FST dumps are read through fst2vcd.
+
+import os
+import re
+import sys
+import argparse
+import datetime
+import subprocess
+
+VAR_TYPES = {"wire", "reg", "logic", "bit", "tri", "supply0", "supply1"}
+
+
+class Var:
+    """One VCD identifier code: its bits' names (MSB first) and statistics."""
+
+    __slots__ = ("bits", "value", "t0", "t1", "tx", "tc")
+
+    def __init__(self, width):
+        self.bits = []
+        self.value = "x" * width
+        self.reset()
+
+    def reset(self):
+        n = len(self.value)
+        self.t0 = [0] * n
+        self.t1 = [0] * n
+        self.tx = [0] * n
+        self.tc = [0] * n
+
+
+def bit_names(name, width):
+    """Names of the bits of a $var, MSB first, e.g. ("data", 2, "[1:0]") gives
+    data[1], data[0]."""
+    m = re.match(r"^(.*?)\s*\[(-?\d+):(-?\d+)\]$", name)
+    if m is None:
+        if width == 1:
+            return [name]
+        return [f"{name}[{i}]" for i in reversed(range(width))]
+    base, msb, lsb = m.group(1), int(m.group(2)), int(m.group(3))
+    step = -1 if msb >= lsb else 1
+    return [f"{base}[{i}]" for i in range(msb, lsb + step, step)]
+
+
+def extend(value, width):
+    """Left-extend a VCD vector value to width bits."""
+    if len(value) >= width:
+        return value[len(value) - width:]
+    pad = value[0] if value[0] in "xz" else "0"
+    return pad * (width - len(value)) + value
+
+
+def saif_name(name):
+    """Escape everything but identifier characters, SAIF-style."""
+    return re.sub(r"([^A-Za-z0-9_])", r"\\\1", name)
+
+
+def write_saif(path, vars, timescale, duration, program="vcd2saif.py"):
+    """Write the statistics of vars as a SAIF file, with one INSTANCE per VCD
+    scope."""
+    tree = {}
+    for var in vars:
+        for i, (scope, name) in enumerate(var.bits):
+            node = tree
+            for s in scope:
+                node = node.setdefault(s, {})
+            node.setdefault(None, []).append((name, var.t0[i], var.t1[i], var.tx[i], var.tc[i]))
+
+    with open(path, "w") as f:
+        f.write("(SAIFILE\n")
+        f.write('(SAIFVERSION "2.0")\n')
+        f.write('(DIRECTION "backward")\n')
+        f.write('(DESIGN )\n')
+        f.write(f'(DATE "{datetime.datetime.now().isoformat(timespec="seconds")}")\n')
+        f.write('(VENDOR "")\n')
+        f.write(f'(PROGRAM_NAME "{program}")\n')
+        f.write('(VERSION "1.0")\n')
+        f.write("(DIVIDER / )\n")
+        f.write(f"(TIMESCALE {timescale})\n")
+        f.write(f"(DURATION {duration})\n")
+
+        def write_node(node, name, indent):
+            f.write(f"{indent}(INSTANCE {saif_name(name)}\n")
+            nets = node.get(None, [])
+            if nets:
+                f.write(f"{indent}  (NET\n")
+                for net, t0, t1, tx, tc in nets:
+                    f.write(f"{indent}    ({saif_name(net)} (T0 {t0}) (T1 {t1}) (TX {tx}) (TC {tc}) (IG 0))\n")
+                f.write(f"{indent}  )\n")
+            for child, sub in node.items():
+                if child is not None:
+                    write_node(sub, child, indent + "  ")
+            f.write(f"{indent})\n")
+
+        for name, node in tree.items():
+            if name is not None:
+                write_node(node, name, "")
+        f.write(")\n")
+
+
+def open_dump(path):
+    """Return a line iterator over a VCD, converting FST on the fly."""
+    if path.endswith(".fst"):
+        proc = subprocess.Popen(["fst2vcd", path], stdout=subprocess.PIPE, text=True)
+        return proc.stdout
+    return open(path)
+
+
+def convert(dump_path, on_window):
+    """Stream a VCD (or FST) and call on_window(index, vars, timescale, start,
+    end) at the end of each dump window, times in timescale units. Return the
+    number of windows."""
+    vars = {}
+    scope = []
+    timescale = "1 ns"
+    header = True
+    tokens = []
+    now = 0
+    # Time of the last change of each Var is tracked per window
+    last = {}
+    window_start = None
+    n_windows = 0
+    # Inside a $dumpvars/$dumpon/$dumpoff block, values are not toggles
+    initial = False
+    dumping = False
+
+    def close_window():
+        nonlocal window_start, n_windows
+        if window_start is None:
+            return
+        for code, var in vars.items():
+            settle(var, last[code])
+        if now > window_start:
+            on_window(n_windows, vars.values(), timescale, window_start, now)
+            n_windows += 1
+        window_start = None
+
+    def settle(var, since):
+        """Add the time since the last change to the var's current value."""
+        dt = now - since
+        if dt <= 0:
+            return
+        for i, b in enumerate(var.value):
+            if b == "0":
+                var.t0[i] += dt
+            elif b == "1":
+                var.t1[i] += dt
+            else:
+                var.tx[i] += dt
+
+    def open_window():
+        nonlocal window_start
+        window_start = now
+        for code, var in vars.items():
+            var.reset()
+            last[code] = now
+
+    def change(code, value):
+        var = vars.get(code)
+        if var is None:
+            return
+        value = extend(value, len(var.value)) if len(value) != len(var.value) else value
+        if window_start is not None and not initial:
+            old = var.value
+            if len(old) == 1:
+                # Most of a gate-level dump, so done inline
+                dt = now - last[code]
+                if old == "0":
+                    var.t0[0] += dt
+                    var.tc[0] += value == "1"
+                elif old == "1":
+                    var.t1[0] += dt
+                    var.tc[0] += value == "0"
+                else:
+                    var.tx[0] += dt
+            else:
+                settle(var, last[code])
+                for i, (a, b) in enumerate(zip(old, value)):
+                    if a != b and a in "01" and b in "01":
+                        var.tc[i] += 1
+        last[code] = now
+        var.value = value
+
+    for line in open_dump(dump_path):
+        if header:
+            tokens.extend(line.split())
+            while "$end" in tokens:
+                i = tokens.index("$end")
+                cmd, args = tokens[0], tokens[1:i]
+                tokens = tokens[i + 1:]
+                if cmd == "$timescale":
+                    m = re.match(r"(\d+)\s*([a-z]+)", "".join(args))
+                    timescale = f"{m.group(1)} {m.group(2)}"
+                elif cmd == "$scope":
+                    scope.append(args[1].lstrip("\\"))
+                elif cmd == "$upscope":
+                    scope.pop()
+                elif cmd == "$var" and args[0] in VAR_TYPES:
+                    width, code, name = int(args[1]), args[2], " ".join(args[3:])
+                    if code not in vars:
+                        vars[code] = Var(width)
+                    vars[code].bits.extend((tuple(scope), b) for b in bit_names(name.lstrip("\\"), width))
+                elif cmd == "$enddefinitions":
+                    header = False
+                    for code in vars:
+                        last[code] = 0
+                    break
+            continue
+
+        line = line.strip()
+        if not line:
+            continue
+        c = line[0]
+        if c == "#":
+            now = int(line[1:])
+            continue
+        if c in "01xXzZ":
+            change(line[1:], line[0].lower())
+        elif c in "bB":
+            value, code = line[1:].split()
+            change(code, value.lower())
+        elif c in "rR":
+            continue
+        elif line.startswith("$dumpvars"):
+            initial = True
+            # A plain VCD is one window, from its initial values
+            open_window()
+            dumping = True
+        elif line.startswith("$dumpon"):
+            initial = True
+            open_window()
+            dumping = True
+        elif line.startswith("$dumpoff"):
+            initial = True
+            close_window()
+            dumping = False
+        elif line.startswith("$end"):
+            initial = False
+
+    if dumping:
+        close_window()
+    return n_windows
+
+
+def main(args):
+
+    names = args.names or []
+
+    def on_window(i, vars, timescale, start, end):
+        name = names[i] if i < len(names) else f"window{i}"
+        path = os.path.join(args.out, f"{name}.saif")
+        write_saif(path, vars, timescale, end - start)
+        print(f"{path}: {start} to {end} ({timescale})")
+
+    os.makedirs(args.out, exist_ok=True)
+    n = convert(args.dump, on_window)
+    if names and n != len(names):
+        print(f"Warning: {n} windows in dump, {len(names)} names given")
+    return n
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="vcd2saif", description="Convert each window of a VCD to SAIF."
+    )
+    parser.add_argument("dump", help="input VCD or FST")
+    parser.add_argument("--names", nargs="+", help="name of each window's SAIF (default: window<n>)")
+    parser.add_argument("--out", default=".", help="output directory")
+
+    args = parser.parse_args()
+
+    sys.exit(0 if main(args) else 1)
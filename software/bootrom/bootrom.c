@@ -6,7 +6,16 @@
 #include "spi_stream.h"
 
 #define SECTOR_SIZE_BYTES 4096
+
+// These can be overridden to build variant ROMs for benchmarking (see
+// cocotb/boot_bench.py). The taped-out ROM uses the defaults.
+#ifndef BINARY_SIZE_BYTES
 #define BINARY_SIZE_BYTES 1024
+#endif
+
+#ifndef SPI_CLKDIV
+#define SPI_CLKDIV 8
+#endif
 
 static void spi_init() {
 	gpio_hw->fsel_set =
@@ -14,8 +23,8 @@ static void spi_init() {
 		1u << GPIO_SPI_SCK |
 		1u << GPIO_SPI_CSN |
 		1u << GPIO_SPI_IO1;
-	// -> 3 MHz at 24 MHz clk_sys
-	spi_stream_set_clkdiv(8);
+	// -> 3 MHz at 24 MHz clk_sys, by default
+	spi_stream_set_clkdiv(SPI_CLKDIV);
 }
 
 static uint32_t checksum_adler32(const uint8_t *buf, size_t len) {
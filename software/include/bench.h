@@ -0,0 +1,194 @@
+#ifndef _BENCH_H
+#define _BENCH_H
+
+// CPU benchmark kernels, shared between the ERAM and IRAM builds of
+// bench_cpu. Each kernel is bracketed by bench_mark() calls, which execute an
+// uncompressed ebreak with the kernel ID in a0. The testbench sets
+// dcsr.ebreakm, so each mark enters Debug mode, and the testbench counts the
+// cycles for which the hart ran between marks, then resumes after the ebreak.
+//
+// Kernel IDs must match BENCH_CPU_KERNELS in cocotb/chip_top_tb.py.
+
+#include <stdint.h>
+#include <string.h>
+
+#include "addressmap.h"
+#include "hazard3_csr.h"
+#include "apu/ipc.h"
+#include "vuart.h"
+
+// Empty kernel: measures the cost of the marks themselves, which the
+// testbench subtracts from the other kernels.
+#define BENCH_KERNEL_NONE         0
+#define BENCH_KERNEL_CRC16        1
+#define BENCH_KERNEL_MATMUL       2
+#define BENCH_KERNEL_SORT         3
+#define BENCH_KERNEL_STATE        4
+#define BENCH_KERNEL_MEMCPY_ERAM  5
+#define BENCH_KERNEL_MEMCPY_IRAM  6
+#define BENCH_KERNEL_MEMCPY_E2I   7
+#define BENCH_KERNEL_MEMSET_ERAM  8
+#define BENCH_KERNEL_MEMSET_IRAM  9
+#define BENCH_KERNEL_SOFTIRQ      10
+
+#define BENCH_MARK_END (1u << 8)
+#define BENCH_MARK_DONE 0xffu
+
+// Memory kernel buffers are at fixed addresses, so both builds touch the same
+// memories. The IRAM buffers sit between the IRAM build's .bss and its stack.
+#define BENCH_ERAM_BUF0 ((uint8_t*)(ERAM_BASE + 0x20000))
+#define BENCH_ERAM_BUF1 ((uint8_t*)(ERAM_BASE + 0x21000))
+#define BENCH_IRAM_BUF0 ((uint8_t*)(IRAM_BASE + 0x1400))
+#define BENCH_IRAM_BUF1 ((uint8_t*)(IRAM_BASE + 0x1600))
+#define BENCH_MEMCPY_SIZE 512
+
+#define BENCH_SOFTIRQ_COUNT 32
+
+static inline void bench_mark(uint32_t id) {
+	register uint32_t a0 asm("a0") = id;
+	// Always 32-bit, so the testbench can step over it with dpc += 4
+	asm volatile (".option push\n.option norvc\nebreak\n.option pop" : : "r" (a0) : "memory");
+}
+
+// ----------------------------------------------------------------------------
+// Integer kernels, loosely after CoreMark's list/matrix/state kernels
+
+static uint16_t bench_crc16(const uint8_t *data, int len) {
+	uint16_t crc = 0xffff;
+	for (int i = 0; i < len; ++i) {
+		crc ^= (uint16_t)data[i] << 8;
+		for (int j = 0; j < 8; ++j) {
+			crc = crc & 0x8000 ? (crc << 1) ^ 0x1021 : crc << 1;
+		}
+	}
+	return crc;
+}
+
+#define BENCH_MAT_N 8
+static int16_t bench_mat_a[BENCH_MAT_N][BENCH_MAT_N];
+static int16_t bench_mat_b[BENCH_MAT_N][BENCH_MAT_N];
+static int32_t bench_mat_c[BENCH_MAT_N][BENCH_MAT_N];
+
+static uint32_t bench_matmul(void) {
+	uint32_t sum = 0;
+	for (int i = 0; i < BENCH_MAT_N; ++i) {
+		for (int j = 0; j < BENCH_MAT_N; ++j) {
+			int32_t acc = 0;
+			for (int k = 0; k < BENCH_MAT_N; ++k) {
+				acc += (int32_t)bench_mat_a[i][k] * bench_mat_b[k][j];
+			}
+			bench_mat_c[i][j] = acc;
+			sum += acc;
+		}
+	}
+	return sum;
+}
+
+#define BENCH_SORT_N 64
+static int32_t bench_sort_buf[BENCH_SORT_N];
+
+static uint32_t bench_sort(void) {
+	for (int i = 1; i < BENCH_SORT_N; ++i) {
+		int32_t x = bench_sort_buf[i];
+		int j = i - 1;
+		while (j >= 0 && bench_sort_buf[j] > x) {
+			bench_sort_buf[j + 1] = bench_sort_buf[j];
+			--j;
+		}
+		bench_sort_buf[j + 1] = x;
+	}
+	return bench_sort_buf[0] ^ bench_sort_buf[BENCH_SORT_N - 1];
+}
+
+// Classify the characters of a numeric string, like CoreMark's core_state
+static uint32_t bench_state(const char *s) {
+	enum {START, INT, FLOAT, EXP, INVALID} state = START;
+	uint32_t transitions = 0;
+	for (; *s; ++s) {
+		char c = *s;
+		int prev = state;
+		if (c == ',') {
+			state = START;
+		} else if (c >= '0' && c <= '9') {
+			state = state == START ? INT : state;
+		} else if (c == '.') {
+			state = state == INT ? FLOAT : INVALID;
+		} else if (c == 'e' || c == 'E') {
+			state = state == FLOAT || state == INT ? EXP : INVALID;
+		} else if (c != '-' && c != '+') {
+			state = INVALID;
+		}
+		transitions += prev != (int)state;
+	}
+	return transitions;
+}
+
+static const char bench_state_input[] =
+	"5012,1.234,-874,+122,7.,-.6,4.4e7,9e-3,0.0,--1,8.8.8,1e,5012,1.234,-874,"
+	"+122,7.,-.6,4.4e7,9e-3,0.0,--1,8.8.8,1e,a1,3.14159,2.71828,-0.5,1e10,99";
+
+// ----------------------------------------------------------------------------
+// Interrupt kernel: post a soft IRQ to this hart, repeatedly
+
+static volatile uint32_t bench_softirq_count;
+
+void __attribute__((interrupt)) isr_machine_softirq(void) {
+	softirq_clear_current_core();
+	++bench_softirq_count;
+}
+
+static void bench_softirq(void) {
+	bench_softirq_count = 0;
+	set_csr(mie, 0x8);
+	for (int i = 0; i < BENCH_SOFTIRQ_COUNT; ++i) {
+		apu_ipc_hw->softirq_set = 1u << read_csr(mhartid);
+		while (bench_softirq_count == (uint32_t)i)
+			;
+	}
+	clear_csr(mie, 0x8);
+}
+
+// ----------------------------------------------------------------------------
+
+#define BENCH(id, stmt) do { \
+	bench_mark(id); \
+	stmt; \
+	bench_mark((id) | BENCH_MARK_END); \
+} while (0)
+
+// Run all kernels, print a checksum of their results (so they can't be
+// optimised away, and so a broken kernel is noticed) and finish.
+static inline void bench_run_all(void) {
+	uint32_t check = 0;
+	for (int i = 0; i < BENCH_MAT_N * BENCH_MAT_N; ++i) {
+		bench_mat_a[i / BENCH_MAT_N][i % BENCH_MAT_N] = i * 3 - 17;
+		bench_mat_b[i / BENCH_MAT_N][i % BENCH_MAT_N] = 100 - i * 5;
+	}
+	for (int i = 0; i < BENCH_SORT_N; ++i) {
+		bench_sort_buf[i] = (i * 2654435761u) >> 7;
+	}
+	for (int i = 0; i < BENCH_MEMCPY_SIZE; ++i) {
+		BENCH_ERAM_BUF0[i] = i;
+		BENCH_IRAM_BUF0[i] = ~i;
+	}
+
+	BENCH(BENCH_KERNEL_NONE, (void)0);
+	BENCH(BENCH_KERNEL_CRC16, check += bench_crc16((const uint8_t*)bench_state_input, sizeof(bench_state_input)));
+	BENCH(BENCH_KERNEL_MATMUL, check += bench_matmul());
+	BENCH(BENCH_KERNEL_SORT, check += bench_sort());
+	BENCH(BENCH_KERNEL_STATE, check += bench_state(bench_state_input));
+	BENCH(BENCH_KERNEL_MEMCPY_ERAM, memcpy(BENCH_ERAM_BUF1, BENCH_ERAM_BUF0, BENCH_MEMCPY_SIZE));
+	BENCH(BENCH_KERNEL_MEMCPY_IRAM, memcpy(BENCH_IRAM_BUF1, BENCH_IRAM_BUF0, BENCH_MEMCPY_SIZE));
+	BENCH(BENCH_KERNEL_MEMCPY_E2I, memcpy(BENCH_IRAM_BUF1, BENCH_ERAM_BUF0, BENCH_MEMCPY_SIZE));
+	BENCH(BENCH_KERNEL_MEMSET_ERAM, memset(BENCH_ERAM_BUF1, 0xa5, BENCH_MEMCPY_SIZE));
+	BENCH(BENCH_KERNEL_MEMSET_IRAM, memset(BENCH_IRAM_BUF1, 0x5a, BENCH_MEMCPY_SIZE));
+	BENCH(BENCH_KERNEL_SOFTIRQ, bench_softirq());
+	check += BENCH_ERAM_BUF1[3] + BENCH_IRAM_BUF1[5] + bench_softirq_count;
+
+	bench_mark(BENCH_MARK_DONE);
+	vuart_puts("Check ");
+	vuart_puthex32(check);
+	vuart_putc('\n');
+}
+
+#endif
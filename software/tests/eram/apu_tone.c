@@ -0,0 +1,27 @@
+#include "apu.h"
+#include "gpio.h"
+
+// Play a 1 kHz sine at -6 dBFS, forever, for audio capture in the testbench
+// (test_audio_capture in cocotb/chip_top_tb.py). At the nominal 48 kSa/s one
+// period is exactly 48 samples.
+
+static const int16_t sine_1khz[48] = {
+	0, 2139, 4240, 6270, 8192, 9974, 11585, 12998,
+	14189, 15137, 15826, 16244, 16384, 16244, 15826, 15137,
+	14189, 12998, 11585, 9974, 8192, 6270, 4240, 2139,
+	0, -2139, -4240, -6270, -8192, -9974, -11585, -12998,
+	-14189, -15137, -15826, -16244, -16384, -16244, -15826, -15137,
+	-14189, -12998, -11585, -9974, -8192, -6270, -4240, -2139,
+};
+
+int main() {
+	gpio_set_alternate(GPIO_AUDIO, true);
+	// Signed samples are centred on midrail, so no need for the (slow) ramp
+	apu_aout_set_signed(true);
+	apu_aout_start();
+	while (true) {
+		for (int i = 0; i < 48; ++i) {
+			apu_aout_put_blocking(sine_1khz[i], sine_1khz[i]);
+		}
+	}
+}
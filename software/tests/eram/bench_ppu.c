@@ -0,0 +1,112 @@
+#include <string.h>
+
+#include "vuart.h"
+#include "gpio.h"
+#include "dispctrl.h"
+#include "ppu.h"
+
+// PPU scanline throughput benchmark. Renders a synthetic scene described by a
+// table which the testbench loads into ERAM before starting the CPU (see
+// test_benchmark_ppu in cocotb/chip_top_tb.py). The scene is rendered twice:
+//
+// - First frame with scanout disabled. The testbench releases each scanline
+//   buffer as soon as it is presented, so the interval between buffers is the
+//   PPU's own render time per line.
+// - Second frame scanned out to the display as normal, which gives the
+//   display's line budget and any underruns.
+//
+// Optionally the CPU hammers ERAM with memcpy() during both frames, to
+// measure stalls on the PPU's memory port.
+//
+// Table layout, one word per entry:
+//   width, height, n_sprites, n_tile_layers, cpu_contention
+
+#define BENCH_PPU_SCENE_ADDR 0x30000
+
+#define MAX_SPRITES     64
+#define MAX_TILE_LAYERS 4
+
+#define SPRITE_SIZE     16
+#define TILE_SIZE       8
+#define TILEMAP_W       16
+#define N_TILES         16
+
+#define CONTENTION_BUF0 ((uint32_t*)(ERAM_BASE + 0x20000))
+#define CONTENTION_BUF1 ((uint32_t*)(ERAM_BASE + 0x21000))
+#define CONTENTION_SIZE 1024
+
+// PPU image base addresses must be 32-bit aligned
+static uint32_t sprite[SPRITE_SIZE * SPRITE_SIZE / 2];
+static uint32_t tileset[N_TILES * TILE_SIZE * TILE_SIZE / 4];
+static uint32_t tilemap[TILEMAP_W * TILEMAP_W / 4];
+
+ppu_instr_t prog[16 + 2 * MAX_SPRITES + 3 * MAX_TILE_LAYERS];
+
+static void render_frame(bool contention) {
+	cproc_put_pc(&prog[0]);
+	ppu_start(true);
+	while (ppu_is_running()) {
+		if (contention) {
+			memcpy(CONTENTION_BUF1, CONTENTION_BUF0, CONTENTION_SIZE);
+		}
+	}
+}
+
+int main() {
+	const volatile uint32_t *scene = (const volatile uint32_t*)BENCH_PPU_SCENE_ADDR;
+	uint32_t width = scene[0];
+	uint32_t height = scene[1];
+	uint32_t n_sprites = scene[2];
+	uint32_t n_tile_layers = scene[3];
+	bool contention = scene[4];
+	if (n_sprites > MAX_SPRITES) {
+		n_sprites = MAX_SPRITES;
+	}
+	if (n_tile_layers > MAX_TILE_LAYERS) {
+		n_tile_layers = MAX_TILE_LAYERS;
+	}
+
+	// Opaque, non-uniform image data, so nothing can be skipped as transparent
+	for (unsigned int i = 0; i < sizeof(sprite) / sizeof(sprite[0]); ++i) {
+		sprite[i] = 0x80008000u | (i * 0x00370041u);
+	}
+	for (unsigned int i = 0; i < sizeof(tileset) / sizeof(tileset[0]); ++i) {
+		tileset[i] = 0x01010101u | (i * 0x04030201u);
+	}
+	for (unsigned int i = 0; i < sizeof(tilemap) / sizeof(tilemap[0]); ++i) {
+		tilemap[i] = 0x03020100u + (i & 0x3u) * 0x04040404u;
+	}
+
+	gpio_hw->fsel_set = 0xffu << GPIO_LCD_DAT0;
+	dispctrl_set_parallel_mode(true);
+	dispctrl_set_half_rate(false);
+	dispctrl_set_shift_width(16);
+	dispctrl_set_scanbuf_size(width);
+	dispctrl_force_dc_cs(1, 0);
+
+	// Every object covers every line (all lines are within the first
+	// SPRITE_SIZE rows) so the per-line cost is the same throughout.
+	vuart_puts("Generating PPU program\n");
+	ppu_instr_t *p = &prog[0];
+	p += cproc_clip(p, 0, width - 1);
+	p += cproc_fill(p, 0, 0, 16);
+	for (uint32_t i = 0; i < n_tile_layers; ++i) {
+		p += cproc_tile(p, -(int)(3 * i), 0, 0, 0, PPU_FORMAT_PAL8, 0, tileset, tilemap);
+	}
+	for (uint32_t i = 0; i < n_sprites; ++i) {
+		p += cproc_blit(p, (i * width / (n_sprites + 1)) & 0x3ffu, 0, PPU_SIZE_16, 0, PPU_FORMAT_ARGB1555, sprite);
+	}
+	p += cproc_sync(p);
+	p += cproc_jump(p, &prog[0]);
+	ppu_set_display_w_h(width, height);
+
+	vuart_puts("Frame 0: scanout disabled\n");
+	render_frame(contention);
+
+	vuart_puts("Frame 1: scanout enabled\n");
+	dispctrl_set_scan_enabled(true);
+	render_frame(contention);
+	dispctrl_wait_idle();
+
+	vuart_puts("!TPASS");
+}
@@ -0,0 +1,103 @@
+#include "vuart.h"
+#include "ppu.h"
+#include "apu.h"
+
+// Randomised memory traffic for bus contention stress testing. This program
+// doesn't contain any traffic itself: it executes a table of operations which
+// the testbench loads into ERAM before starting the CPU (see
+// cocotb/bus_stress.py for the generator).
+//
+// Table layout, one word per entry:
+//   n_cpu_ops
+//   flags
+//   n_apu_words
+//   APU program (n_apu_words words, copied to the start of APU RAM)
+//   CPU ops (2 words each: control, data)
+//
+// Control word: bits 23:0 address, bits 25:24 log2 size, bit 26 read.
+//
+// Every region is zeroed before the traffic starts. Reads are folded into a
+// checksum which is printed at the end, and the testbench checks the final
+// memory contents.
+
+#define STRESS_TABLE_ADDR  0x30000
+
+#define STRESS_FLAG_PPU    (1u << 0)
+#define STRESS_FLAG_APU    (1u << 1)
+
+#define STRESS_OP_ADDR_MASK 0xffffffu
+#define STRESS_OP_SIZE_LSB  24
+#define STRESS_OP_READ      (1u << 26)
+
+static const struct {
+	uintptr_t base;
+	uint32_t size;
+} regions[] = {
+	{ERAM_BASE + 0x20000, 0x400},
+	{IRAM_BASE, 0x400},
+	{APU_RAM_BASE + 0x400, 0x400},
+};
+
+ppu_instr_t program[64];
+
+int main() {
+	const volatile uint32_t *table = (const volatile uint32_t*)STRESS_TABLE_ADDR;
+	uint32_t n_cpu_ops = table[0];
+	uint32_t flags = table[1];
+	uint32_t n_apu_words = table[2];
+	const volatile uint32_t *apu_prog = &table[3];
+	const volatile uint32_t *ops = &table[3 + n_apu_words];
+
+	for (unsigned int i = 0; i < sizeof(regions) / sizeof(regions[0]); ++i) {
+		for (uint32_t j = 0; j < regions[i].size; j += 4) {
+			*(volatile uint32_t*)(regions[i].base + j) = 0;
+		}
+	}
+
+	if (flags & STRESS_FLAG_PPU) {
+		// Infinite loop in the command processor: ERAM fetch traffic
+		ppu_instr_t *p = &program[0];
+		p += cproc_jump(p, &program[0]);
+		cproc_put_pc(&program[0]);
+		ppu_start(false);
+	}
+
+	if (flags & STRESS_FLAG_APU) {
+		for (uint32_t i = 0; i < n_apu_words; ++i) {
+			((volatile uint32_t*)APU_RAM_BASE)[i] = apu_prog[i];
+		}
+		start_apu();
+	}
+
+	uint32_t checksum = 0;
+	for (uint32_t i = 0; i < n_cpu_ops; ++i) {
+		uint32_t ctrl = ops[2 * i];
+		uint32_t data = ops[2 * i + 1];
+		uintptr_t addr = ctrl & STRESS_OP_ADDR_MASK;
+		bool read = ctrl & STRESS_OP_READ;
+		switch ((ctrl >> STRESS_OP_SIZE_LSB) & 0x3) {
+		case 0:
+			if (read) data = *(volatile uint8_t*)addr; else *(volatile uint8_t*)addr = data;
+			break;
+		case 1:
+			if (read) data = *(volatile uint16_t*)addr; else *(volatile uint16_t*)addr = data;
+			break;
+		default:
+			if (read) data = *(volatile uint32_t*)addr; else *(volatile uint32_t*)addr = data;
+			break;
+		}
+		if (read) {
+			checksum = ((checksum << 1) | (checksum >> 31)) ^ data;
+		}
+	}
+
+	if (flags & STRESS_FLAG_APU) {
+		// APU program posts a soft IRQ to the CPU when it finishes
+		while (!softirq_status())
+			;
+	}
+
+	vuart_puts("Checksum ");
+	vuart_puthex32(checksum);
+	vuart_puts("\n!TPASS");
+}
@@ -0,0 +1,172 @@
+#include "apu.h"
+#include "irq.h"
+#include "ppu.h"
+#include "hw/apu_timer_regs.h"
+
+// Interrupt sources for the latency harness (test_irq_latency in
+// cocotb/chip_top_tb.py). The testbench writes the config word to
+// IRQ_LATENCY_CONFIG_ADDR before starting the CPU, and times each IRQ itself,
+// from the IRQ signal rising to the first instruction fetches of the trap
+// vector and handler on each hart. This program only raises the IRQs and
+// generates the background load, forever, and prints nothing.
+//
+// Config word:
+//   bits 1:0 source:
+//     IRQ_LATENCY_SOFTIRQ:   the CPU posts a soft IRQ to the APU, whose
+//                            handler posts one straight back
+//     IRQ_LATENCY_TIMER_CPU: periodic APU timer IRQ, taken by the CPU
+//     IRQ_LATENCY_TIMER_APU: periodic APU timer IRQ, taken by the APU
+//   bit 8 load: the PPU command processor spins on ERAM fetches, and the CPU
+//     copies between ERAM, IRAM and APU RAM instead of sleeping
+
+#define IRQ_LATENCY_CONFIG_ADDR 0x30000
+
+#define IRQ_LATENCY_SOFTIRQ   0
+#define IRQ_LATENCY_TIMER_CPU 1
+#define IRQ_LATENCY_TIMER_APU 2
+#define IRQ_LATENCY_SRC_MASK  0x3u
+#define IRQ_LATENCY_LOAD      (1u << 8)
+
+// 1 us ticks, 20 us period
+#define TIMER_TICK   (24 - 1)
+#define TIMER_RELOAD (20 - 1)
+
+#define LOAD_ERAM_BUF ((uint8_t*)(ERAM_BASE + 0x20000))
+#define LOAD_IRAM_BUF ((uint8_t*)(IRAM_BASE + 0x0000))
+#define LOAD_ARAM_BUF ((uint8_t*)(APU_RAM_BASE + 0x400))
+#define LOAD_SIZE     256
+
+// Last word of APU RAM: mie for the APU program
+#define APU_CONFIG_ADDR (APU_RAM_END - 4)
+
+#define apu_timer_hw ((apu_timer_hw_t *)APU_TIMER_BASE)
+
+#define STR_(x) #x
+#define STR(x) STR_(x)
+
+// APU program, copied to the start of APU RAM (address 0 for the APU). It is
+// position-independent, and needs no stack: the main loop only sleeps, so the
+// handler (direct mode, all traps) is free to clobber t0 and t1. APU
+// addresses alias modulo 64k, so the CPU-side addresses are used as-is.
+asm (
+	".section .text.apu_irq_prog, \"ax\"\n"
+	".global apu_irq_prog\n"
+	".global apu_irq_handler\n"
+	".global apu_irq_prog_end\n"
+	".p2align 2\n"
+	"apu_irq_prog:\n"
+	"	lla t0, apu_irq_handler\n"
+	"	csrw mtvec, t0\n"
+	"	li t0, " STR(APU_CONFIG_ADDR) "\n"
+	"	lw t0, (t0)\n"
+	"	csrw mie, t0\n"
+	"	csrsi mstatus, 0x8\n"
+	"1:\n"
+	"	wfi\n"
+	"	j 1b\n"
+	".p2align 2\n"
+	"apu_irq_handler:\n"
+	"	csrr t0, mcause\n"
+	"	andi t0, t0, 0xf\n"
+	"	li t1, 7\n"
+	"	beq t0, t1, 2f\n"
+	// Soft IRQ: clear the APU's, and post one to the CPU
+	"	li t0, " STR(APU_IPC_BASE) "\n"
+	"	li t1, 2\n"
+	"	sw t1, 8(t0)\n"
+	"	li t1, 1\n"
+	"	sw t1, 4(t0)\n"
+	"	mret\n"
+	// Timer: clear the timer IRQ flags
+	"2:\n"
+	"	li t0, " STR(APU_TIMER_BASE) "\n"
+	"	lw t1, (t0)\n"
+	"	sw t1, (t0)\n"
+	"	mret\n"
+	"apu_irq_prog_end:\n"
+	".text\n"
+);
+
+extern const uint8_t apu_irq_prog[];
+extern const uint8_t apu_irq_prog_end[];
+
+static volatile uint32_t softirq_count;
+
+void __attribute__((interrupt)) isr_machine_softirq(void) {
+	softirq_clear_current_core();
+	++softirq_count;
+}
+
+void isr_apu_timer(void) {
+	apu_timer_hw->csr = apu_timer_hw->csr;
+}
+
+static void load_step(void) {
+	memcpy(LOAD_IRAM_BUF, LOAD_ERAM_BUF, LOAD_SIZE);
+	memcpy(LOAD_ARAM_BUF, LOAD_IRAM_BUF, LOAD_SIZE);
+	memcpy(LOAD_ERAM_BUF, LOAD_ARAM_BUF, LOAD_SIZE);
+}
+
+// Sleep until an IRQ has been taken. IRQs are masked across the wfi so a
+// reply arriving just before it can't be missed, so the idle soft IRQ latency
+// includes re-enabling them.
+static void idle_step(void) {
+	global_irq_enable(false);
+	asm volatile ("wfi");
+	global_irq_enable(true);
+}
+
+ppu_instr_t program[4];
+
+int main() {
+	uint32_t config = *(const volatile uint32_t*)IRQ_LATENCY_CONFIG_ADDR;
+	uint32_t source = config & IRQ_LATENCY_SRC_MASK;
+	bool load = config & IRQ_LATENCY_LOAD;
+
+	*(volatile uint32_t*)APU_CONFIG_ADDR =
+		source == IRQ_LATENCY_SOFTIRQ ? 0x8 :
+		source == IRQ_LATENCY_TIMER_APU ? 0x80 : 0;
+	load_apu_ram(apu_irq_prog, apu_irq_prog_end - apu_irq_prog);
+	start_apu();
+
+	if (load) {
+		// Infinite loop in the command processor: ERAM fetch traffic
+		ppu_instr_t *p = &program[0];
+		p += cproc_jump(p, &program[0]);
+		cproc_put_pc(&program[0]);
+		ppu_start(false);
+	}
+
+	if (source == IRQ_LATENCY_SOFTIRQ) {
+		soft_irq_enable(true);
+		while (true) {
+			uint32_t count = softirq_count;
+			apu_ipc_hw->softirq_set = 1u << 1;
+			while (softirq_count == count) {
+				if (load) {
+					load_step();
+				} else {
+					idle_step();
+				}
+			}
+		}
+	}
+
+	if (source == IRQ_LATENCY_TIMER_CPU) {
+		irq_set_enabled(IRQ_APU_TIMER, true);
+	}
+	apu_timer_hw->tick = TIMER_TICK;
+	apu_timer_hw->reload0 = TIMER_RELOAD;
+	apu_timer_hw->ctr0 = TIMER_RELOAD;
+	apu_timer_hw->csr =
+		APU_TIMER_CSR_IRQ_MASK |
+		(1u << APU_TIMER_CSR_RELOAD_LSB) |
+		(1u << APU_TIMER_CSR_EN_LSB);
+	while (true) {
+		if (load) {
+			load_step();
+		} else {
+			asm volatile ("wfi");
+		}
+	}
+}
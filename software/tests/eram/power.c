@@ -0,0 +1,97 @@
+#include "apu.h"
+#include "gpio.h"
+#include "dispctrl.h"
+#include "ppu.h"
+
+// Workloads for switching activity capture (test_power_activity in
+// cocotb/chip_top_tb.py). The testbench writes the workload number to
+// POWER_WORKLOAD_ADDR before starting the CPU. Every workload runs forever and
+// prints nothing, so the debug port is quiet during the capture window.
+
+#define POWER_WORKLOAD_ADDR 0x30000
+
+#define POWER_IDLE   0
+#define POWER_RENDER 1
+#define POWER_AUDIO  2
+
+// Render: same scene as the "mixed" PPU benchmark, scanned out continuously
+#define WIDTH           320
+#define HEIGHT          16
+#define N_SPRITES       16
+#define N_TILE_LAYERS   2
+
+#define SPRITE_SIZE     16
+#define TILE_SIZE       8
+#define TILEMAP_W       16
+#define N_TILES         16
+
+static uint32_t sprite[SPRITE_SIZE * SPRITE_SIZE / 2];
+static uint32_t tileset[N_TILES * TILE_SIZE * TILE_SIZE / 4];
+static uint32_t tilemap[TILEMAP_W * TILEMAP_W / 4];
+
+ppu_instr_t prog[16 + 2 * N_SPRITES + 3 * N_TILE_LAYERS];
+
+static void render(void) {
+	for (unsigned int i = 0; i < sizeof(sprite) / sizeof(sprite[0]); ++i) {
+		sprite[i] = 0x80008000u | (i * 0x00370041u);
+	}
+	for (unsigned int i = 0; i < sizeof(tileset) / sizeof(tileset[0]); ++i) {
+		tileset[i] = 0x01010101u | (i * 0x04030201u);
+	}
+	for (unsigned int i = 0; i < sizeof(tilemap) / sizeof(tilemap[0]); ++i) {
+		tilemap[i] = 0x03020100u + (i & 0x3u) * 0x04040404u;
+	}
+
+	gpio_hw->fsel_set = 0xffu << GPIO_LCD_DAT0;
+	dispctrl_set_parallel_mode(true);
+	dispctrl_set_half_rate(false);
+	dispctrl_set_shift_width(16);
+	dispctrl_set_scanbuf_size(WIDTH);
+	dispctrl_force_dc_cs(1, 0);
+
+	ppu_instr_t *p = &prog[0];
+	p += cproc_clip(p, 0, WIDTH - 1);
+	p += cproc_fill(p, 0, 0, 16);
+	for (uint32_t i = 0; i < N_TILE_LAYERS; ++i) {
+		p += cproc_tile(p, -(int)(3 * i), 0, 0, 0, PPU_FORMAT_PAL8, 0, tileset, tilemap);
+	}
+	for (uint32_t i = 0; i < N_SPRITES; ++i) {
+		p += cproc_blit(p, (i * WIDTH / (N_SPRITES + 1)) & 0x3ffu, 0, PPU_SIZE_16, 0, PPU_FORMAT_ARGB1555, sprite);
+	}
+	p += cproc_sync(p);
+	p += cproc_jump(p, &prog[0]);
+	ppu_set_display_w_h(WIDTH, HEIGHT);
+
+	dispctrl_set_scan_enabled(true);
+	while (true) {
+		cproc_put_pc(&prog[0]);
+		ppu_start(true);
+		while (ppu_is_running())
+			;
+	}
+}
+
+static void audio(void) {
+	gpio_set_alternate(GPIO_AUDIO, true);
+	apu_aout_set_signed(true);
+	apu_aout_start();
+	// 1 kHz triangle at -6 dBFS
+	while (true) {
+		for (int i = 0; i < 48; ++i) {
+			int16_t s = (i < 24 ? i : 48 - i) * 1365 - 16384;
+			apu_aout_put_blocking(s, s);
+		}
+	}
+}
+
+int main() {
+	uint32_t workload = *(const volatile uint32_t*)POWER_WORKLOAD_ADDR;
+	if (workload == POWER_RENDER) {
+		render();
+	} else if (workload == POWER_AUDIO) {
+		audio();
+	}
+	while (true) {
+		asm volatile ("wfi");
+	}
+}
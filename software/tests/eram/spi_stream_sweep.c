@@ -0,0 +1,66 @@
+#include "vuart.h"
+#include "spi_stream.h"
+#include "gpio.h"
+#include "delay.h"
+
+// spi_stream throughput sweep. Executes a list of runs which the testbench
+// loads into ERAM before starting the CPU (see test_spi_stream_sweep in
+// cocotb/chip_top_tb.py), and the testbench measures each run on the SPI
+// pins. Runs are separated by a quiet period of SWEEP_RUN_GAP_US with chip
+// select deasserted, which the testbench uses to tell them apart, so pauses
+// within a run must be shorter than this.
+//
+// Table layout, one word per entry:
+//   n_runs
+//   runs (5 words each: clkdiv, n_words, consumer_delay_us, pause_every,
+//         pause_us)
+//
+// All runs read from flash address 0. The sum of all words read is printed
+// at the end.
+
+#define SWEEP_TABLE_ADDR 0x30000
+#define SWEEP_RUN_GAP_US 100
+
+int main() {
+	const volatile uint32_t *table = (const volatile uint32_t*)SWEEP_TABLE_ADDR;
+	uint32_t n_runs = table[0];
+
+	gpio_set_alternate(GPIO_SPI_IO0, true);
+	gpio_set_alternate(GPIO_SPI_SCK, true);
+	gpio_set_alternate(GPIO_SPI_CSN, true);
+	gpio_set_alternate(GPIO_SPI_IO1, true);
+
+	uint32_t sum = 0;
+	for (uint32_t run = 0; run < n_runs; ++run) {
+		const volatile uint32_t *r = &table[1 + 5 * run];
+		uint32_t clkdiv = r[0];
+		uint32_t n_words = r[1];
+		uint32_t consumer_delay_us = r[2];
+		uint32_t pause_every = r[3];
+		uint32_t pause_us = r[4];
+
+		delay_us(SWEEP_RUN_GAP_US);
+		spi_stream_set_clkdiv(clkdiv);
+		spi_stream_start(0, n_words);
+		for (uint32_t i = 0; i < n_words; ++i) {
+			if (pause_every && i && i % pause_every == 0) {
+				spi_stream_pause();
+				delay_us(pause_us);
+				spi_stream_unpause();
+			}
+			sum += spi_stream_get_blocking();
+			if (consumer_delay_us) {
+				delay_us(consumer_delay_us);
+			}
+		}
+		if (!spi_stream_is_finished()) {
+			vuart_puts("Not finished after reading all words\n!TFAIL");
+		}
+		spi_stream_clear_finished();
+	}
+	delay_us(SWEEP_RUN_GAP_US);
+
+	vuart_puts("Sum ");
+	vuart_puthex32(sum);
+	vuart_puts("\n!TPASS");
+}
@@ -0,0 +1,9 @@
+#include "bench.h"
+
+// CPU benchmark kernels, timed by the testbench (test_benchmark_cpu), which
+// counts the cycles between bench_mark()s. Not a pass/fail test.
+
+int main() {
+	bench_run_all();
+	vuart_puts("!TPASS");
+}